@@ -2,24 +2,56 @@ import json
 import os
 import asyncio
 import time
-import chromadb
-from chromadb.utils import embedding_functions
 from openai import OpenAI
-import shutil # <--- 新增
-import glob   # <--- 新增
+import shutil
 from datetime import datetime # <--- 必须加这一行！
 import re  # 用于字数统计的正则表达式
 
 import networkx as nx
 
 import hashlib
+import threading
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 # Token 计费模块
-from novel_modules.billing import get_billing_service, record_api_call, estimate_and_record, record_tokens
+from novel_modules.billing import get_billing_service, record_api_call, estimate_and_record, record_tokens, tag_calls
 
 # 伏笔追踪模块
 from novel_modules.foreshadowing import ForeshadowManager
 
+# 章节字数统计缓存
+from novel_modules.word_stats import ChapterStatsCache
+
+# 项目存储后端（JSON / SQLite）
+from novel_modules.storage import open_project_store
+from novel_modules.doc_cache import DocumentCache, thaw_json
+from novel_modules.paragraphs import ParagraphSequence
+
+# 全文检索倒排索引
+from novel_modules.search_index import NgramIndex
+
+# 章节历史快照
+from novel_modules.snapshots import SnapshotStore
+
+# 增量备份
+from novel_modules.backup import BackupEngine, lower_thread_priority
+
+# 书架清单
+from novel_modules.library import get_library_manifest, make_summary, sort_books
+
+# 进程内共享的向量服务（Chroma 客户端 + 嵌入模型）
+from novel_modules.vector_service import get_vector_service, collection_name, lexical_index_path
+# 段落对齐的 RAG 切片
+from novel_modules.chunker import chunk_paragraphs, text_to_simple_paragraphs
+# 异步 LLM 客户端（共享连接池）
+from novel_modules.llm_client import get_async_client as get_shared_async_client
+# 分层剧情摘要（章节 -> 分卷 -> 全书）
+from novel_modules.summary_tree import SummaryTree, source_hash
+# 持久化的后台索引队列
+from novel_modules.ingest_queue import IngestQueue
+
 
 def count_words(text):
     """
@@ -81,7 +113,7 @@ class WorldGraph:
         
         # 1. 加载人物数据 (现有格式)
         # char: {'name': '叶凡', 'relations': [{'target': '黑皇', 'type': '损友'}]}
-        chars = self.manager.load_characters()
+        chars = self.manager.view_doc('characters')
         for c in chars:
             # 添加人物节点
             self.G.add_node(c['name'], type='character', desc=c.get('bio', '')[:50])
@@ -94,7 +126,7 @@ class WorldGraph:
 
         # 2. 加载地点数据 (现有格式)
         # loc: {'name': '紫山', 'neighbors': ['矿区'], 'parent': '北域'}
-        locs = self.manager.load_locations()
+        locs = self.manager.view_doc('locations')
         for l in locs:
             # 添加地点节点
             self.G.add_node(l['name'], type='location', desc=l.get('desc', '')[:50])
@@ -109,7 +141,7 @@ class WorldGraph:
 
         # 3. 加载物品数据 (现有格式) -> 关联到持有者
         # item: {'name': '万物母气鼎', 'owner': '叶凡'}
-        items = self.manager.load_items()
+        items = self.manager.view_doc('items')
         for i in items:
             self.G.add_node(i['name'], type='item', desc=i.get('desc', '')[:50])
             if i.get('owner'):
@@ -211,6 +243,7 @@ DEFAULT_PROMPTS = {
     "auditor_system": "你是一个世界观数据库管理员。你的任务是分析小说正文，提取状态变更。你需要敏锐地捕捉隐性信息（例如：'他断了一臂' -> 状态: 重伤/残疾）。\n\n请严格按以下 JSON 结构输出（不要使用 Markdown 代码块）：\n{\"char_updates\": [...], \"item_updates\": [...], \"new_chars\": [...], \"new_items\": [...], \"new_locs\": [...], \"relation_updates\": [...]}",
     "summary_chapter_system": "你是一个专业的网文编辑，擅长提炼剧情精华。请将给定的小说章节压缩成 150 字以内的摘要。要求：\n1. 保留核心冲突和结果。\n2. 记录关键道具或人物的获得/损失。\n3. 记录重要的伏笔。\n不要写流水账，要写干货。",
     "summary_book_system": "你是一个资深主编，拥有宏观的上帝视角。请根据各章节的摘要，梳理出整本书目前的剧情脉络（Story Arc）。要求：\n1. 串联主要故事线，忽略支线细枝末节。\n2. 明确主角目前的处境、目标和成长阶段。\n3. 篇幅控制在 500 字左右，适合快速回顾。",
+    "summary_volume_system": "你是一个专业的网文编辑。请根据本卷各章节的摘要，概括这一卷的剧情。要求：\n1. 交代本卷的主线冲突、关键转折和结局。\n2. 记录本卷埋下或回收的重要伏笔，以及人物关系、实力、道具的重要变化。\n3. 篇幅控制在 300 字以内。",
     "inspiration_assistant_system": "你是一个网文灵感助手。请只返回请求的内容，不要废话。"
 }
 
@@ -468,6 +501,13 @@ def get_client():
         client = OpenAI(api_key=api_key, base_url=CFG.get('base_url'))
     return client
 
+def get_async_client():
+    """获取当前事件循环共享的异步客户端（连接池大小见配置 llm_max_connections）"""
+    api_key = CFG.get('api_key')
+    if not api_key:
+        raise ValueError("未配置 API Key，请在系统配置中设置")
+    return get_shared_async_client(api_key, CFG.get('base_url'), CFG.get('llm_max_connections'))
+
 # 【新增】保存配置并热重载
 def save_global_config(new_config):
     global CFG, client
@@ -489,22 +529,65 @@ def save_global_config(new_config):
 
 # 1. 新增：书架管理器
 class LibraryManager:
+    # 书架每页显示的书籍数
+    PAGE_SIZE = 24
+
     def __init__(self):
         # 所有小说默认存放在 'projects' 文件夹下
         self.base_dir = CFG.get('project_base_dir', 'projects') # 建议读配置，无配置则默认为 'projects'
         if not os.path.exists(self.base_dir): os.makedirs(self.base_dir)
+        # 书架清单：各书保存时更新自己的条目，列书架时不必打开项目
+        self.manifest = get_library_manifest(self.base_dir)
 
-    def list_books(self):
-        """列出所有项目"""
-        books = []
+    def list_books(self, sort_by="last_modified", reverse=None, keyword=""):
+        """
+        列出所有项目及其书架元数据（只读清单，不打开项目）
+        清单中缺失的书（旧版本创建或从外部拷入）在首次列出时补建条目
+        返回: [{"name", "word_count", "chapter_count", "volume_count",
+                "last_modified", "summary", "vector_count"}, ...]，默认最近修改的在前
+        """
         if not os.path.exists(self.base_dir): return []
-        
-        for name in os.listdir(self.base_dir):
-            path = os.path.join(self.base_dir, name)
-            if os.path.isdir(path):
-                # 简单列出文件夹名作为书名
-                books.append({"name": name})
-        return books
+
+        names = [entry.name for entry in os.scandir(self.base_dir) if entry.is_dir()]
+        entries = self.manifest.entries()
+        for name in names:
+            if name not in entries:
+                entries[name] = self.refresh_book(name)
+        # 目录已在外部删除的书从清单中移除
+        self.manifest.prune(names)
+
+        books = [dict(entries[name], name=name) for name in names]
+        if keyword:
+            books = [b for b in books if keyword in b['name'] or keyword in b.get('summary', '')]
+        return sort_books(books, sort_by, reverse)
+
+    def page_books(self, page=1, page_size=None, sort_by="last_modified", reverse=None, keyword=""):
+        """
+        分页列出书籍
+        返回: {"books": 当前页书籍, "total": 总数, "page": 页码(从1开始), "pages": 总页数}
+        """
+        books = self.list_books(sort_by, reverse, keyword)
+        page_size = page_size or self.PAGE_SIZE
+        pages = max(1, (len(books) + page_size - 1) // page_size)
+        page = min(max(1, page), pages)
+        return {
+            "books": books[(page - 1) * page_size: page * page_size],
+            "total": len(books),
+            "page": page,
+            "pages": pages
+        }
+
+    def refresh_book(self, book_name):
+        """打开项目重新统计书架条目（清单缺失或需要校正时使用），返回条目"""
+        path = os.path.join(self.base_dir, book_name)
+        # 只打开看起来是项目的目录，避免在无关目录中生成项目文件
+        if not any(os.path.exists(os.path.join(path, f)) for f in ("structure.json", "project.db")):
+            return {}
+        try:
+            NovelManager(project_root=path).flush_library_entry()
+        except Exception as e:
+            print(f"[Library] 统计《{book_name}》失败: {e}")
+        return self.manifest.get(book_name) or {}
 
     def create_book(self, book_name):
         """创建新书结构"""
@@ -527,6 +610,7 @@ class LibraryManager:
             # 这里我们临时实例化一个 NovelManager 来帮我们生成文件结构
             # 注意：这里传入 project_root 让 Manager 知道去哪里初始化
             temp_mgr = NovelManager(project_root=path)
+            temp_mgr.flush_library_entry()
 
             return True, safe_name
         except Exception as e:
@@ -555,6 +639,7 @@ class LibraryManager:
         try:
             # 4. 执行重命名
             os.rename(old_path, new_path)
+            self.manifest.rename(old_name, safe_new_name)
             
             # 【重要】如果这正是当前打开的书，也需要更新全局配置里的记录
             # 这部分逻辑通常在 UI 层处理状态，但在这里我们只负责文件系统
@@ -573,24 +658,12 @@ class LibraryManager:
 
         try:
             # 2. 删除物理文件夹
-            import shutil # 再次确保导入
             shutil.rmtree(book_path)
+            self.manifest.remove(book_name)
             
-            # 3. 删除向量数据库
-            try:
-                import hashlib
-                hash_object = hashlib.md5(book_name.encode('utf-8'))
-                hex_dig = hash_object.hexdigest()
-                collection_name = f"novel_{hex_dig}"
-                
-                db_path = "chroma_db_storage"
-                if os.path.exists(db_path):
-                    # 注意：这里需要新建一个 client 连接来执行删除
-                    client = chromadb.PersistentClient(path=db_path)
-                    client.delete_collection(collection_name)
-                    print(f"[Backend] 向量库 {collection_name} 已删除")
-            except Exception as e:
-                print(f"[Backend] 向量库清理警告: {e}") # 也就是允许向量库删除失败，不影响主流程
+            # 3. 删除向量数据库（复用共享客户端，允许删除失败，不影响主流程）
+            if get_vector_service().drop_collection(book_name):
+                print(f"[Backend] 《{book_name}》的向量库已删除")
 
             return True, f"《{book_name}》已永久删除"
 
@@ -600,6 +673,14 @@ class LibraryManager:
             return False, f"删除失败: {str(e)}"
 # ================= 小说管理器 (数据层) =================
 class NovelManager:
+    # 内存中保留段落工作副本的章节数
+    PARAGRAPH_CACHE_SIZE = 8
+    # 书架条目的合并写入延迟（秒）：连续保存只在停顿后统计并写一次
+    LIBRARY_UPDATE_DELAY = 2.0
+    # 全文检索索引分组 -> 项目文档
+    SEARCH_DOC_GROUPS = {'setting': 'settings', 'meta': 'structure', 'char': 'characters',
+                         'item': 'items', 'loc': 'locations'}
+
     def __init__(self, project_root=None):
         # 如果传入了路径，就用传入的；否则读配置；最后回退到默认
         if project_root:
@@ -614,12 +695,37 @@ class NovelManager:
         self.loc_file = os.path.join(self.root_dir, "locations.json")
         self.structure_file = os.path.join(self.root_dir, "structure.json")
         self.volume_file = os.path.join(self.root_dir, "volumes.json")
+        # 存储后端：config.json 中 storage_backend 可选 json / sqlite
+        if not os.path.exists(self.chapters_dir): os.makedirs(self.chapters_dir)
+        self.store = open_project_store(self.root_dir, CFG.get('storage_backend', 'json'))
+        # 已解析文档的内存缓存（写穿，按存储签名校验）
+        self.doc_cache = DocumentCache()
+        # 章节段落工作副本（段落级编辑只追加日志，不重读整章）
+        self._paragraph_cache = OrderedDict()
+        self._paragraph_lock = threading.RLock()
+        # 全文检索索引（首次使用时打开）
+        self._search_index = None
+        # 分层剧情摘要（首次使用时加载）
+        self._summary_tree = None
+        self._summary_lock = threading.Lock()
+        # 章节快照库（首次使用时加载）
+        self._snapshots = None
+        # 增量备份状态
+        self._backup_lock = threading.Lock()
+        self.backup_status = {"running": False, "message": ""}
+        self._search_lock = threading.RLock()
+        # 书架清单（书库目录下的 library.json），保存后延迟更新本书条目
+        self.book_name = os.path.basename(os.path.normpath(self.root_dir))
+        self.library = get_library_manifest(os.path.dirname(os.path.normpath(self.root_dir)) or ".")
+        self._library_lock = threading.Lock()
+        self._library_timer = None
+        self._library_modified = None
         self._init_fs()
+        # 章节字数统计缓存（按正文文件签名校验）
+        self.stats_cache = ChapterStatsCache(os.path.join(self.root_dir, "chapter_stats.json"))
 
     def _init_fs(self):
-        if not os.path.exists(self.chapters_dir): os.makedirs(self.chapters_dir)
-
-        if not os.path.exists(self.setting_file):
+        if not self.store.has_doc('settings'):
             # 新增结构化世界观数据
             default_world_view_structured = {
                 "basic_info": {
@@ -643,34 +749,31 @@ class NovelManager:
                     "development": ""       # 发展趋势
                 }
             }
-            with open(self.setting_file, 'w', encoding='utf-8') as f:
-                json.dump({
-                    "world_view": "",
-                    "world_view_structured": default_world_view_structured,
-                    "characters": "",
-                    "book_summary": ""
-                }, f, ensure_ascii=False, indent=4)
+            self.store.write_doc('settings', {
+                "world_view": "",
+                "world_view_structured": default_world_view_structured,
+                "characters": "",
+                "book_summary": ""
+            })
         
-        if not os.path.exists(self.char_file):
+        if not self.store.has_doc('characters'):
             default_chars = [{
                 "name": "主角", "gender": "男", "role": "主角", 
                 "status": "存活", "bio": "性格坚毅。", "relations": []
             }]
-            with open(self.char_file, 'w', encoding='utf-8') as f:
-                json.dump(default_chars, f, ensure_ascii=False, indent=4)
+            self.store.write_doc('characters', default_chars)
 
-        if not os.path.exists(self.item_file):
-            with open(self.item_file, 'w', encoding='utf-8') as f: json.dump([], f)
+        if not self.store.has_doc('items'):
+            self.store.write_doc('items', [])
         
-        if not os.path.exists(self.loc_file):
-            with open(self.loc_file, 'w', encoding='utf-8') as f: json.dump([], f)
+        if not self.store.has_doc('locations'):
+            self.store.write_doc('locations', [])
 
-        if not os.path.exists(self.volume_file):
+        if not self.store.has_doc('volumes'):
             default_vol = [{"id": "vol_default", "title": "正文卷", "order": 1}]
-            with open(self.volume_file, 'w', encoding='utf-8') as f:
-                json.dump(default_vol, f, ensure_ascii=False, indent=4)
+            self.store.write_doc('volumes', default_vol)
 
-        if not os.path.exists(self.structure_file):
+        if not self.store.has_doc('structure'):
             default_structure = [{
                 "id": 1, 
                 "title": "第一章", 
@@ -679,99 +782,99 @@ class NovelManager:
                 "summary": "", 
                 "time_info": {"label": "故事开始", "duration": "0", "events": []}
             }]
-            with open(self.structure_file, 'w', encoding='utf-8') as f:
-                json.dump(default_structure, f, ensure_ascii=False, indent=4)
+            self.store.write_doc('structure', default_structure)
 
     # --- 基础读写 ---
-    def load_settings(self):
-        try:
-            with open(self.setting_file, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-                # 自动迁移：添加缺失的结构化世界观数据
-                if 'world_view_structured' not in data:
-                    data['world_view_structured'] = {
-                        "basic_info": {"genre": "", "era": "", "tech_level": ""},
-                        "core_settings": {"power_system": "", "social_structure": "", "special_rules": ""},
-                        "key_elements": {"important_items": "", "organizations": "", "locations": ""},
-                        "background": {"history": "", "main_conflict": "", "development": ""}
-                    }
-                return data
-        except (FileNotFoundError, json.JSONDecodeError, PermissionError):
-            return {
-                "world_view": "",
-                "world_view_structured": {
+    # 文档读取走内存缓存：load_* 返回可变副本，view_doc 返回只读视图（无拷贝）
+    def _normalize_doc(self, name, data):
+        """补全缺省值（旧数据自动迁移）；data 为 None 表示文档不存在或损坏"""
+        if name == 'settings':
+            if data is None:
+                data = {"world_view": "", "characters": "", "book_summary": ""}
+            # 自动迁移：添加缺失的结构化世界观数据
+            if 'world_view_structured' not in data:
+                data['world_view_structured'] = {
                     "basic_info": {"genre": "", "era": "", "tech_level": ""},
                     "core_settings": {"power_system": "", "social_structure": "", "special_rules": ""},
                     "key_elements": {"important_items": "", "organizations": "", "locations": ""},
                     "background": {"history": "", "main_conflict": "", "development": ""}
-                },
-                "characters": "",
-                "book_summary": ""
-            }
+                }
+            return data
+        if data is None:
+            return []
+        if name == 'characters':
+            for char in data:
+                if 'relations' not in char: char['relations'] = []
+        elif name == 'structure':
+            for chap in data:
+                if 'time_info' not in chap:
+                    chap['time_info'] = {"label": "未知时间", "duration": "-", "events": []}
+                if 'volume_id' not in chap:
+                    chap['volume_id'] = "vol_default"
+        return data
+
+    def view_doc(self, name):
+        """
+        获取文档的只读视图（settings/characters/items/locations/volumes/structure）
+        命中缓存时不读盘、不拷贝；文件在进程外被修改时按签名自动重新加载
+        """
+        signature = self.store.doc_signature(name)
+        view = self.doc_cache.get(name, signature)
+        if view is None:
+            try:
+                data = self.store.read_doc(name)
+            except (FileNotFoundError, json.JSONDecodeError, PermissionError):
+                data = None
+            view = self.doc_cache.put(name, signature, self._normalize_doc(name, data))
+        return view
+
+    def _save_doc(self, name, data):
+        """写入存储并同步缓存（写穿）"""
+        self.store.write_doc(name, data)
+        if self.store.in_transaction:
+            # 事务可能回滚，提交前不写缓存
+            self.doc_cache.invalidate(name)
+        else:
+            self.doc_cache.put(name, self.store.doc_signature(name), self._normalize_doc(name, thaw_json(data)))
+        self._index_doc(name, data)
+        self._touch_library()
+
+    def load_settings(self):
+        return thaw_json(self.view_doc('settings'))
 
     def save_settings(self, data):
-        with open(self.setting_file, 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=4)
+        self._save_doc('settings', data)
 
     def load_characters(self):
-        try:
-            with open(self.char_file, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-                for char in data:
-                    if 'relations' not in char: char['relations'] = []
-                return data
-        except (FileNotFoundError, json.JSONDecodeError, PermissionError):
-            return []
+        return thaw_json(self.view_doc('characters'))
 
     def save_characters(self, data):
-        with open(self.char_file, 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=4)
+        self._save_doc('characters', data)
 
     def load_items(self):
-        try:
-            with open(self.item_file, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        except (FileNotFoundError, json.JSONDecodeError, PermissionError):
-            return []
+        return thaw_json(self.view_doc('items'))
 
     def save_items(self, data):
-        with open(self.item_file, 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=4)
+        self._save_doc('items', data)
 
     def load_locations(self):
-        try:
-            with open(self.loc_file, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        except (FileNotFoundError, json.JSONDecodeError, PermissionError):
-            return []
+        return thaw_json(self.view_doc('locations'))
 
     def save_locations(self, data):
-        with open(self.loc_file, 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=4)
+        self._save_doc('locations', data)
 
     def load_volumes(self):
-        try:
-            with open(self.volume_file, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        except (FileNotFoundError, json.JSONDecodeError, PermissionError):
-            return []
+        return thaw_json(self.view_doc('volumes'))
 
     def save_volumes(self, data):
-        with open(self.volume_file, 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=4)
+        self._save_doc('volumes', data)
 
     def load_structure(self):
-        try:
-            with open(self.structure_file, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-                for chap in data:
-                    if 'time_info' not in chap:
-                        chap['time_info'] = {"label": "未知时间", "duration": "-", "events": []}
-                    if 'volume_id' not in chap:
-                        chap['volume_id'] = "vol_default"
-                return data
-        except (FileNotFoundError, json.JSONDecodeError, PermissionError):
-            return []
+        return thaw_json(self.view_doc('structure'))
+
+    def chapter_volumes(self):
+        """{章节ID: 分卷ID}（向量库按此记录分块所属分卷）"""
+        return {chap['id']: chap.get('volume_id', 'vol_default') for chap in self.view_doc('structure')}
 
     def save_structure(self, data):
         # 清理不应保存到 structure.json 的字段
@@ -784,19 +887,41 @@ class NovelManager:
             chap_copy.pop('content', None)  # content 应保存在单独文件
             cleaned_data.append(chap_copy)
 
-        with open(self.structure_file, 'w', encoding='utf-8') as f:
-            json.dump(cleaned_data, f, ensure_ascii=False, indent=4)
+        self._save_doc('structure', cleaned_data)
+
+    def transaction(self):
+        """
+        多实体写入事务
+        用法: with manager.transaction(): manager.save_characters(...); manager.save_items(...)
+        SQLite 后端整体提交/回滚；JSON 后端在退出时统一落盘，出错则不写入
+        """
+        return self.store.transaction()
     
     def save_chapter_content(self, chapter_id, content):
-        with open(os.path.join(self.chapters_dir, f"{chapter_id}.txt"), 'w', encoding='utf-8') as f:
-            f.write(content)
+        self.store.write_chapter_text(chapter_id, content)
+        # 保存时顺带更新字数缓存，统计时无需再读正文
+        self.stats_cache.put(chapter_id, self._chapter_signature(chapter_id), count_words(content))
+        self._touch_library()
+
+    def _chapter_signature(self, chapter_id):
+        """正文签名（JSON 后端为 mtime+size，SQLite 后端为修订号），不存在时返回 None"""
+        return self.store.chapter_signature(chapter_id)
 
     def load_chapter_content(self, chapter_id):
-        path = os.path.join(self.chapters_dir, f"{chapter_id}.txt")
-        if not os.path.exists(path):
-            return ""
-        with open(path, 'r', encoding='utf-8') as f:
-            return f.read()
+        content = self.store.read_chapter_text(chapter_id)
+        return content if content is not None else ""
+
+    def delete_chapter(self, chapter_id):
+        """删除章节正文与段落数据（章节结构由调用方从 structure 中移除）"""
+        with self._paragraph_lock:
+            self.store.delete_chapter(chapter_id)
+            self._paragraph_cache.pop(str(chapter_id), None)
+        self.stats_cache.remove(chapter_id)
+        try:
+            self.search_index.delete_group(f"chap:{chapter_id}")
+        except Exception as e:
+            print(f"[Search] 删除章节索引失败: {e}")
+        self._touch_library()
 
     # ================= 段落级别存储（新增） =================
 
@@ -849,189 +974,276 @@ class NovelManager:
 
     def save_chapter_paragraphs(self, chapter_id, paragraphs):
         """保存章节段落结构到JSON文件"""
-        data = {
-            "chapter_id": chapter_id,
-            "paragraphs": paragraphs,
-            "metadata": {
-                "paragraph_count": len(paragraphs),
-                "total_words": sum(p.get('word_count', 0) for p in paragraphs),
-                "updated_at": datetime.now().isoformat()
+        with self._paragraph_lock:
+            sequence = ParagraphSequence([dict(p) for p in paragraphs], self._known_next_seq(chapter_id))
+            data = {
+                "chapter_id": chapter_id,
+                "paragraphs": sequence.to_list(),
+                "next_seq": sequence.next_seq,
+                "metadata": {
+                    "paragraph_count": len(paragraphs),
+                    "total_words": sum(p.get('word_count', 0) for p in paragraphs),
+                    "updated_at": datetime.now().isoformat()
+                }
             }
-        }
-        path = os.path.join(self.chapters_dir, f"{chapter_id}_paragraphs.json")
-        with open(path, 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
+            # 同时保存纯文本版本（兼容），两者在同一事务中提交
+            text = self.paragraphs_to_text(paragraphs)
+            with self.store.transaction():
+                self.store.write_paragraph_doc(chapter_id, data)
+                self.store.write_chapter_text(chapter_id, text)
+            # 提交后签名才确定（外层事务中为 None，不写缓存）
+            self.stats_cache.put(chapter_id, self._chapter_signature(chapter_id), count_words(text))
+            self._remember_paragraphs(chapter_id, sequence)
+            self._index_chapter(chapter_id, sequence.items)
+        self._touch_library()
+
+    def save_chapter_text(self, chapter_id, text):
+        """
+        按整章文本保存（编辑器保存入口）
+        与现有段落对齐：未改动/原位修改的段落沿用原ID，只有新增段落分配新ID，
+        审稿记录中的段落引用因此在保存前后保持有效
+        返回保存后的段落列表
+        """
+        with self._paragraph_lock:
+            _, sequence = self._paragraph_state(chapter_id)
+            texts = [p['text'] for p in self.text_to_paragraphs(text)]
+            paragraphs = sequence.reconcile(texts, self._make_paragraph)
+            self.save_chapter_paragraphs(chapter_id, paragraphs)
+            return paragraphs
 
-        # 同时保存纯文本版本（兼容）
-        text = self.paragraphs_to_text(paragraphs)
-        self.save_chapter_content(chapter_id, text)
+    def _known_next_seq(self, chapter_id):
+        """已分配的段落序号上界（来自内存副本或存储）"""
+        entry = self._paragraph_cache.get(str(chapter_id))
+        if entry is not None:
+            return entry[1].next_seq
+        data = self.store.read_paragraph_doc(chapter_id)
+        return data.get('next_seq', 0) if data else 0
+
+    def _remember_paragraphs(self, chapter_id, sequence):
+        """记录章节段落工作副本（LRU，最多保留 PARAGRAPH_CACHE_SIZE 章）"""
+        key = str(chapter_id)
+        self._paragraph_cache[key] = (self.store.chapter_signature(chapter_id), sequence)
+        self._paragraph_cache.move_to_end(key)
+        while len(self._paragraph_cache) > self.PARAGRAPH_CACHE_SIZE:
+            self._paragraph_cache.popitem(last=False)
+
+    def _paragraph_state(self, chapter_id):
+        """
+        获取章节段落的内存工作副本 (签名, ParagraphSequence)
+        签名一致时直接复用，不读盘；返回的序列仅供本类内部修改
+        """
+        key = str(chapter_id)
+        entry = self._paragraph_cache.get(key)
+        if entry is not None and entry[0] is not None and entry[0] == self.store.chapter_signature(chapter_id):
+            self._paragraph_cache.move_to_end(key)
+            return entry
+
+        data = self.store.read_paragraph_doc(chapter_id)
+        if data is not None:
+            self._remember_paragraphs(
+                chapter_id, ParagraphSequence(data.get('paragraphs', []), data.get('next_seq', 0)))
+        else:
+            # 从txt文件转换（兼容旧数据）
+            text = self.load_chapter_content(chapter_id)
+            paragraphs = self.text_to_paragraphs(text) if text else []
+            if paragraphs:
+                # 自动保存转换结果
+                self.save_chapter_paragraphs(chapter_id, paragraphs)
+            else:
+                self._remember_paragraphs(chapter_id, ParagraphSequence([]))
+        return self._paragraph_cache[key]
 
     def load_chapter_paragraphs(self, chapter_id):
         """
         加载章节段落结构
         如果JSON不存在，自动从txt转换（兼容旧数据）
         """
-        json_path = os.path.join(self.chapters_dir, f"{chapter_id}_paragraphs.json")
+        with self._paragraph_lock:
+            _, sequence = self._paragraph_state(chapter_id)
+            return sequence.to_list()
 
-        if os.path.exists(json_path):
-            try:
-                with open(json_path, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-                return data.get('paragraphs', [])
-            except (json.JSONDecodeError, KeyError):
-                pass  # 文件损坏，重新从txt转换
-
-        # 从txt文件转换（兼容旧数据）
-        text = self.load_chapter_content(chapter_id)
-        if text:
-            paragraphs = self.text_to_paragraphs(text)
-            # 自动保存转换结果
-            if paragraphs:
-                self.save_chapter_paragraphs(chapter_id, paragraphs)
-            return paragraphs
+    def _commit_paragraph_ops(self, chapter_id, ops):
+        """
+        提交段落操作：追加写入操作日志，同步内存副本与字数缓存
+        只写入本次改动，日志累积过大时才压缩回完整的 JSON/TXT
+        返回更新后的段落列表
+        """
+        with self._paragraph_lock:
+            old_signature, sequence = self._paragraph_state(chapter_id)
+            if not ops:
+                return sequence.to_list()
+
+            # 记录被替换/删除与新增的文本，用于增量更新字数统计
+            removed, added = [], []
+            old_count = len(sequence)
+            for op in ops:
+                if op['op'] in ('set', 'delete') and sequence.get(op['id']) is not None:
+                    removed.append(sequence.get(op['id'])['text'])
+                    if op['op'] == 'set':
+                        op['para']['order'] = sequence.get(op['id'])['order']
+                if op['op'] in ('set', 'insert'):
+                    added.append(op['para']['text'])
+
+            self.store.append_paragraph_ops(chapter_id, ops)
+            for op in ops:
+                sequence.apply(op)
+            new_signature = self.store.chapter_signature(chapter_id)
+            self._adjust_chapter_stats(chapter_id, old_signature, new_signature,
+                                       removed, added, old_count, len(sequence))
+
+            if self.store.needs_compaction(chapter_id):
+                self.store.compact_paragraphs(chapter_id)
+                compacted_signature = self.store.chapter_signature(chapter_id)
+                stats = self.stats_cache.get(chapter_id, new_signature)
+                if stats is not None:
+                    self.stats_cache.put(chapter_id, compacted_signature, stats)
+                new_signature = compacted_signature
+
+            self._remember_paragraphs(chapter_id, sequence)
+            self._index_chapter(chapter_id, sequence.items)
+            self._touch_library()
+            return sequence.to_list()
+
+    def _adjust_chapter_stats(self, chapter_id, old_signature, new_signature,
+                              removed, added, old_count, new_count):
+        """按段落增减增量修正字数缓存（各项计数可按段落累加，段落间隔 2 个换行符）"""
+        stats = self.stats_cache.get(chapter_id, old_signature)
+        if stats is None:
+            return  # 缓存本就缺失，下次统计时按新签名重新计算
+        for text, sign in [(t, -1) for t in removed] + [(t, 1) for t in added]:
+            for k, v in count_words(text).items():
+                stats[k] = stats.get(k, 0) + sign * v
+        separators = lambda n: 2 * (n - 1) if n > 0 else 0
+        stats['total_chars'] = stats.get('total_chars', 0) + separators(new_count) - separators(old_count)
+        # 不立即落盘：丢失时按签名失效重算，保证单段编辑不重写整个缓存文件
+        self.stats_cache.put(chapter_id, new_signature, stats, persist=False)
+
+    def _make_paragraph(self, para_id, text):
+        return {
+            "id": para_id,
+            "text": text,
+            "word_count": count_words(text)['total_words']
+        }
 
-        return []
+    def _insert_op(self, chapter_id, sequence, after_id, text):
+        """构造插入操作：分配新ID，并在 after_id 与其后继之间取排序键"""
+        order = sequence.order_after(after_id)
+        if order is None:
+            # 排序键间隔耗尽（极少发生），先整体重排
+            self._commit_paragraph_ops(chapter_id, [{"op": "rebalance"}])
+            order = sequence.order_after(after_id)
+        para = self._make_paragraph(sequence.allocate_id(), text)
+        para['order'] = order
+        return {"op": "insert", "after": after_id, "para": para, "next_seq": sequence.next_seq}
 
     def update_single_paragraph(self, chapter_id, paragraph_id, new_text):
         """
         更新单个段落内容
         返回更新后的段落列表
         """
-        paragraphs = self.load_chapter_paragraphs(chapter_id)
+        return self.update_paragraphs(chapter_id, {paragraph_id: new_text})
 
-        for i, p in enumerate(paragraphs):
-            if p['id'] == paragraph_id:
-                paragraphs[i]['text'] = new_text
-                paragraphs[i]['word_count'] = count_words(new_text)['total_words']
-                break
-
-        self.save_chapter_paragraphs(chapter_id, paragraphs)
-        return paragraphs
+    def update_paragraphs(self, chapter_id, updates):
+        """
+        批量更新段落内容
+        updates: {paragraph_id: new_text}
+        返回更新后的段落列表
+        """
+        with self._paragraph_lock:
+            _, sequence = self._paragraph_state(chapter_id)
+            ops = [{"op": "set", "id": pid, "para": self._make_paragraph(pid, text)}
+                   for pid, text in updates.items() if sequence.get(pid) is not None]
+            return self._commit_paragraph_ops(chapter_id, ops)
 
     def get_paragraph_by_id(self, chapter_id, paragraph_id):
         """根据ID获取单个段落"""
-        paragraphs = self.load_chapter_paragraphs(chapter_id)
-        for p in paragraphs:
-            if p['id'] == paragraph_id:
-                return p
-        return None
+        with self._paragraph_lock:
+            _, sequence = self._paragraph_state(chapter_id)
+            para = sequence.get(paragraph_id)
+            return dict(para) if para is not None else None
 
     def add_paragraph(self, chapter_id, after_id, text):
-        """在指定段落后插入新段落"""
-        paragraphs = self.load_chapter_paragraphs(chapter_id)
-        new_id = f"p{len(paragraphs) + 1}"
-        new_para = {
-            "id": new_id,
-            "text": text,
-            "word_count": count_words(text)['total_words']
-        }
-
-        # 找到插入位置
-        insert_idx = len(paragraphs)
-        for i, p in enumerate(paragraphs):
-            if p['id'] == after_id:
-                insert_idx = i + 1
-                break
-
-        paragraphs.insert(insert_idx, new_para)
-        # 重新编号（可选，保持ID连续）
-        for i, p in enumerate(paragraphs, 1):
-            p['id'] = f"p{i}"
-
-        self.save_chapter_paragraphs(chapter_id, paragraphs)
-        return paragraphs
+        """在指定段落后插入新段落（新段落分配新ID，其余段落ID不变）"""
+        with self._paragraph_lock:
+            _, sequence = self._paragraph_state(chapter_id)
+            # 找不到 after_id 时追加到末尾
+            if sequence.get(after_id) is None:
+                after_id = sequence.items[-1]['id'] if len(sequence) else None
+            return self._commit_paragraph_ops(chapter_id, [self._insert_op(chapter_id, sequence, after_id, text)])
 
     def delete_paragraph(self, chapter_id, paragraph_id):
-        """删除指定段落"""
-        paragraphs = self.load_chapter_paragraphs(chapter_id)
-        paragraphs = [p for p in paragraphs if p['id'] != paragraph_id]
-
-        # 重新编号
-        for i, p in enumerate(paragraphs, 1):
-            p['id'] = f"p{i}"
-
-        self.save_chapter_paragraphs(chapter_id, paragraphs)
-        return paragraphs
+        """删除指定段落（ID不再复用）"""
+        return self._commit_paragraph_ops(chapter_id, [{"op": "delete", "id": paragraph_id}])
 
     def split_paragraph(self, chapter_id, paragraph_id, split_position):
         """
         在指定位置分割段落
         split_position: 段落内的字符位置
+        前半段保留原ID，后半段分配新ID
         """
-        paragraphs = self.load_chapter_paragraphs(chapter_id)
-
-        for i, p in enumerate(paragraphs):
-            if p['id'] == paragraph_id:
-                text = p['text']
-                if 0 < split_position < len(text):
-                    # 分割
-                    first_half = text[:split_position].strip()
-                    second_half = text[split_position:].strip()
-
-                    # 替换原段落
-                    paragraphs[i]['text'] = first_half
-                    paragraphs[i]['word_count'] = count_words(first_half)['total_words']
-
-                    # 插入新段落
-                    new_para = {
-                        "id": f"p_temp",
-                        "text": second_half,
-                        "word_count": count_words(second_half)['total_words']
-                    }
-                    paragraphs.insert(i + 1, new_para)
-                break
-
-        # 重新编号
-        for i, p in enumerate(paragraphs, 1):
-            p['id'] = f"p{i}"
-
-        self.save_chapter_paragraphs(chapter_id, paragraphs)
-        return paragraphs
+        with self._paragraph_lock:
+            _, sequence = self._paragraph_state(chapter_id)
+            original = sequence.get(paragraph_id)
+            ops = []
+            if original and 0 < split_position < len(original['text']):
+                text = original['text']
+                first_half = text[:split_position].strip()
+                second_half = text[split_position:].strip()
+                ops = [
+                    {"op": "set", "id": paragraph_id, "para": self._make_paragraph(paragraph_id, first_half)},
+                    self._insert_op(chapter_id, sequence, paragraph_id, second_half)
+                ]
+            return self._commit_paragraph_ops(chapter_id, ops)
 
     def merge_paragraphs(self, chapter_id, paragraph_ids):
-        """合并多个段落"""
-        paragraphs = self.load_chapter_paragraphs(chapter_id)
-
-        # 找到要合并的段落
-        to_merge = []
-        merge_indices = []
-        for i, p in enumerate(paragraphs):
-            if p['id'] in paragraph_ids:
-                to_merge.append(p['text'])
-                merge_indices.append(i)
-
-        if len(to_merge) < 2:
-            return paragraphs
-
-        # 合并文本
-        merged_text = '\n\n'.join(to_merge)
-        merged_para = {
-            "id": "p_temp",
-            "text": merged_text,
-            "word_count": count_words(merged_text)['total_words']
+        """合并多个段落（合并结果沿用第一个段落的ID）"""
+        with self._paragraph_lock:
+            _, sequence = self._paragraph_state(chapter_id)
+
+            # 找到要合并的段落，按文中顺序排列
+            to_merge = sorted((sequence.get(pid) for pid in set(paragraph_ids) if sequence.get(pid) is not None),
+                              key=lambda p: p['order'])
+            if len(to_merge) < 2:
+                return sequence.to_list()
+
+            # 合并文本：替换第一个段落，删除其余
+            merged_text = '\n\n'.join(p['text'] for p in to_merge)
+            first_id = to_merge[0]['id']
+            ops = [{"op": "set", "id": first_id, "para": self._make_paragraph(first_id, merged_text)}]
+            ops += [{"op": "delete", "id": p['id']} for p in to_merge[1:]]
+            return self._commit_paragraph_ops(chapter_id, ops)
+
+    def get_chapter_word_stats(self, chapter_id, persist=True):
+        """
+        获取单章字数统计（优先读缓存）
+        缓存未命中或正文在外部被修改时才读取正文重新统计
+        """
+        signature = self._chapter_signature(chapter_id)
+        if signature is None:
+            return count_words("")
+        stats = self.stats_cache.get(chapter_id, signature)
+        if stats is None:
+            stats = count_words(self.load_chapter_content(chapter_id))
+            self.stats_cache.put(chapter_id, signature, stats, persist=persist)
+        return stats
+
+    def get_chapter_word_counts(self, chapter_ids=None):
+        """
+        批量获取章节字数
+        返回: {chapter_id: total_words}
+        """
+        if chapter_ids is None:
+            chapter_ids = [chap['id'] for chap in self.view_doc('structure')]
+        counts = {
+            cid: self.get_chapter_word_stats(cid, persist=False)['total_words']
+            for cid in chapter_ids
         }
-
-        # 替换第一个段落，删除其余
-        paragraphs[merge_indices[0]] = merged_para
-        # 从后往前删除，避免索引变化
-        for idx in sorted(merge_indices[1:], reverse=True):
-            paragraphs.pop(idx)
-
-        # 重新编号
-        for i, p in enumerate(paragraphs, 1):
-            p['id'] = f"p{i}"
-
-        self.save_chapter_paragraphs(chapter_id, paragraphs)
-        return paragraphs
+        self.stats_cache.flush()
+        return counts
 
     def get_total_word_count(self):
         """获取全书总字数（使用精确字数统计）"""
-        structure = self.load_structure()
-        total = 0
-        for chap in structure:
-            content = self.load_chapter_content(chap['id'])
-            total += count_words(content)['total_words']
-        return total
+        return sum(self.get_chapter_word_counts().values())
 
     def get_detailed_word_stats(self):
         """
@@ -1046,8 +1258,8 @@ class NovelManager:
             'volumes': [分卷统计列表]
         }
         """
-        structure = self.load_structure()
-        volumes = self.load_volumes()
+        structure = self.view_doc('structure')
+        volumes = self.view_doc('volumes')
 
         total_stats = {'total_words': 0, 'chinese': 0, 'english': 0, 'numbers': 0, 'total_chars': 0}
         volume_stats = []
@@ -1072,8 +1284,7 @@ class NovelManager:
             chapter_details = []
 
             for chap in chapters:
-                content = self.load_chapter_content(chap['id'])
-                stats = count_words(content)
+                stats = self.get_chapter_word_stats(chap['id'], persist=False)
                 vol_total += stats['total_words']
                 vol_chinese += stats['chinese']
                 vol_english += stats['english']
@@ -1098,6 +1309,8 @@ class NovelManager:
             total_stats['chinese'] += vol_chinese
             total_stats['english'] += vol_english
 
+        self.stats_cache.flush()
+
         chapter_count = len(structure)
         avg_words = total_stats['total_words'] // chapter_count if chapter_count > 0 else 0
 
@@ -1111,10 +1324,71 @@ class NovelManager:
             'volumes': volume_stats
         }
 
+    # ================= 书架清单 =================
+
+    def _touch_library(self):
+        """记录本书被修改，LIBRARY_UPDATE_DELAY 秒内没有新的保存时刷新书架条目"""
+        with self._library_lock:
+            self._library_modified = time.time()
+        self._schedule_library_update()
+
+    def _schedule_library_update(self):
+        with self._library_lock:
+            if self._library_timer is not None:
+                self._library_timer.cancel()
+            self._library_timer = threading.Timer(self.LIBRARY_UPDATE_DELAY, self.flush_library_entry)
+            self._library_timer.daemon = True
+            self._library_timer.start()
+
+    def _project_mtime(self):
+        """项目文件的最晚修改时间（清单中没有修改记录时使用）"""
+        latest = 0
+        for folder in (self.root_dir, self.chapters_dir):
+            try:
+                for entry in os.scandir(folder):
+                    if entry.is_file():
+                        latest = max(latest, entry.stat().st_mtime)
+            except OSError:
+                pass
+        return latest or time.time()
+
+    def library_entry(self):
+        """
+        本书的书架元数据（字数来自字数缓存，只有缓存失效的章节才读正文）
+        返回: {"word_count", "chapter_count", "volume_count", "summary"}
+        """
+        return {
+            "word_count": sum(self.get_chapter_word_counts().values()),
+            "chapter_count": len(self.view_doc('structure')),
+            "volume_count": len(self.view_doc('volumes')),
+            "summary": make_summary(self.view_doc('settings'))
+        }
+
+    def flush_library_entry(self):
+        """立即统计并写入本书的书架条目（只改本书条目，不影响其他书）"""
+        with self._library_lock:
+            if self._library_timer is not None:
+                self._library_timer.cancel()
+                self._library_timer = None
+            modified = self._library_modified
+        try:
+            # 持有存储锁，其他线程的事务提交前不统计；本线程处于事务中时（签名未定）推迟
+            with self.store.lock:
+                if self.store.in_transaction:
+                    self._schedule_library_update()
+                    return
+                entry = self.library_entry()
+            if modified is None:
+                modified = (self.library.get(self.book_name) or {}).get('last_modified') or self._project_mtime()
+            entry['last_modified'] = modified
+            self.library.update(self.book_name, **entry)
+        except Exception as e:
+            print(f"[Library] 书架条目更新失败: {e}")
+
     def get_relevant_context(self, text_context):
-        chars = self.load_characters()
-        items = self.load_items()
-        locs = self.load_locations()
+        chars = self.view_doc('characters')
+        items = self.view_doc('items')
+        locs = self.view_doc('locations')
         
         active_info = []
         active_names = []
@@ -1146,30 +1420,50 @@ class NovelManager:
 
         return "\n".join(active_info), active_names
 
-    def smart_rag_pipeline(self, query, current_chapter_id, memory_manager):
-        print(f"\n[Smart RAG] 启动智能检索: {query[:20]}...")
-        raw_docs, debug_info = memory_manager.query_related_memory(
-            query, n_results=8, threshold=1.6, exclude_chapter_id=current_chapter_id
-        )
-        if not raw_docs: return "（无相关历史记忆）", []
+    # 大纲问句的检索条数（混合检索的命中更准，原先的 8 条缩减为 6 条，知识过滤提示随之变短）
+    RAG_QUERY_HITS = 6
+    # 每个出场实体补充的检索条数
+    RAG_ENTITY_HITS = 2
 
-        processed_snippets = []
-        for item in debug_info:
-            # 安全解析章节ID
-            try:
-                source_str = item['source'].replace("第", "").replace("章", "")
-                source_id = int(source_str)
-            except (ValueError, KeyError):
-                source_id = 0
-            distance = current_chapter_id - source_id
-            prefix = "[REF]"
-            if 1 <= distance <= 3: prefix = "[SKIP-RECENT]"
-            snippet = f"{prefix} (第{source_id}章): {item['text']}"
-            processed_snippets.append(snippet)
-        
+    # 检索时跳过的最近章节数（近几章由上下文直接提供，不必再经向量库召回）
+    RAG_SKIP_RECENT = 3
+
+    def smart_rag_pipeline(self, query, current_chapter_id, memory_manager, entity_names=None, volume_id=None):
+        """
+        检索历史片段并交给知识过滤模型整理
+        entity_names: 本章出场的人物/物品/地点名，与大纲问句一起批量检索（一次嵌入、一次查询）
+        volume_id: 只在该分卷内检索（None 为全书）
+        memory_manager 为 None（向量库加载失败）时只使用摘要层
+        章节范围（早于本章且跳过最近 RAG_SKIP_RECENT 章）由向量库与词法索引在检索时过滤，
+        送入知识过滤的片段都是可用的
+        """
+        print(f"\n[Smart RAG] 启动智能检索: {query[:20]}...")
+        entity_names = list(dict.fromkeys(entity_names or []))
+        debug_info = []
+        if memory_manager is None:
+            print("[Smart RAG] 向量库不可用，跳过片段检索")
+        else:
+            where = memory_manager.chapter_scope(before_chapter_id=current_chapter_id,
+                                                 skip_recent=self.RAG_SKIP_RECENT, volume_id=volume_id)
+            results = memory_manager.query_many(
+                [query] + entity_names, n_results=self.RAG_QUERY_HITS, threshold=1.6, where=where
+            )
+            limits = [None] + [self.RAG_ENTITY_HITS] * len(entity_names)
+            debug_info = [h for h in memory_manager.merge_hits(results, limits) if h['valid']]
+            if entity_names:
+                print(f"[Smart RAG] 批量检索 {len(entity_names) + 1} 个问句，合并后 {len(debug_info)} 条")
+
+        # 摘要层：此前分卷摘要 + 本卷最近几章摘要，提供长距离前情
+        summary_block = self.format_summary_context(self.summary_context(current_chapter_id))
+        if not debug_info:
+            # 没有命中片段时直接使用摘要层，不再调用过滤模型
+            return (summary_block or "（无相关历史记忆）"), []
+
+        processed_snippets = [f"(第{item['chapter_id']}章): {item['text']}" for item in debug_info]
         context_block = "\n\n".join(processed_snippets)
         sys_prompt = get_prompt('knowledge_filter_system')
-        filter_prompt = f"【本章大纲】{query}\n【检索片段】\n{context_block}\n【任务】筛选有用背景，忽略[SKIP-RECENT]，合并重复，输出简练背景。"
+        summary_part = f"【前情摘要】\n{summary_block}\n" if summary_block else ""
+        filter_prompt = f"【本章大纲】{query}\n{summary_part}【检索片段】\n{context_block}\n【任务】结合前情摘要筛选有用背景，合并重复，输出简练背景。"
         print(f"\n[知识过滤] 检索片段数: {len(processed_snippets)} | 大纲长度: {len(query)}")
         filtered_context = sync_call_llm(filter_prompt, sys_prompt, task_type="editor")
         print(f"[知识过滤] 完成，过滤后长度: {len(filtered_context)}")
@@ -1195,208 +1489,455 @@ class NovelManager:
         print(f"[章节摘要] 完成，摘要长度: {len(summary)}")
         return summary
 
-    def update_global_summary(self):
-        structure = self.load_structure()
-        all_summaries = []
-        for chap in structure:
+    @property
+    def summary_tree(self):
+        if self._summary_tree is None:
+            self._summary_tree = SummaryTree(self.root_dir)
+        return self._summary_tree
+
+    def _volume_chapter_summaries(self):
+        """按分卷顺序整理章节摘要: [(分卷, [(章节ID, 摘要), ...]), ...]（无章节摘要的分卷也列出）"""
+        grouped = {}
+        for chap in self.view_doc('structure'):
             if chap.get('summary'):
-                all_summaries.append(f"第{chap['id']}章: {chap['summary']}")
-        if not all_summaries:
-            print("[全书总结] 暂无章节摘要，跳过生成")
-            return "暂无剧情。"
-        combined_text = "\n".join(all_summaries)
-        sys_prompt = get_prompt('summary_book_system')
-        prompt = f"以下是这就本小说目前的**分章剧情摘要**：\n{combined_text}\n【任务】请根据以上分章摘要，写一份**全书目前的剧情总纲**（500字左右）。"
-        print(f"\n[全书总结] 汇总 {len(all_summaries)} 章摘要")
-        global_summary = sync_call_llm(prompt, sys_prompt, task_type="summary")
-        if "Error" in global_summary:
-            print(f"[全书总结] 生成失败: {global_summary}")
+                grouped.setdefault(str(chap.get('volume_id', 'vol_default')), []).append((chap['id'], chap['summary']))
+        volumes = list(self.view_doc('volumes'))
+        known = {str(v['id']) for v in volumes}
+        # 结构中引用了不存在的分卷时按默认分卷处理，排在最后
+        volumes += [{"id": vid, "title": "未分卷"} for vid in grouped if vid not in known]
+        return [(vol, grouped.get(str(vol['id']), [])) for vol in volumes]
+
+    def update_volume_summaries(self):
+        """
+        重新汇总来源有变化的分卷摘要（本卷章节摘要未变时不调用模型）
+        返回: (最新的 [(分卷, 分卷摘要)], 本次重算的分卷数)
+        """
+        tree = self.summary_tree
+        results, updated = [], 0
+        for vol, chapters in self._volume_chapter_summaries():
+            if not chapters:
+                continue
+            source = source_hash(chapters)
+            title = vol.get('title', '未命名分卷')
+            if tree.volume_is_current(vol['id'], source):
+                results.append((vol, tree.volume(vol['id'])['summary']))
+                continue
+            if len(chapters) == 1:
+                # 只有一章时直接沿用章节摘要
+                summary = chapters[0][1]
+            else:
+                combined_text = "\n".join(f"第{cid}章: {s}" for cid, s in chapters)
+                prompt = f"以下是《{title}》这一卷的**分章剧情摘要**：\n{combined_text}\n【任务】请写一份**本卷剧情摘要**（300字以内）。"
+                print(f"\n[分卷摘要] {title} | 汇总 {len(chapters)} 章摘要")
+                summary = sync_call_llm(prompt, get_prompt('summary_volume_system'), task_type="summary")
+                if "Error" in summary:
+                    print(f"[分卷摘要] {title} 生成失败: {summary}")
+                    old = tree.volume(vol['id'])
+                    if old:
+                        results.append((vol, old['summary']))
+                    continue
+            tree.set_volume(vol['id'], summary, source, [cid for cid, _ in chapters])
+            results.append((vol, summary))
+            updated += 1
+        tree.prune([vol['id'] for vol, _ in results])
+        return results, updated
+
+    def update_global_summary(self):
+        """
+        分层更新全书总纲：章节摘要 -> 分卷摘要 -> 全书总纲
+        只重算章节摘要有变化的分卷；分卷摘要都未变化时直接返回已有总纲，不调用模型
+        """
+        with self._summary_lock:
+            volume_summaries, updated = self.update_volume_summaries()
+            if not volume_summaries:
+                print("[全书总结] 暂无章节摘要，跳过生成")
+                return "暂无剧情。"
+            source = source_hash([(vol['id'], summary) for vol, summary in volume_summaries])
+            book = self.summary_tree.book()
+            settings = self.view_doc('settings')
+            if book.get('source') == source and settings.get('book_summary'):
+                print("[全书总结] 分卷摘要未变化，沿用现有总纲")
+                return settings['book_summary']
+
+            combined_text = "\n".join(f"【{vol.get('title', '未命名分卷')}】{summary}" for vol, summary in volume_summaries)
+            sys_prompt = get_prompt('summary_book_system')
+            prompt = f"以下是这本小说目前的**分卷剧情摘要**：\n{combined_text}\n【任务】请根据以上分卷摘要，写一份**全书目前的剧情总纲**（500字左右）。"
+            print(f"\n[全书总结] 汇总 {len(volume_summaries)} 卷摘要（本次重算 {updated} 卷）")
+            global_summary = sync_call_llm(prompt, sys_prompt, task_type="summary")
+            if "Error" in global_summary:
+                print(f"[全书总结] 生成失败: {global_summary}")
+                return global_summary
+            self.summary_tree.set_book(global_summary, source)
+            settings = self.load_settings()
+            settings['book_summary'] = global_summary
+            self.save_settings(settings)
+            print(f"[全书总结] 完成，总纲长度: {len(global_summary)}")
             return global_summary
-        settings = self.load_settings()
-        settings['book_summary'] = global_summary
-        self.save_settings(settings)
-        print(f"[全书总结] 完成，总纲长度: {len(global_summary)}")
-        return global_summary
+
+    # 摘要层最多提供的本卷前情章节数
+    RAG_SUMMARY_CHAPTERS = 5
+
+    def summary_context(self, current_chapter_id):
+        """
+        由粗到细的前情摘要（检索的摘要层）：此前各分卷的摘要 + 本卷此前最近几章的章节摘要
+        只读取已生成的摘要，不调用模型
+
+        Returns:
+            [{"level": "volume"/"chapter", "id", "title", "text"}, ...]
+        """
+        structure = self.view_doc('structure')
+        current = next((c for c in structure if c['id'] == current_chapter_id), None)
+        current_volume = str(current.get('volume_id', 'vol_default')) if current else None
+        tiers = []
+        tree = self.summary_tree
+        for vol in self.view_doc('volumes'):
+            if str(vol['id']) == current_volume:
+                break
+            entry = tree.volume(vol['id'])
+            if entry and entry.get('summary'):
+                tiers.append({"level": "volume", "id": vol['id'], "title": vol.get('title', ''), "text": entry['summary']})
+        recent = [c for c in structure
+                  if str(c.get('volume_id', 'vol_default')) == current_volume
+                  and c['id'] < current_chapter_id and c.get('summary')]
+        for chap in recent[-self.RAG_SUMMARY_CHAPTERS:]:
+            tiers.append({"level": "chapter", "id": chap['id'], "title": chap.get('title', ''), "text": chap['summary']})
+        return tiers
+
+    @staticmethod
+    def format_summary_context(tiers):
+        lines = []
+        for tier in tiers:
+            label = f"[{tier['title'] or '分卷'}]" if tier['level'] == 'volume' else f"第{tier['id']}章"
+            lines.append(f"{label}: {tier['text']}")
+        return "\n".join(lines)
+    # ================= 全文检索 =================
+    # 设定、章节标题/大纲、正文段落与人物/物品/地点字段写入 bigram 倒排索引（search_index.db），
+    # 保存时增量更新；进程外的修改在查询前按存储签名发现并重建对应分组
+
+    @property
+    def search_index(self):
+        with self._search_lock:
+            if self._search_index is None:
+                self._search_index = NgramIndex(os.path.join(self.root_dir, "search_index.db"))
+            return self._search_index
+
+    def _search_docs(self, name, data):
+        """将项目文档展开为索引条目 {key: (text, meta)}"""
+        docs = {}
+        if name == 'settings':
+            for k, v in data.items():
+                if isinstance(v, str) and v:
+                    docs[f"setting:{k}"] = (v, {"type": "setting", "key": k})
+        elif name == 'structure':
+            for chap in data:
+                for field in ('title', 'outline'):
+                    v = chap.get(field)
+                    if isinstance(v, str) and v:
+                        docs[f"meta:{chap['id']}:{field}"] = (v, {"type": "chap_meta", "id": chap['id'], "field": field})
+        else:
+            kind = {'characters': 'char', 'items': 'item', 'locations': 'loc'}[name]
+            for i, entry in enumerate(data):
+                for k, v in entry.items():
+                    if isinstance(v, str) and v:
+                        docs[f"{kind}:{i}:{k}"] = (v, {"type": kind, "index": i, "field": k, "name": entry.get('name', '')})
+        return docs
+
+    def _index_doc(self, name, data):
+        """项目文档保存后同步索引；事务中签名尚未确定，只标记过期"""
+        group = next((g for g, n in self.SEARCH_DOC_GROUPS.items() if n == name), None)
+        if group is None:
+            return
+        try:
+            if self.store.in_transaction:
+                self.search_index.set_signature(group, None)
+            else:
+                self.search_index.sync_group(group, self._search_docs(name, data), self.store.doc_signature(name))
+        except Exception as e:
+            print(f"[Search] 索引更新失败 ({name}): {e}")
+
+    def _index_chapter(self, chapter_id, paragraphs):
+        """章节正文保存后按段落同步索引（未改动的段落按哈希跳过）"""
+        group = f"chap:{chapter_id}"
+        try:
+            if self.store.in_transaction:
+                self.search_index.set_signature(group, None)
+                return
+            docs = {f"para:{chapter_id}:{p['id']}": (p['text'], {"type": "chap_content", "id": chapter_id, "pid": p['id']})
+                    for p in paragraphs if p.get('text')}
+            self.search_index.sync_group(group, docs, self.store.chapter_signature(chapter_id))
+        except Exception as e:
+            print(f"[Search] 索引更新失败 (第{chapter_id}章): {e}")
+
+    @staticmethod
+    def _same_signature(recorded, current):
+        return current is not None and recorded == json.loads(json.dumps(current))
+
+    def ensure_search_index(self):
+        """
+        校验索引与存储是否一致，重建过期的分组（首次使用时即全量建立）
+        返回重建的分组数
+        """
+        index = self.search_index
+        rebuilt = 0
+        with self._search_lock:
+            for group, name in self.SEARCH_DOC_GROUPS.items():
+                signature = self.store.doc_signature(name)
+                if not self._same_signature(index.get_signature(group), signature):
+                    index.sync_group(group, self._search_docs(name, self.view_doc(name)), signature)
+                    rebuilt += 1
+
+            live = set()
+            for chap in self.view_doc('structure'):
+                chapter_id = chap['id']
+                group = f"chap:{chapter_id}"
+                live.add(group)
+                signature = self.store.chapter_signature(chapter_id)
+                if self._same_signature(index.get_signature(group), signature):
+                    continue
+                with self._paragraph_lock:
+                    data = self.store.read_paragraph_doc(chapter_id)
+                    if data is not None:
+                        paragraphs = data.get('paragraphs', [])
+                    else:
+                        paragraphs = self.text_to_paragraphs(self.load_chapter_content(chapter_id))
+                    docs = {f"para:{chapter_id}:{p['id']}": (p['text'], {"type": "chap_content", "id": chapter_id, "pid": p['id']})
+                            for p in paragraphs if p.get('text')}
+                    index.sync_group(group, docs, signature)
+                rebuilt += 1
+
+            for group in index.groups("chap:"):
+                if group not in live:
+                    index.delete_group(group)
+        if rebuilt:
+            print(f"[Search] 已重建 {rebuilt} 个索引分组")
+        return rebuilt
+
+    def search(self, query, limit=50, literal=False):
+        """
+        全文检索：支持 "短语" 与空格分隔的多词（同一文档内同时出现）
+
+        Returns:
+            按相关度排序的命中列表，每项含 key/group/meta/score/count/positions/preview，
+            正文命中以段落为单位（meta 中含 id 与 pid）
+        """
+        if not query: return []
+        self.ensure_search_index()
+        return self.search_index.search(query, limit=limit, literal=literal)
+
     # 【新增】全局搜索
     def global_search(self, term):
         if not term: return []
         results = []
-        
-        # 1. 搜设定 (Settings)
-        settings = self.load_settings()
-        for k, v in settings.items():
-            if isinstance(v, str) and term in v:
-                results.append({"type": "setting", "key": k, "name": "系统设定", "preview": self._get_preview(v, term)})
-
-        # 2. 搜章节列表 (Title/Outline)
-        structure = self.load_structure()
-        for chap in structure:
-            if term in chap['title']:
-                results.append({"type": "chap_meta", "id": chap['id'], "field": "title", "name": f"第{chap['id']}章标题", "preview": chap['title']})
-            if term in chap['outline']:
-                results.append({"type": "chap_meta", "id": chap['id'], "field": "outline", "name": f"第{chap['id']}章大纲", "preview": self._get_preview(chap['outline'], term)})
-            
-            # 3. 搜章节正文 (Content)
-            content = self.load_chapter_content(chap['id'])
-            if term in content:
-                # 统计出现次数
-                count = content.count(term)
-                results.append({"type": "chap_content", "id": chap['id'], "name": f"第{chap['id']}章正文", "preview": self._get_preview(content, term), "count": count})
-
-        # 4. 搜数据库 (Char/Item/Loc)
-        chars = self.load_characters()
-        for i, c in enumerate(chars):
-            for k, v in c.items():
-                if isinstance(v, str) and term in v:
-                    results.append({"type": "char", "index": i, "field": k, "name": f"人物: {c['name']}", "preview": self._get_preview(v, term)})
-        
-        items = self.load_items()
-        for i, it in enumerate(items):
-            for k, v in it.items():
-                if isinstance(v, str) and term in v:
-                    results.append({"type": "item", "index": i, "field": k, "name": f"物品: {it['name']}", "preview": self._get_preview(v, term)})
-                    
-        locs = self.load_locations()
-        for i, l in enumerate(locs):
-            for k, v in l.items():
-                if isinstance(v, str) and term in v:
-                    results.append({"type": "loc", "index": i, "field": k, "name": f"地点: {l['name']}", "preview": self._get_preview(v, term)})
+        chapter_hits = {}
+
+        for hit in self.search(term, limit=None, literal=True):
+            meta = hit['meta']
+            kind = meta['type']
+            if kind == 'setting':
+                results.append({"type": "setting", "key": meta['key'], "name": "系统设定", "preview": hit['preview']})
+            elif kind == 'chap_meta':
+                label = "标题" if meta['field'] == 'title' else "大纲"
+                results.append({"type": "chap_meta", "id": meta['id'], "field": meta['field'], "name": f"第{meta['id']}章{label}", "preview": hit['preview']})
+            elif kind == 'chap_content':
+                # 正文按段落命中，合并为每章一条
+                entry = chapter_hits.get(meta['id'])
+                if entry is None:
+                    entry = {"type": "chap_content", "id": meta['id'], "name": f"第{meta['id']}章正文", "preview": hit['preview'], "count": 0}
+                    chapter_hits[meta['id']] = entry
+                    results.append(entry)
+                entry['count'] += hit['count']
+            else:
+                label = {"char": "人物", "item": "物品", "loc": "地点"}[kind]
+                results.append({"type": kind, "index": meta['index'], "field": meta['field'], "name": f"{label}: {meta['name']}", "preview": hit['preview']})
 
         return results
 
-    # 辅助：获取带高亮的预览片段
-    def _get_preview(self, text, term, window=20):
-        idx = text.find(term)
-        if idx == -1: return text[:50]
-        start = max(0, idx - window)
-        end = min(len(text), idx + len(term) + window)
-        return f"...{text[start:end]}..."
-
     # 【新增】全局替换
-    def global_replace(self, target_items, old_term, new_term):
-        # 为了安全，重新加载所有数据
-        settings = self.load_settings()
-        structure = self.load_structure()
-        chars = self.load_characters()
-        items = self.load_items()
-        locs = self.load_locations()
-        
-        updated_files = set() # 记录哪些文件被修改了
-        
-        for item in target_items:
-            try:
-                if item['type'] == 'setting':
-                    settings[item['key']] = settings[item['key']].replace(old_term, new_term)
-                    updated_files.add('settings')
-                
-                elif item['type'] == 'chap_meta':
-                    for chap in structure:
-                        if chap['id'] == item['id']:
-                            chap[item['field']] = chap[item['field']].replace(old_term, new_term)
-                            updated_files.add('structure')
-                            break
-                
-                elif item['type'] == 'chap_content':
-                    # 正文是单独的文件，直接读取-替换-保存
-                    content = self.load_chapter_content(item['id'])
-                    new_content = content.replace(old_term, new_term)
-                    self.save_chapter_content(item['id'], new_content)
-                    # 还需要更新向量库吗？理论上需要，但太慢了，建议用户手动触发或后台慢慢更。
-                    # 这里为了速度暂不更新RAG，只更文件。
-                
-                elif item['type'] == 'char':
-                    chars[item['index']][item['field']] = chars[item['index']][item['field']].replace(old_term, new_term)
-                    updated_files.add('char')
-                
-                elif item['type'] == 'item':
-                    items[item['index']][item['field']] = items[item['index']][item['field']].replace(old_term, new_term)
-                    updated_files.add('item')
-                
-                elif item['type'] == 'loc':
-                    locs[item['index']][item['field']] = locs[item['index']][item['field']].replace(old_term, new_term)
-                    updated_files.add('loc')
+    # 全局搜索结果类型 -> 所在文档
+    REPLACE_DOC_TYPES = {'setting': 'settings', 'chap_meta': 'structure', 'char': 'characters',
+                         'item': 'items', 'loc': 'locations'}
+    # 全局替换每个事务处理的章节数：事务期间存储锁被占用，分批提交使自动保存、读取只需等待一批
+    REPLACE_BATCH_CHAPTERS = 10
 
+    def global_replace(self, target_items, old_term, new_term, progress_callback=None):
+        """
+        全局替换（分批事务）
+        设定/结构/人物/物品/地点只加载涉及的文档，在一个事务中提交；正文逐章读取、按段落替换，
+        内存中只保留当前一章，每 REPLACE_BATCH_CHAPTERS 章一个事务。
+        事务内存储锁被占用，分批后其他会话的自动保存、读取最多等待一批；
+        某批出错时该批整体放弃（不会留下改了一半的章节），之前已提交的批次保留并如实返回。
+
+        Args:
+            target_items: global_search 返回的条目（可只选其中一部分）
+            old_term: 查找内容
+            new_term: 替换为
+            progress_callback: 进度回调 (done, total, message)，在工作线程中调用
+
+        Returns:
+            (提示信息, 正文被修改的章节ID列表)，后者用于增量更新向量库
+        """
+        if not old_term: return "查找内容为空", []
+        doc_targets = [t for t in target_items if t['type'] in self.REPLACE_DOC_TYPES]
+        chapter_ids = list(dict.fromkeys(t['id'] for t in target_items if t['type'] == 'chap_content'))
+        total = len(chapter_ids) + (1 if doc_targets else 0)
+        report = progress_callback or (lambda done, total, message: None)
+
+        replaced = 0
+        changed_chapters = []
+        try:
+            with self.transaction():
+                # 1. 设定与各类实体：每个文档只加载、保存一次
+                docs, dirty = {}, set()
+                for item in doc_targets:
+                    name = self.REPLACE_DOC_TYPES[item['type']]
+                    if name not in docs:
+                        docs[name] = thaw_json(self.view_doc(name))
+                    data = docs[name]
+                    try:
+                        if item['type'] == 'setting':
+                            container, field = data, item['key']
+                        elif item['type'] == 'chap_meta':
+                            container, field = next(c for c in data if c['id'] == item['id']), item['field']
+                        else:
+                            container, field = data[item['index']], item['field']
+                    except (StopIteration, IndexError, KeyError):
+                        print(f"[Replace] 目标已不存在，跳过: {item}")
+                        continue
+                    value = container.get(field)
+                    if isinstance(value, str) and old_term in value:
+                        replaced += value.count(old_term)
+                        container[field] = value.replace(old_term, new_term)
+                        dirty.add(name)
+                for name in dirty:
+                    if name == 'structure':
+                        self.save_structure(docs[name])
+                    else:
+                        self._save_doc(name, docs[name])
+                docs.clear()
+        except Exception as e:
+            print(f"[Replace] 替换失败，已回滚: {e}")
+            return f"替换失败，未做任何修改: {e}", []
+        if doc_targets:
+            report(1, total, "设定与资料")
+
+        # 2. 正文：逐章替换，只写入包含查找内容的段落；分批提交
+        done = 1 if doc_targets else 0
+        for start in range(0, len(chapter_ids), self.REPLACE_BATCH_CHAPTERS):
+            batch = chapter_ids[start:start + self.REPLACE_BATCH_CHAPTERS]
+            batch_replaced, batch_changed = 0, []
+            try:
+                with self.transaction():
+                    for chapter_id in batch:
+                        count = self._replace_in_chapter(chapter_id, old_term, new_term)
+                        if count:
+                            batch_replaced += count
+                            batch_changed.append(chapter_id)
             except Exception as e:
-                print(f"Replace error at {item}: {e}")
-
-        # 批量保存
-        if 'settings' in updated_files: self.save_settings(settings)
-        if 'structure' in updated_files: self.save_structure(structure)
-        if 'char' in updated_files: self.save_characters(chars)
-        if 'item' in updated_files: self.save_items(items)
-        if 'loc' in updated_files: self.save_locations(locs)
-        
-        return f"已在 {len(target_items)} 处完成替换"
+                print(f"[Replace] 第{batch[0]}~{batch[-1]}章替换失败，该批已回滚: {e}")
+                if not replaced:
+                    return f"替换失败，未做任何修改: {e}", []
+                return (f"替换中断：已在 {replaced} 处完成替换，第{batch[0]}章起的正文未修改: {e}",
+                        changed_chapters)
+            replaced += batch_replaced
+            changed_chapters.extend(batch_changed)
+            done += len(batch)
+            report(done, total, f"第{batch[-1]}章")
+
+        print(f"[Replace] '{old_term}' -> '{new_term}': {replaced} 处，涉及正文 {len(changed_chapters)} 章")
+        return f"已在 {replaced} 处完成替换", changed_chapters
+
+    def _replace_in_chapter(self, chapter_id, old_term, new_term):
+        """在单章正文中替换，返回替换次数"""
+        with self._paragraph_lock:
+            _, sequence = self._paragraph_state(chapter_id)
+            if '\n' in old_term or '\n' in new_term:
+                # 查找内容跨段落：按整章文本替换
+                text = self.paragraphs_to_text(sequence.items)
+                count = text.count(old_term)
+                if count:
+                    self.save_chapter_text(chapter_id, text.replace(old_term, new_term))
+                return count
+            updates = {p['id']: p['text'].replace(old_term, new_term) for p in sequence if old_term in p['text']}
+            count = sum(p['text'].count(old_term) for p in sequence if p['id'] in updates)
+            if updates:
+                self.update_paragraphs(chapter_id, updates)
+            return count
     
-    # 1. 创建全项目备份 (ZIP)
-    def create_project_backup(self, backup_dir="backups"):
-        try:
-            if not os.path.exists(backup_dir): os.makedirs(backup_dir)
-
-            # 生成带时间戳的文件名
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            filename = f"novel_backup_{timestamp}"
-            archive_path = os.path.join(backup_dir, filename)
-
-            # 打包当前项目目录
-            if os.path.exists(self.root_dir):
-                shutil.make_archive(archive_path, 'zip', self.root_dir)
-
-                # 清理旧备份 (只保留最近 20 个)
-                backups = sorted(glob.glob(os.path.join(backup_dir, "*.zip")))
-                if len(backups) > 20:
-                    for b in backups[:-20]:
-                        try: os.remove(b)
-                        except OSError: pass
-                return f"已备份: {filename}.zip"
+    # 1. 创建全项目备份（增量）
+    # 备份库位于 backups/{书名}/，每次只存变化的文件分块，任意一次备份均可完整还原
+    def _backup_engine(self, backup_dir="backups"):
+        book_name = os.path.basename(os.path.normpath(self.root_dir))
+        return BackupEngine(self.root_dir, os.path.join(backup_dir, book_name), lock=self.store.lock)
+
+    def create_project_backup(self, backup_dir="backups", throttle=False):
+        if not os.path.exists(self.root_dir):
             return "数据目录不存在，跳过备份"
+        if not self._backup_lock.acquire(blocking=False):
+            return "已有备份正在进行，跳过"
+        try:
+            result = self._backup_engine(backup_dir).create_backup(
+                keep=int(CFG.get('backup_keep', 20)), throttle=throttle)
+            return f"已备份: {result['id']}（{result['changed']} 个文件有变化，新增 {result['new_bytes'] // 1024} KB）"
         except Exception as e:
             return f"备份失败: {str(e)}"
+        finally:
+            self._backup_lock.release()
+
+    def start_project_backup(self):
+        """
+        在低优先级后台线程中执行增量备份，立即返回
+        不占用 run.io_bound 线程池，读取时按读取量让出时间，不与自动保存争抢
+        进度见 self.backup_status；已有备份在运行时返回 False
+        """
+        if self.backup_status.get('running'):
+            return False
+        self.backup_status = {"running": True, "message": ""}
+
+        def worker():
+            lower_thread_priority()
+            message = self.create_project_backup(throttle=True)
+            print(f"[Backup] {message}")
+            self.backup_status = {"running": False, "message": message}
+
+        threading.Thread(target=worker, name="project-backup", daemon=True).start()
+        return True
+
+    def list_project_backups(self, backup_dir="backups"):
+        """备份列表（新的在前）"""
+        return self._backup_engine(backup_dir).list_backups()
+
+    def restore_project_backup(self, backup_id, target_dir=None, backup_dir="backups"):
+        """
+        将备份还原为一个新的项目目录（不覆盖当前项目）
+        返回 (是否成功, 提示信息)
+        """
+        if target_dir is None:
+            book_name = os.path.basename(os.path.normpath(self.root_dir))
+            target_dir = os.path.join(os.path.dirname(os.path.normpath(self.root_dir)), f"{book_name}_restore_{backup_id}")
+        return self._backup_engine(backup_dir).restore(backup_id, target_dir)
 
     # 2. 创建章节快照 (History Snapshot)
+    # 快照存于内容寻址的对象库：相同内容只存一份，后续版本按差量压缩存储
+    @property
+    def snapshots(self):
+        if self._snapshots is None:
+            self._snapshots = SnapshotStore(os.path.join(self.root_dir, "snapshots"))
+        return self._snapshots
+
     def create_chapter_snapshot(self, chapter_id, content):
         try:
-            snapshot_dir = os.path.join(self.root_dir, "snapshots", str(chapter_id))
-            if not os.path.exists(snapshot_dir): os.makedirs(snapshot_dir)
-            
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            filepath = os.path.join(snapshot_dir, f"{timestamp}.txt")
-            
-            with open(filepath, 'w', encoding='utf-8') as f:
-                f.write(content)
-            
-            # 单章只保留最近 50 个快照，防止文件爆炸
-            files = sorted(glob.glob(os.path.join(snapshot_dir, "*.txt")))
-            if len(files) > 50:
-                for f in files[:-50]:
-                    try: os.remove(f)
-                    except OSError: pass
+            self.snapshots.add(chapter_id, content)
         except Exception as e:
             print(f"Snapshot error: {e}")
 
     # 3. 获取章节快照列表
     def get_chapter_snapshots(self, chapter_id):
-        snapshot_dir = os.path.join(self.root_dir, "snapshots", str(chapter_id))
-        if not os.path.exists(snapshot_dir): return []
+        """快照列表（新的在前），每项含 id/time/raw_ts/size/preview"""
+        return self.snapshots.list_snapshots(chapter_id)
 
-        snapshots = []
-        files = sorted(glob.glob(os.path.join(snapshot_dir, "*.txt")), reverse=True)
-        for f in files:
-            ts_str = os.path.basename(f).replace(".txt", "")
-            try:
-                dt = datetime.strptime(ts_str, "%Y%m%d_%H%M%S")
-                display_time = dt.strftime("%Y-%m-%d %H:%M:%S")
-            except ValueError:
-                display_time = ts_str
-
-            try:
-                with open(f, 'r', encoding='utf-8') as file:
-                    preview = file.read(100).replace("\n", " ") + "..."
-            except (FileNotFoundError, PermissionError, OSError):
-                preview = "无法读取内容"
-                
-            snapshots.append({"filename": f, "time": display_time, "preview": preview, "raw_ts": ts_str})
-        return snapshots
+    def read_chapter_snapshot(self, snapshot_id):
+        """读取快照全文，失败时返回 None"""
+        return self.snapshots.read(snapshot_id)
     # ================= 🎲 灵感生成 (新增) =================
 
     def generate_ideas(self, type_key, context=""):
@@ -1718,61 +2259,438 @@ def generate_toolbox_content(tool_id: str, params: dict) -> str:
 
 
 # ================= 向量库管理器 (RAG) =================
+# 倒数排名融合（RRF）的平滑常数
+RRF_K = 60
+# 只被词法召回的分块：得分达到查询满分的此比例才视为有效命中（见 NgramIndex.rank 的 match）
+LEXICAL_MIN_MATCH = 0.5
+# 不超过此长度的问句（人名、功法名等实体）在分块中原样出现也视为有效命中
+LEXICAL_PHRASE_MAX = 16
+
 class MemoryManager:
     def __init__(self, book_name="default"):
-        self.root_dir = "chroma_db_storage" 
-        if not os.path.exists(self.root_dir): os.makedirs(self.root_dir)
-        
-        self.client = chromadb.PersistentClient(path=self.root_dir)
-        self.embedding_fn = embedding_functions.DefaultEmbeddingFunction()
-        
-        # 【修复核心】使用 MD5 哈希生成合法的 Collection 名称
-        # 无论 book_name 是中文、英文还是特殊字符，hash 永远是合法的字母数字组合
-        hash_object = hashlib.md5(book_name.encode('utf-8'))
-        hex_dig = hash_object.hexdigest() # 生成类似 'e10adc3949ba59abbe56e057f20f883e'
-        
-        # 加上前缀，确保以字母开头 (ChromaDB 要求)
-        safe_name = f"novel_{hex_dig}"
-        
-        # 打印一下，方便调试看到中文书名对应什么哈希
-        print(f"[RAG] 书籍 '{book_name}' 对应向量库: {safe_name}")
+        # 客户端与嵌入模型由进程内的向量服务统一持有，切换书籍只取集合句柄
+        # 集合名为书名的 MD5（任意书名都合法），见 vector_service.collection_name
+        self.service = get_vector_service(workers=CFG.get('embedding_workers'),
+                                          cache_mb=CFG.get('embedding_cache_mb'))
+        self.root_dir = self.service.db_path
+        self.client = self.service.client
+        self.collection = self.service.collection(book_name)
+        stats = self.service.stats()
+        print(f"[RAG] 向量服务: 已打开 {stats['collections']} 个向量库，进程内存 {stats['rss_mb']} MB")
+
+        # 书架清单中记录本书的向量条目数
+        self.book_name = book_name
+        self.library = get_library_manifest(CFG.get('project_base_dir', 'projects'))
+
+        # 持久化的后台索引队列：保存只登记章节ID，切片与嵌入由工作线程完成
+        # 队列文件与向量库放在一起，重启后由 attach_loader 继续处理遗留任务
+        self._load_paragraphs = None
+        self._chapter_volumes = None
+        self.ingest = IngestQueue(os.path.join(self.root_dir, "ingest_queue.db"),
+                                  collection_name(book_name), self._ingest_chapter,
+                                  workers=CFG.get('ingest_workers') or 2)
+        pending = self.ingest.pending_count()
+        if pending:
+            print(f"[RAG] 上次退出时有 {pending} 章未完成索引，加载完成后继续")
+
+        # 与向量库并行的词法索引（bigram BM25），分块ID与元数据和集合一致，检索时按 RRF 融合
+        self.lexical = NgramIndex(lexical_index_path(book_name, self.root_dir))
+        self._lexical_lock = threading.Lock()
+        self._lexical_checked = False
+
+    def _split_chunks(self, content, paragraphs=None):
+        """
+        按段落装箱切片（chunk_size 为每片的 token 预算，片间不重叠）
+        paragraphs 为 load_chapter_paragraphs 的结果；缺省时按空行从 content 切分（切片不带段落ID）
+        返回: [{"text", "paragraph_ids", "start", "end"}, ...]
+        """
+        if paragraphs is None:
+            paragraphs = text_to_simple_paragraphs(content)
+        return chunk_paragraphs(paragraphs, budget=CFG.get('chunk_size', 500))
+
+    @staticmethod
+    def _chunk_ids(chapter_id, chunks):
+        """分块ID = 章节ID + 内容哈希；同章内重复的分块追加序号区分"""
+        ids, seen = [], {}
+        for chunk in chunks:
+            digest = hashlib.sha1(chunk['text'].encode('utf-8')).hexdigest()[:16]
+            n = seen[digest] = seen.get(digest, -1) + 1
+            ids.append(f"ch_{chapter_id}_{digest}" + (f"_{n}" if n else ""))
+        return ids
+
+    @staticmethod
+    def _chunk_metadata(chapter_id, index, chunk, volume_id=None):
+        # Chroma 元数据只接受标量，段落ID以逗号连接；chapter_id 保持数值，便于按范围过滤
+        meta = {
+            "chapter_id": chapter_id,
+            "chunk_index": index,
+            "paragraph_ids": ",".join(chunk['paragraph_ids']),
+            "char_start": chunk['start'],
+            "char_end": chunk['end']
+        }
+        if volume_id is not None:
+            meta["volume_id"] = str(volume_id)
+        return meta
 
-        self.collection = self.client.get_or_create_collection(
-            name=safe_name, 
-            embedding_function=self.embedding_fn
-        )
+    def _volume_of(self, chapter_id):
+        if self._chapter_volumes is None:
+            return None
+        try:
+            return self._chapter_volumes().get(chapter_id)
+        except Exception as e:
+            print(f"[RAG Error] 读取章节分卷失败: {e}")
+            return None
+
+    def add_chapter_memory(self, chapter_id, content, paragraphs=None):
+        """保存章节时更新记忆（增量，只嵌入新分块）"""
+        return self.update_chapter_memory(chapter_id, content, paragraphs)
 
-    def add_chapter_memory(self, chapter_id, content):
+    def _rewrite_chapter_memory(self, chapter_id, chunks, ids):
+        """整章重写（读取已有分块失败时的兜底）"""
         self.delete_chapter_memory(chapter_id)
-        chunk_size = CFG.get('chunk_size', 500)
-        step = chunk_size - CFG.get('overlap', 100)
-        chunks = [content[i:i+chunk_size] for i in range(0, len(content), step) if len(content[i:i+chunk_size]) > 50]
-        if not chunks: return
-        ids = [f"ch_{chapter_id}_{i}" for i in range(len(chunks))]
-        metadatas = [{"chapter_id": chapter_id, "chunk_index": i} for i in range(len(chunks))]
-        self.collection.upsert(documents=chunks, metadatas=metadatas, ids=ids)
+        volume_id = self._volume_of(chapter_id)
+        metadatas = [self._chunk_metadata(chapter_id, i, c, volume_id) for i, c in enumerate(chunks)]
+        if chunks:
+            documents = [c['text'] for c in chunks]
+            self.collection.upsert(
+                documents=documents,
+                embeddings=self.service.embed(documents),
+                metadatas=metadatas,
+                ids=ids)
+        self._sync_lexical(chapter_id, [c['text'] for c in chunks], ids, metadatas)
+        self._report_size()
+        return len(chunks)
+
+    def _sync_lexical(self, chapter_id, documents, ids, metadatas):
+        """把本章分块同步到词法索引（按内容哈希跳过未变化的分块）"""
+        try:
+            self.lexical.sync_group(f"ch:{chapter_id}", {
+                chunk_id: (doc, meta) for chunk_id, doc, meta in zip(ids, documents, metadatas)})
+        except Exception as e:
+            print(f"[RAG Error] 词法索引更新失败: {e}")
+
+    def _ensure_lexical(self):
+        """词法索引与集合条目数不一致时（旧版本建的库、中途退出）从集合整体回填，每个实例只检查一次"""
+        with self._lexical_lock:
+            if self._lexical_checked:
+                return
+            self._lexical_checked = True
+            try:
+                if self.lexical.doc_count() == self.collection.count():
+                    return
+                data = self.collection.get(include=['documents', 'metadatas'])
+                groups = {}
+                for chunk_id, doc, meta in zip(data['ids'], data['documents'], data['metadatas']):
+                    groups.setdefault(f"ch:{meta.get('chapter_id')}", {})[chunk_id] = (doc, meta)
+                for group in self.lexical.groups("ch:"):
+                    if group not in groups:
+                        self.lexical.delete_group(group)
+                for group, docs in groups.items():
+                    self.lexical.sync_group(group, docs)
+                print(f"[RAG] 词法索引已回填 {len(data['ids'])} 个分块")
+            except Exception as e:
+                print(f"[RAG Error] 词法索引回填失败: {e}")
+
+    def _report_size(self):
+        """把向量条目数写入书架清单（数值不变时不写盘）"""
+        try:
+            self.library.update(self.book_name, vector_count=self.collection.count())
+        except Exception as e:
+            print(f"[RAG Error] {e}")
+
+    def update_chapter_memory(self, chapter_id, content, paragraphs=None):
+        """
+        增量更新章节记忆（分块以内容哈希为ID）
+        - 新出现的分块：合并为一次嵌入调用后写入
+        - 只是位置变化的分块：仅更新元数据（序号、段落ID、偏移、分卷），不重新嵌入
+        - 不再出现的分块（含旧版按序号命名的分块）：删除
+        返回重新嵌入的分块数
+        """
+        chunks = self._split_chunks(content, paragraphs)
+        ids = self._chunk_ids(chapter_id, chunks)
+        try:
+            existing = self.collection.get(where={"chapter_id": chapter_id}, include=['metadatas'])
+        except Exception as e:
+            print(f"[RAG Error] {e}")
+            return self._rewrite_chapter_memory(chapter_id, chunks, ids)
+
+        old = dict(zip(existing['ids'], existing['metadatas']))
+        volume_id = self._volume_of(chapter_id)
+        metadatas = [self._chunk_metadata(chapter_id, i, c, volume_id) for i, c in enumerate(chunks)]
+        added = [i for i, chunk_id in enumerate(ids) if chunk_id not in old]
+        moved = [i for i, chunk_id in enumerate(ids) if chunk_id in old and old[chunk_id] != metadatas[i]]
+        current = set(ids)
+        stale = [chunk_id for chunk_id in old if chunk_id not in current]
+
+        if added:
+            documents = [chunks[i]['text'] for i in added]
+            self.collection.upsert(
+                documents=documents,
+                embeddings=self.service.embed(documents),
+                metadatas=[metadatas[i] for i in added],
+                ids=[ids[i] for i in added])
+        if moved:
+            self.collection.update(
+                ids=[ids[i] for i in moved],
+                metadatas=[metadatas[i] for i in moved])
+        if stale:
+            self.collection.delete(ids=stale)
+        self._sync_lexical(chapter_id, [c['text'] for c in chunks], ids, metadatas)
+        if added or stale:
+            self._report_size()
+        return len(added)
+
+    def attach_loader(self, load_paragraphs, chapter_volumes=None):
+        """
+        设置章节段落的读取函数并开始处理索引队列（含上次退出时遗留的任务）
+        load_paragraphs: chapter_id -> 段落列表，处理到该章时才读取，队列不占用正文内存
+        chapter_volumes: () -> {chapter_id: volume_id}，分块元数据据此记录所属分卷
+        """
+        self._load_paragraphs = load_paragraphs
+        if chapter_volumes is not None:
+            self._chapter_volumes = chapter_volumes
+        self.ingest.resume()
+
+    def queue_chapter_updates(self, chapter_ids, load_paragraphs=None):
+        """
+        将章节登记到后台索引队列，立即返回
+        同一章在处理前多次登记只处理一次（处理时读取最新内容）
+        """
+        if load_paragraphs is not None and self._load_paragraphs is None:
+            self.attach_loader(load_paragraphs)
+        self.ingest.enqueue(chapter_ids)
+
+    def pending_chapters(self):
+        """索引尚未跟上的章节数"""
+        return self.ingest.pending_count()
+
+    def _ingest_chapter(self, chapter_id):
+        """索引队列的处理函数：按章节最新段落增量更新（异常交给队列重试）"""
+        n = self.update_chapter_memory(chapter_id, None, self._load_paragraphs(chapter_id))
+        print(f"[RAG] 第{chapter_id}章已增量更新，重新嵌入 {n} 个分块")
 
     def delete_chapter_memory(self, chapter_id):
         try: self.collection.delete(where={"chapter_id": chapter_id})
         except Exception as e: print(f"[RAG Error] {e}")
+        try: self.lexical.delete_group(f"ch:{chapter_id}")
+        except Exception as e: print(f"[RAG Error] {e}")
+        self._report_size()
+
+    def query_related_memory(self, query_text, n_results=5, threshold=1.5, exclude_chapter_id=None, where=None):
+        hits = self.query_many([query_text], n_results, threshold, exclude_chapter_id, where)[0]
+        return [h['text'] for h in hits if h['valid']], hits
+
+    @staticmethod
+    def chapter_scope(before_chapter_id=None, skip_recent=0, volume_id=None):
+        """
+        构造检索范围的元数据过滤条件（Chroma where 语法）
+
+        Args:
+            before_chapter_id: 只检索早于该章的分块
+            skip_recent: 同时跳过 before_chapter_id 之前最近的几章
+            volume_id: 只检索该分卷的分块
+
+        Returns:
+            where 字典；无限制时为 None
+        """
+        clauses = []
+        if before_chapter_id is not None:
+            clauses.append({"chapter_id": {"$lt": before_chapter_id - max(int(skip_recent), 0)}})
+        if volume_id is not None:
+            clauses.append({"volume_id": str(volume_id)})
+        if not clauses:
+            return None
+        return clauses[0] if len(clauses) == 1 else {"$and": clauses}
+
+    @classmethod
+    def _match_where(cls, meta, where):
+        """在词法索引一侧按同一 where 条件过滤（支持 $and/$or 与常用比较运算符）"""
+        if not where:
+            return True
+        meta = meta or {}
+        for key, cond in where.items():
+            if key == "$and":
+                if not all(cls._match_where(meta, c) for c in cond): return False
+                continue
+            if key == "$or":
+                if not any(cls._match_where(meta, c) for c in cond): return False
+                continue
+            value = meta.get(key)
+            ops = cond if isinstance(cond, dict) else {"$eq": cond}
+            for op, target in ops.items():
+                try:
+                    ok = {
+                        "$eq": lambda: value == target,
+                        "$ne": lambda: value != target,
+                        "$lt": lambda: value is not None and value < target,
+                        "$lte": lambda: value is not None and value <= target,
+                        "$gt": lambda: value is not None and value > target,
+                        "$gte": lambda: value is not None and value >= target,
+                        "$in": lambda: value in target,
+                        "$nin": lambda: value not in target,
+                    }[op]()
+                except (KeyError, TypeError):
+                    ok = False
+                if not ok:
+                    return False
+        return True
+
+    def sync_chapter_volumes(self, chapter_volumes):
+        """
+        按 {chapter_id: volume_id} 修正分块的分卷元数据（章节移动分卷、旧版本建的库），只改元数据不重新嵌入
+        返回修正的分块数
+        """
+        try:
+            data = self.collection.get(include=['documents', 'metadatas'])
+        except Exception as e:
+            print(f"[RAG Error] {e}")
+            return 0
+        chapters = {}
+        for chunk_id, doc, meta in zip(data['ids'], data['documents'], data['metadatas']):
+            chapters.setdefault(meta.get('chapter_id'), []).append((chunk_id, doc, meta))
+        total = 0
+        for chapter_id, rows in chapters.items():
+            volume_id = chapter_volumes.get(chapter_id)
+            if volume_id is None or all(meta.get('volume_id') == str(volume_id) for _, _, meta in rows):
+                continue
+            ids = [chunk_id for chunk_id, _, _ in rows]
+            metadatas = [dict(meta, volume_id=str(volume_id)) for _, _, meta in rows]
+            try:
+                self.collection.update(ids=ids, metadatas=metadatas)
+            except Exception as e:
+                print(f"[RAG Error] {e}")
+                continue
+            self._sync_lexical(chapter_id, [doc for _, doc, _ in rows], ids, metadatas)
+            total += len(ids)
+        if total:
+            print(f"[RAG] 已修正 {total} 个分块的分卷信息")
+        return total
+
+    @staticmethod
+    def _lexical_weight():
+        """词法检索在融合排序中的权重（0 为纯向量检索，1 为纯词法检索）"""
+        try:
+            return min(max(float(CFG.get('rag_lexical_weight', 0.5)), 0.0), 1.0)
+        except (TypeError, ValueError):
+            return 0.5
+
+    def query_many(self, queries, n_results=5, threshold=1.5, exclude_chapter_id=None, where=None):
+        """
+        批量混合检索：全部问句一次嵌入、一次集合查询，再与词法索引（BM25）的排名按 RRF 融合
+
+        Args:
+            queries: 问句列表（如本章大纲 + 各出场实体名）
+            n_results: 每个问句返回的条数
+            threshold: 向量距离阈值，小于该值的命中标记为 valid
+            exclude_chapter_id: 排除的章节（通常是正在写的章节）
+            where: 元数据过滤条件（Chroma where 语法，见 chapter_scope），向量库与词法索引两侧都在检索时过滤
+
+        Returns:
+            与 queries 等长的列表，每项为按融合得分降序的命中：
+            [{"id", "text", "score", "distance", "bm25", "chapter_id", "chunk_index", "paragraph_ids", "source", "valid"}, ...]
+            只被词法召回的分块 distance 为 None，只被向量召回的 bm25 为 None；
+            只被词法召回的分块须达到 LEXICAL_MIN_MATCH，或短问句（实体名）在文中原样出现，才视为 valid
+            同一问句内文本相同的分块只保留一条
+        """
+        results = [[] for _ in queries]
+        if not queries:
+            return results
+        weight = self._lexical_weight()
+        # 融合时两路各取两倍深度的候选，再截断到 n_results
+        depth = n_results * 2 if weight > 0 else n_results
+        clauses = [where] if where else []
+        if exclude_chapter_id is not None:
+            clauses.append({"chapter_id": {"$ne": exclude_chapter_id}})
+        where_filter = None if not clauses else clauses[0] if len(clauses) == 1 else {"$and": clauses}
+        try:
+            if self.collection.count() == 0: return results
+            raw = self.collection.query(query_embeddings=self.service.embed(list(queries)), n_results=depth,
+                                        include=['documents', 'distances', 'metadatas'], where=where_filter)
+        except Exception as e:
+            print(f"[RAG Error] {e}")
+            return results
+        if weight > 0:
+            self._ensure_lexical()
+
+        for i, query in enumerate(queries):
+            candidates = {}
+            dense = sorted(zip(raw['ids'][i], raw['documents'][i], raw['distances'][i], raw['metadatas'][i]),
+                           key=lambda r: r[2])
+            for rank, (chunk_id, doc, dist, meta) in enumerate(dense):
+                hit = candidates.setdefault(chunk_id, self._make_hit(chunk_id, doc, meta))
+                hit['distance'] = round(dist, 4)
+                hit['score'] += (1 - weight) / (RRF_K + rank + 1)
+            lexical = []
+            if weight > 0:
+                try:
+                    lexical = self.lexical.rank(
+                        query, depth, group_prefix="ch:",
+                        doc_filter=lambda m: self._match_where(m, where_filter))
+                except Exception as e:
+                    print(f"[RAG Error] 词法检索失败: {e}")
+            # 词法有效性按绝对标准判断：每个问句的第一名未必相关（可能只命中一个常见 bigram）
+            lexical_valid = set()
+            phrase = query.strip() if len(query.strip()) <= LEXICAL_PHRASE_MAX else None
+            for rank, item in enumerate(lexical):
+                hit = candidates.setdefault(item['key'], self._make_hit(item['key'], item['text'], item['meta'] or {}))
+                hit['bm25'] = item['score']
+                hit['score'] += weight / (RRF_K + rank + 1)
+                if item['match'] >= LEXICAL_MIN_MATCH or (phrase and phrase in item['text']):
+                    lexical_valid.add(item['key'])
+
+            seen = set()
+            for hit in sorted(candidates.values(), key=lambda h: h['score'], reverse=True):
+                if hit['text'] in seen:
+                    continue
+                seen.add(hit['text'])
+                hit['score'] = round(hit['score'], 6)
+                hit['valid'] = (hit['distance'] is not None and hit['distance'] < threshold) or \
+                    hit['id'] in lexical_valid
+                results[i].append(hit)
+                if len(results[i]) >= n_results:
+                    break
+        return results
+
+    @staticmethod
+    def _make_hit(chunk_id, doc, meta):
+        return {
+            "id": chunk_id,
+            "text": doc,
+            "score": 0.0,
+            "distance": None,
+            "bm25": None,
+            "chapter_id": meta.get('chapter_id'),
+            "chunk_index": meta.get('chunk_index'),
+            "paragraph_ids": [p for p in (meta.get('paragraph_ids') or '').split(',') if p],
+            "source": f"第{meta.get('chapter_id')}章",
+            "valid": False
+        }
 
-    def query_related_memory(self, query_text, n_results=5, threshold=1.5, exclude_chapter_id=None):
-        where_filter = None
-        if exclude_chapter_id is not None:
-            where_filter = {"chapter_id": {"$ne": exclude_chapter_id}}
-        try:
-            if self.collection.count() == 0: return [], []
-            results = self.collection.query(query_texts=[query_text], n_results=n_results, include=['documents', 'distances', 'metadatas'], where=where_filter)
-        except Exception as e: return [], []
+    @staticmethod
+    def merge_hits(results, limits=None):
+        """
+        合并 query_many 的多组结果：同一分块只保留一条（取最高得分，记录命中它的问句序号）
 
-        valid_docs = []
-        debug_info = []
-        if results['documents'] and results['documents'][0]:
-            for doc, dist, meta in zip(results['documents'][0], results['distances'][0], results['metadatas'][0]):
-                is_valid = dist < threshold
-                debug_info.append({"text": doc, "distance": round(dist, 4), "source": f"第{meta['chapter_id']}章", "valid": is_valid})
-                if is_valid: valid_docs.append(doc)
-        return valid_docs, debug_info
+        Args:
+            results: query_many 的返回值
+            limits: 每个问句最多取前几条（与 results 等长，None 表示不限）
+
+        Returns:
+            按得分降序的命中列表，每条额外带 "queries" 字段
+        """
+        merged = {}
+        for i, hits in enumerate(results):
+            limit = limits[i] if limits is not None else None
+            for hit in hits[:limit]:
+                key = hit['text']
+                if key not in merged:
+                    merged[key] = dict(hit, queries=[i])
+                    continue
+                entry = merged[key]
+                entry['queries'].append(i)
+                if hit['score'] > entry['score']:
+                    entry.update(hit, queries=entry['queries'])
+        return sorted(merged.values(), key=lambda h: h['score'], reverse=True)
 
 # ================= LLM 调用接口 =================
 
@@ -1887,73 +2805,121 @@ def sync_call_llm(prompt, system_prompt, task_type="writer", book_name=None):
 
     return "Error: 未知失败"
 
-def stream_call_llm(prompt, system_prompt, task_type="writer"):
-    """流式调用 LLM，返回生成器（同步生成器）"""
+async def async_call_llm(prompt, system_prompt, task_type="writer", book_name=None):
+    """sync_call_llm 的原生异步版本（共享连接池，重试等待不占用事件循环）"""
     model_name = get_model(task_type)
     temperature = get_temperature(task_type)
-    print(f"\n[LLM Router - Stream] 任务: {task_type} | 模型: {model_name}")
+    print(f"\n[LLM Router - Async] 任务: {task_type} | 模型: {model_name}")
+    print(f"[LLM Router - Async] Prompt 长度: {len(prompt)} | System 长度: {len(system_prompt)}")
 
-    # 累计输出内容用于计费
-    accumulated_content = []
+    max_retries = 3
+    retry_delay = 2
+
+    for attempt in range(max_retries):
+        try:
+            if attempt > 0:
+                print(f"[LLM Router - Async] 第 {attempt + 1} 次重试...")
+                await asyncio.sleep(retry_delay * attempt)
+
+            response = await get_async_client().chat.completions.create(
+                model=model_name,
+                messages=[{"role": "system", "content": system_prompt}, {"role": "user", "content": prompt}],
+                stream=False,
+                temperature=temperature
+            )
+            if not response.choices:
+                return "Error: API 返回空响应"
+            result = response.choices[0].message.content
+            if not result:
+                return "Error: API 返回空内容"
+
+            record_api_call(response, task_type, model_name, book_name=book_name, config_pricing=CFG.get('pricing', {}))
+            print(f"[LLM Router - Async] ✅ 成功，结果长度: {len(result)}")
+            return result
+
+        except ValueError as e:
+            error_type, retryable, detail = classify_error(e)
+            print(f"[LLM Router - Async] ❌ {error_type}: {detail}")
+            return f"Error [{error_type}]: {str(e)}"
+
+        except Exception as e:
+            error_type, retryable, detail = classify_error(e)
+            print(f"[LLM Router - Async] ❌ {error_type} (尝试 {attempt + 1}/{max_retries}): {detail}")
+            if not retryable or attempt == max_retries - 1:
+                return f"Error [{error_type}]: {str(e)}"
+
+    return "Error: 未知失败"
 
+async def _async_stream_messages(messages, task_type, billing_prompt):
+    """
+    原生异步流式调用：逐块 await 网络读取，不阻塞事件循环
+    调用方取消任务或提前关闭生成器时，立即关闭 HTTP 流；已生成部分照常计费
+    """
+    model_name = get_model(task_type)
+    temperature = get_temperature(task_type)
+    accumulated_content = []
+    stream = None
+    cancelled = False
     try:
-        current_client = get_client()
-        stream = current_client.chat.completions.create(
+        stream = await get_async_client().chat.completions.create(
             model=model_name,
-            messages=[{"role": "system", "content": system_prompt}, {"role": "user", "content": prompt}],
+            messages=messages,
             stream=True,
             temperature=temperature
         )
-        for chunk in stream:
+        async for chunk in stream:
             if chunk.choices and chunk.choices[0].delta.content:
                 content_piece = chunk.choices[0].delta.content
                 accumulated_content.append(content_piece)
                 yield content_piece
-
-        # 流式结束后记录费用（估算）
-        full_content = ''.join(accumulated_content)
-        estimate_and_record(
-            prompt=f"{system_prompt}\n{prompt}",
-            result=full_content,
-            task_type=task_type,
-            model=model_name,
-            config_pricing=CFG.get('pricing', {})
-        )
-        print("[LLM Router - Stream] 完成")
-
+    except (asyncio.CancelledError, GeneratorExit):
+        cancelled = True
+        print(f"[LLM Router - Async Stream] 已取消，已生成 {sum(len(p) for p in accumulated_content)} 字")
+        raise
     except ValueError as e:
-        print(f"[LLM Router - Stream] ValueError: {str(e)}")
         yield f"Error: {str(e)}"
     except Exception as e:
-        error_msg = str(e)
-        print(f"[LLM Router - Stream] Exception: {error_msg}")
-        yield f"Error: {error_msg}"
+        error_msg = f"Error: {str(e)}"
+        print(f"LLM异步流式调用失败: {error_msg}")
+        yield error_msg
+    finally:
+        if stream is not None and cancelled:
+            try:
+                await stream.close()
+            except Exception:
+                pass
+        if accumulated_content:
+            # 流式结束（或取消）后记录费用（估算）
+            estimate_and_record(
+                prompt=billing_prompt,
+                result=''.join(accumulated_content),
+                task_type=task_type,
+                model=model_name,
+                config_pricing=CFG.get('pricing', {})
+            )
 
-async def async_stream_call_llm(prompt, system_prompt, task_type="writer"):
-    """异步流式调用 LLM，返回异步生成器（适用于 NiceGUI）"""
+def stream_call_llm(prompt, system_prompt, task_type="writer"):
+    """流式调用 LLM，返回生成器（同步生成器）"""
     model_name = get_model(task_type)
     temperature = get_temperature(task_type)
-    print(f"\n[LLM Router - Async Stream] 任务: {task_type} | 模型: {model_name}")
+    print(f"\n[LLM Router - Stream] 任务: {task_type} | 模型: {model_name}")
 
     # 累计输出内容用于计费
     accumulated_content = []
 
     try:
         current_client = get_client()
-        stream = await asyncio.to_thread(
-            lambda: current_client.chat.completions.create(
-                model=model_name,
-                messages=[{"role": "system", "content": system_prompt}, {"role": "user", "content": prompt}],
-                stream=True,
-                temperature=temperature
-            )
+        stream = current_client.chat.completions.create(
+            model=model_name,
+            messages=[{"role": "system", "content": system_prompt}, {"role": "user", "content": prompt}],
+            stream=True,
+            temperature=temperature
         )
         for chunk in stream:
             if chunk.choices and chunk.choices[0].delta.content:
                 content_piece = chunk.choices[0].delta.content
                 accumulated_content.append(content_piece)
                 yield content_piece
-            await asyncio.sleep(0)  # 让出控制权
 
         # 流式结束后记录费用（估算）
         full_content = ''.join(accumulated_content)
@@ -1964,19 +2930,36 @@ async def async_stream_call_llm(prompt, system_prompt, task_type="writer"):
             model=model_name,
             config_pricing=CFG.get('pricing', {})
         )
+        print("[LLM Router - Stream] 完成")
 
     except ValueError as e:
+        print(f"[LLM Router - Stream] ValueError: {str(e)}")
         yield f"Error: {str(e)}"
     except Exception as e:
-        error_msg = f"Error: {str(e)}"
-        print(f"LLM异步流式调用失败: {error_msg}")
-        yield error_msg
+        error_msg = str(e)
+        print(f"[LLM Router - Stream] Exception: {error_msg}")
+        yield f"Error: {error_msg}"
+
+def async_stream_call_llm(prompt, system_prompt, task_type="writer"):
+    """异步流式调用 LLM，返回异步生成器（适用于 NiceGUI，网络读取不阻塞事件循环）"""
+    print(f"\n[LLM Router - Async Stream] 任务: {task_type} | 模型: {get_model(task_type)}")
+    messages = [{"role": "system", "content": system_prompt}, {"role": "user", "content": prompt}]
+    return _async_stream_messages(messages, task_type, f"{system_prompt}\n{prompt}")
+
+def _rewrite_prompt(selected_text, context_pre, context_post, instruction):
+    return f"【任务】重写文本。\n【上文】...{context_pre[-500:]}\n【待修改】{selected_text}\n【下文】{context_post[:500]}...\n【要求】{instruction}"
+
+def async_stream_rewrite_llm(selected_text, context_pre, context_post, instruction):
+    """局部重写的异步流式版本，返回异步生成器"""
+    prompt = _rewrite_prompt(selected_text, context_pre, context_post, instruction)
+    messages = [{"role": "system", "content": "专业编辑"}, {"role": "user", "content": prompt}]
+    return _async_stream_messages(messages, "editor", prompt)
 
 def sync_rewrite_llm(selected_text, context_pre, context_post, instruction, book_name=None):
     task_type = "editor"
     model_name = get_model(task_type)
     temperature = get_temperature(task_type)
-    prompt = f"【任务】重写文本。\n【上文】...{context_pre[-500:]}\n【待修改】{selected_text}\n【下文】{context_post[:500]}...\n【要求】{instruction}"
+    prompt = _rewrite_prompt(selected_text, context_pre, context_post, instruction)
     try:
         current_client = get_client()
         response = current_client.chat.completions.create(
@@ -2022,7 +3005,7 @@ def stream_rewrite_llm(selected_text, context_pre, context_post, instruction):
     task_type = "editor"
     model_name = get_model(task_type)
     temperature = get_temperature(task_type)
-    prompt = f"【任务】重写文本。\n【上文】...{context_pre[-500:]}\n【待修改】{selected_text}\n【下文】{context_post[:500]}...\n【要求】{instruction}"
+    prompt = _rewrite_prompt(selected_text, context_pre, context_post, instruction)
 
     # 累计输出内容用于计费
     accumulated_content = []
@@ -2305,98 +3288,91 @@ def sync_analyze_state(content, current_data_summary):
 
 # 【修改】应用变更：增加处理"地点连接"的逻辑
 def apply_state_changes(novel_manager, changes):
-    logs = []
+    # 人物、物品、地点在同一事务中写入，任一步出错都不会留下半更新的状态
+    with novel_manager.transaction():
+        logs = []
     
-    # 1. 更新人物 (保持不变)
-    chars = novel_manager.load_characters()
-    for update in changes.get('char_updates', []):
-        for char in chars:
-            if char['name'] == update['name']:
-                char[update['field']] = update['new_value']
-                logs.append(f"更新人物 [{char['name']}]: {update['field']} -> {update['new_value']}")
+        # 1. 更新人物 (保持不变)
+        chars = novel_manager.load_characters()
+        for update in changes.get('char_updates', []):
+            for char in chars:
+                if char['name'] == update['name']:
+                    char[update['field']] = update['new_value']
+                    logs.append(f"更新人物 [{char['name']}]: {update['field']} -> {update['new_value']}")
     
-    for new_char in changes.get('new_chars', []):
-        if not any(c['name'] == new_char['name'] for c in chars):
-            if 'relations' not in new_char: new_char['relations'] = []
-            chars.append(new_char)
-            logs.append(f"新增人物: {new_char['name']}")
+        for new_char in changes.get('new_chars', []):
+            if not any(c['name'] == new_char['name'] for c in chars):
+                if 'relations' not in new_char: new_char['relations'] = []
+                chars.append(new_char)
+                logs.append(f"新增人物: {new_char['name']}")
             
-    for rel in changes.get('relation_updates', []):
-        source_char = next((c for c in chars if c['name'] == rel['source']), None)
-        if source_char:
-            existing_rel = next((r for r in source_char['relations'] if r['target'] == rel['target']), None)
-            if existing_rel:
-                existing_rel['type'] = rel['type']
-                logs.append(f"更新关系: {rel['source']} -> {rel['target']} ({rel['type']})")
-            else:
-                source_char['relations'].append({"target": rel['target'], "type": rel['type']})
-                logs.append(f"新增关系: {rel['source']} -> {rel['target']} ({rel['type']})")
+        for rel in changes.get('relation_updates', []):
+            source_char = next((c for c in chars if c['name'] == rel['source']), None)
+            if source_char:
+                existing_rel = next((r for r in source_char['relations'] if r['target'] == rel['target']), None)
+                if existing_rel:
+                    existing_rel['type'] = rel['type']
+                    logs.append(f"更新关系: {rel['source']} -> {rel['target']} ({rel['type']})")
+                else:
+                    source_char['relations'].append({"target": rel['target'], "type": rel['type']})
+                    logs.append(f"新增关系: {rel['source']} -> {rel['target']} ({rel['type']})")
     
-    novel_manager.save_characters(chars)
-
-    # 2. 更新物品 (保持不变)
-    items = novel_manager.load_items()
-    for update in changes.get('item_updates', []):
-        for item in items:
-            if item['name'] == update['name']:
-                item[update['field']] = update['new_value']
-                logs.append(f"更新物品 [{item['name']}]: {update['field']} -> {update['new_value']}")
-    for new_item in changes.get('new_items', []):
-        if not any(i['name'] == new_item['name'] for i in items):
-            # 【关键修复】补全默认字段，防止前端渲染时因缺少字段而报错！
-            if 'owner' not in new_item: 
-                new_item['owner'] = '未知'
-            if 'desc' not in new_item: 
-                new_item['desc'] = 'AI自动提取'
+        novel_manager.save_characters(chars)
+
+        # 2. 更新物品 (保持不变)
+        items = novel_manager.load_items()
+        for update in changes.get('item_updates', []):
+            for item in items:
+                if item['name'] == update['name']:
+                    item[update['field']] = update['new_value']
+                    logs.append(f"更新物品 [{item['name']}]: {update['field']} -> {update['new_value']}")
+        for new_item in changes.get('new_items', []):
+            if not any(i['name'] == new_item['name'] for i in items):
+                # 【关键修复】补全默认字段，防止前端渲染时因缺少字段而报错！
+                if 'owner' not in new_item: 
+                    new_item['owner'] = '未知'
+                if 'desc' not in new_item: 
+                    new_item['desc'] = 'AI自动提取'
                 
-            items.append(new_item)
-            logs.append(f"新增物品: {new_item['name']}")
-    novel_manager.save_items(items)
+                items.append(new_item)
+                logs.append(f"新增物品: {new_item['name']}")
+        novel_manager.save_items(items)
 
-    # 3. 更新地点 (增加连接处理逻辑)
-    locs = novel_manager.load_locations()
+        # 3. 更新地点 (增加连接处理逻辑)
+        locs = novel_manager.load_locations()
     
-    # A. 先处理新地点 (防止连接时找不到地点)
-    for new_loc in changes.get('new_locs', []):
-        if not any(l['name'] == new_loc['name'] for l in locs):
-            if 'neighbors' not in new_loc: new_loc['neighbors'] = []
-            locs.append(new_loc)
-            logs.append(f"新增地点: {new_loc['name']}")
+        # A. 先处理新地点 (防止连接时找不到地点)
+        for new_loc in changes.get('new_locs', []):
+            if not any(l['name'] == new_loc['name'] for l in locs):
+                if 'neighbors' not in new_loc: new_loc['neighbors'] = []
+                locs.append(new_loc)
+                logs.append(f"新增地点: {new_loc['name']}")
     
-    # B. 处理连接关系
-    for conn in changes.get('loc_connections', []):
-        loc_a = next((l for l in locs if l['name'] == conn['source']), None)
-        loc_b = next((l for l in locs if l['name'] == conn['target']), None)
+        # B. 处理连接关系
+        for conn in changes.get('loc_connections', []):
+            loc_a = next((l for l in locs if l['name'] == conn['source']), None)
+            loc_b = next((l for l in locs if l['name'] == conn['target']), None)
         
-        if loc_a and loc_b:
-            # 确保有 neighbors 字段
-            if 'neighbors' not in loc_a: loc_a['neighbors'] = []
-            if 'neighbors' not in loc_b: loc_b['neighbors'] = []
+            if loc_a and loc_b:
+                # 确保有 neighbors 字段
+                if 'neighbors' not in loc_a: loc_a['neighbors'] = []
+                if 'neighbors' not in loc_b: loc_b['neighbors'] = []
             
-            # 双向添加 (避免重复)
-            added = False
-            if conn['target'] not in loc_a['neighbors']:
-                loc_a['neighbors'].append(conn['target'])
-                added = True
-            if conn['source'] not in loc_b['neighbors']:
-                loc_b['neighbors'].append(conn['source'])
-                added = True
+                # 双向添加 (避免重复)
+                added = False
+                if conn['target'] not in loc_a['neighbors']:
+                    loc_a['neighbors'].append(conn['target'])
+                    added = True
+                if conn['source'] not in loc_b['neighbors']:
+                    loc_b['neighbors'].append(conn['source'])
+                    added = True
             
-            if added:
-                logs.append(f"新增地图连接: {conn['source']} ↔️ {conn['target']}")
-
-    novel_manager.save_locations(locs)
+                if added:
+                    logs.append(f"新增地图连接: {conn['source']} ↔️ {conn['target']}")
 
-    return logs
+        novel_manager.save_locations(locs)
 
-def export_full_novel(novel_manager):
-    structure = novel_manager.load_structure()
-    full_text = [f"《AI 生成长篇小说》\n总字数：{novel_manager.get_total_word_count()}\n{'='*30}\n\n"]
-    for chap in structure:
-        title = f"第{chap['id']}章 {chap['title']}"
-        content = novel_manager.load_chapter_content(chap['id'])
-        full_text.extend([title, "-" * 20, content, "\n\n"])
-    return "\n".join(full_text)
+        return logs
 
 
 # ================= 分段审稿与重绘功能 =================
@@ -2535,51 +3511,32 @@ def sync_review_section(section_text, section_id, context_str):
     return {"error": "未知失败"}
 
 
-def sync_review_full_chapter_with_sections(content, context_str):
+def _section_reviews_report(section_reviews, section_count):
     """
-    分段审稿整章，返回完整的审稿报告
-    包含：整体评价 + 各部分详细意见
+    生成分段审稿的 Markdown 报告
+    section_reviews 按部分顺序排列，尚未完成的部分为 None，显示为"审稿中"
     """
-    print(f"\n[分段审稿] 开始 | 正文长度: {len(content)}")
-
-    # 1. 分割内容
-    sections = split_content_into_sections(content)
-    print(f"[分段审稿] 共分割为 {len(sections)} 个部分")
-
-    if not sections:
-        return {"error": "内容太短，无法分段审稿"}
-
-    # 2. 审稿每个部分
-    section_reviews = []
+    done = [sr for sr in section_reviews if sr is not None]
     total_score = 0
     all_issues = []
-
-    for sec in sections:
-        review = sync_review_section(sec['text'], sec['id'], context_str)
-        section_reviews.append({
-            'id': sec['id'],
-            'text_preview': sec['text'][:100] + '...' if len(sec['text']) > 100 else sec['text'],
-            'word_count': sec['word_count'],
-            'start': sec['start'],
-            'end': sec['end'],
-            'review': review
-        })
-
+    for sr in done:
+        review = sr['review']
         if 'overall_score' in review:
             total_score += review['overall_score']
-        if 'issues' in review:
-            for issue in review['issues']:
-                issue['section_id'] = sec['id']
-                all_issues.append(issue)
+        for issue in review.get('issues', []):
+            issue['section_id'] = sr['id']
+            all_issues.append(issue)
 
-    # 3. 生成整体评价
-    avg_score = total_score / len(sections) if sections else 0
+    # 未完成时按已完成的部分平均
+    avg_score = total_score / len(done) if done else 0
 
     # 按严重程度分类问题
     severe_issues = [i for i in all_issues if i.get('severity') == '严重']
     medium_issues = [i for i in all_issues if i.get('severity') == '中等']
     minor_issues = [i for i in all_issues if i.get('severity') == '轻微']
 
+    progress_row = f"| 审稿进度 | {len(done)}/{section_count} |\n" if len(done) < section_count else ""
+
     # 生成 Markdown 报告
     report = f"""# 📋 章节审稿报告
 
@@ -2587,8 +3544,8 @@ def sync_review_full_chapter_with_sections(content, context_str):
 
 | 指标 | 数值 |
 |------|------|
-| 综合评分 | {avg_score:.1f}/10 |
-| 段落数 | {len(sections)} |
+{progress_row}| 综合评分 | {avg_score:.1f}/10 |
+| 段落数 | {section_count} |
 | 严重问题 | {len(severe_issues)} 个 |
 | 中等问题 | {len(medium_issues)} 个 |
 | 轻微问题 | {len(minor_issues)} 个 |
@@ -2598,7 +3555,10 @@ def sync_review_full_chapter_with_sections(content, context_str):
 ## 📝 分段详细意见
 
 """
-    for sr in section_reviews:
+    for idx, sr in enumerate(section_reviews, 1):
+        if sr is None:
+            report += f"### 第 {idx} 部分\n\n⏳ 审稿中...\n\n---\n\n"
+            continue
         review = sr['review']
         score = review.get('overall_score', '?')
         summary = review.get('summary', '无总结')
@@ -2615,8 +3575,8 @@ def sync_review_full_chapter_with_sections(content, context_str):
 """
         if review.get('issues'):
             report += "**问题列表**:\n"
-            for idx, issue in enumerate(review['issues'], 1):
-                report += f"{idx}. [{issue.get('type', '未知')}] {issue.get('description', '')}\n"
+            for i, issue in enumerate(review['issues'], 1):
+                report += f"{i}. [{issue.get('type', '未知')}] {issue.get('description', '')}\n"
                 report += f"   - 位置: _{issue.get('location', '未指定')}_\n"
                 report += f"   - 建议: {issue.get('suggestion', '无')}\n"
             report += "\n"
@@ -2633,6 +3593,67 @@ def sync_review_full_chapter_with_sections(content, context_str):
             report += f"{i}. **第{issue.get('section_id', '?')}部分**: {issue.get('description', '')}\n"
             report += f"   - 建议: {issue.get('suggestion', '无')}\n\n"
 
+    return report, avg_score, all_issues, severe_issues
+
+
+def sync_review_full_chapter_with_sections(content, context_str, progress_callback=None):
+    """
+    分段审稿整章，返回完整的审稿报告
+    包含：整体评价 + 各部分详细意见
+    各部分并发审稿（上限见配置 review_concurrency），报告始终按部分顺序排列
+
+    Args:
+        content: 章节正文
+        context_str: 参考设定
+        progress_callback: 每完成一个部分调用一次 (done, total, 当前的 Markdown 报告)，在工作线程中调用
+    """
+    print(f"\n[分段审稿] 开始 | 正文长度: {len(content)}")
+
+    # 1. 分割内容
+    sections = split_content_into_sections(content)
+    print(f"[分段审稿] 共分割为 {len(sections)} 个部分")
+
+    if not sections:
+        return {"error": "内容太短，无法分段审稿"}
+
+    # 2. 并发审稿各部分，结果按部分顺序归位
+    section_reviews = [None] * len(sections)
+
+    def review_section(sec):
+        try:
+            return sync_review_section(sec['text'], sec['id'], context_str)
+        except Exception as e:
+            print(f"[分段审稿] 第{sec['id']}部分失败: {e}")
+            return {"error": str(e)}
+
+    concurrency = max(1, int(CFG.get('review_concurrency') or DEFAULT_REVIEW_CONCURRENCY))
+    with ThreadPoolExecutor(max_workers=min(concurrency, len(sections)), thread_name_prefix="section-review") as pool:
+        futures = {pool.submit(review_section, sec): idx for idx, sec in enumerate(sections)}
+        for done, future in enumerate(as_completed(futures), 1):
+            idx = futures[future]
+            sec = sections[idx]
+            section_reviews[idx] = {
+                'id': sec['id'],
+                'text_preview': sec['text'][:100] + '...' if len(sec['text']) > 100 else sec['text'],
+                'word_count': sec['word_count'],
+                'start': sec['start'],
+                'end': sec['end'],
+                'review': future.result()
+            }
+            if progress_callback and done < len(sections):
+                try:
+                    progress_callback(done, len(sections), _section_reviews_report(section_reviews, len(sections))[0])
+                except Exception as e:
+                    print(f"[分段审稿] 进度回调异常: {e}")
+
+    # 3. 生成整体评价与 Markdown 报告
+    report, avg_score, all_issues, severe_issues = _section_reviews_report(section_reviews, len(sections))
+    if progress_callback:
+        try:
+            progress_callback(len(sections), len(sections), report)
+        except Exception as e:
+            print(f"[分段审稿] 进度回调异常: {e}")
+
     print(f"[分段审稿] 完成 | 平均分: {avg_score:.1f} | 问题数: {len(all_issues)}")
 
     return {
@@ -3605,6 +4626,29 @@ def sync_review_dialogue_ratio(paragraphs):
     return {"score": 5, "issues": [], "narrative_stats": {}}
 
 
+def _save_review_foreshadowing(foreshadowing_data, project_path, current_chapter):
+    """把审稿识别出的新伏笔、已回收伏笔写入伏笔库"""
+    if not (project_path and current_chapter):
+        return
+    try:
+        foreshadow_mgr = ForeshadowManager(project_path)
+
+        # 保存新伏笔
+        new_foreshadows = foreshadowing_data.get('new', [])
+        if new_foreshadows:
+            created = foreshadow_mgr.save_from_review(new_foreshadows, current_chapter)
+            print(f"[伏笔追踪] 新增伏笔: {len(created)} 个")
+
+        # 更新已回收伏笔
+        resolved_list = foreshadowing_data.get('resolved', [])
+        if resolved_list:
+            resolved = foreshadow_mgr.batch_resolve_from_review(resolved_list, current_chapter)
+            print(f"[伏笔追踪] 回收伏笔: {len(resolved)} 个")
+
+    except Exception as e:
+        print(f"[伏笔追踪] 保存失败: {e}")
+
+
 def sync_review_foreshadowing(paragraphs, context_info, project_path=None, current_chapter=None):
     """
     伏笔追踪分析维度
@@ -3713,24 +4757,7 @@ def sync_review_foreshadowing(paragraphs, context_info, project_path=None, curre
             foreshadowing_data = parsed.get('foreshadowing', {})
 
             # 保存伏笔到数据库（如果提供了项目路径）
-            if project_path and current_chapter:
-                try:
-                    foreshadow_mgr = ForeshadowManager(project_path)
-
-                    # 保存新伏笔
-                    new_foreshadows = foreshadowing_data.get('new', [])
-                    if new_foreshadows:
-                        created = foreshadow_mgr.save_from_review(new_foreshadows, current_chapter)
-                        print(f"[伏笔追踪] 新增伏笔: {len(created)} 个")
-
-                    # 更新已回收伏笔
-                    resolved_list = foreshadowing_data.get('resolved', [])
-                    if resolved_list:
-                        resolved = foreshadow_mgr.batch_resolve_from_review(resolved_list, current_chapter)
-                        print(f"[伏笔追踪] 回收伏笔: {len(resolved)} 个")
-
-                except Exception as e:
-                    print(f"[伏笔追踪] 保存失败: {e}")
+            _save_review_foreshadowing(foreshadowing_data, project_path, current_chapter)
 
             return {
                 "score": parsed.get('score', 5),
@@ -3852,10 +4879,18 @@ def sync_review_style_consistency(paragraphs, context_info):
     return {"score": 5, "issues": [], "style_analysis": {}}
 
 
-def sync_review_chapter_multi_dimension(paragraphs, context_info, project_path=None, current_chapter=None):
+# 多维度审稿的维度（汇总与展示均按此顺序）
+REVIEW_DIMENSIONS = ['人设', '逻辑', '节奏', '情感', '叙事', '伏笔', '风格']
+# 同时进行的审稿请求数默认上限（配置项 review_concurrency，多维度审稿与分段审稿共用）
+DEFAULT_REVIEW_CONCURRENCY = 4
+
+
+def sync_review_chapter_multi_dimension(paragraphs, context_info, project_path=None, current_chapter=None,
+                                        on_dimension=None):
     """
     多维度综合审稿
-    分别进行人设、逻辑、节奏、情感、叙事、伏笔、风格检查，然后汇总
+    人设、逻辑、节奏、情感、叙事、伏笔、风格各维度并发检查（上限见配置 review_concurrency），然后汇总
+    单个维度失败只记为该维度失败，不影响其他维度
 
     Args:
         paragraphs: 段落列表
@@ -3869,6 +4904,7 @@ def sync_review_chapter_multi_dimension(paragraphs, context_info, project_path=N
         }
         project_path: 项目路径（用于伏笔保存）
         current_chapter: 当前章节编号（用于伏笔保存）
+        on_dimension: 单个维度完成时的回调 (维度名, 结果)，在工作线程中调用
 
     Returns:
         {
@@ -3888,52 +4924,84 @@ def sync_review_chapter_multi_dimension(paragraphs, context_info, project_path=N
     print(f"[多维度审稿] 开始 | 段落数: {len(paragraphs)}")
     print(f"{'='*50}")
 
-    all_issues = []
     dimension_results = {}
 
-    # 1. 人设一致性检查
-    characters_info = context_info.get('characters', '')
-    if characters_info:
-        char_result = sync_review_character_consistency(paragraphs, characters_info)
-        dimension_results['人设'] = char_result
-        all_issues.extend(char_result['issues'])
-    else:
-        dimension_results['人设'] = {"score": 0, "issues": [], "skipped": True}
+    def finish(name, dim_result):
+        # 模型返回的分数可能是 "8"、"8分" 或 None，回调前先统一为数字
+        dim_result['score'] = _coerce_review_score(dim_result.get('score'), 0)
+        dimension_results[name] = dim_result
+        if on_dimension:
+            try:
+                on_dimension(name, dim_result)
+            except Exception as e:
+                print(f"[多维度审稿] 进度回调异常: {e}")
 
-    # 2. 剧情逻辑检查
+    # 人设、逻辑缺少设定时跳过；其余维度各自独立，并发执行
+    characters_info = context_info.get('characters', '')
     world_setting = context_info.get('world_setting', '')
     chapter_outline = context_info.get('chapter_outline', '')
+    tasks = {}
+    if characters_info:
+        tasks['人设'] = lambda: sync_review_character_consistency(paragraphs, characters_info)
+    else:
+        finish('人设', {"score": 0, "issues": [], "skipped": True})
     if world_setting or chapter_outline:
-        logic_result = sync_review_plot_logic(paragraphs, world_setting, chapter_outline)
-        dimension_results['逻辑'] = logic_result
-        all_issues.extend(logic_result['issues'])
+        tasks['逻辑'] = lambda: sync_review_plot_logic(paragraphs, world_setting, chapter_outline)
     else:
-        dimension_results['逻辑'] = {"score": 0, "issues": [], "skipped": True}
-
-    # 3. 节奏把控检查
-    pacing_result = sync_review_pacing(paragraphs)
-    dimension_results['节奏'] = pacing_result
-    all_issues.extend(pacing_result['issues'])
-
-    # 4. 情感曲线分析
-    emotion_result = sync_review_emotion_curve(paragraphs)
-    dimension_results['情感'] = emotion_result
-    all_issues.extend(emotion_result['issues'])
-
-    # 5. 叙事方式分析
-    narrative_result = sync_review_dialogue_ratio(paragraphs)
-    dimension_results['叙事'] = narrative_result
-    all_issues.extend(narrative_result['issues'])
-
-    # 6. 伏笔追踪分析
-    foreshadow_result = sync_review_foreshadowing(paragraphs, context_info, project_path, current_chapter)
-    dimension_results['伏笔'] = foreshadow_result
-    all_issues.extend(foreshadow_result['issues'])
-
-    # 7. 风格一致性分析
-    style_result = sync_review_style_consistency(paragraphs, context_info)
-    dimension_results['风格'] = style_result
-    all_issues.extend(style_result['issues'])
+        finish('逻辑', {"score": 0, "issues": [], "skipped": True})
+    tasks['节奏'] = lambda: sync_review_pacing(paragraphs)
+    tasks['情感'] = lambda: sync_review_emotion_curve(paragraphs)
+    tasks['叙事'] = lambda: sync_review_dialogue_ratio(paragraphs)
+    tasks['伏笔'] = lambda: sync_review_foreshadowing(paragraphs, context_info, project_path, current_chapter)
+    tasks['风格'] = lambda: sync_review_style_consistency(paragraphs, context_info)
+
+    concurrency = max(1, int(CFG.get('review_concurrency') or DEFAULT_REVIEW_CONCURRENCY))
+    review_id = uuid.uuid4().hex[:12]
+
+    def run_tagged(task):
+        # 计费记录标注审稿模式，便于与合并审稿对比
+        with tag_calls(review_mode="multi", review_id=review_id):
+            return task()
+
+    with ThreadPoolExecutor(max_workers=min(concurrency, len(tasks)), thread_name_prefix="review") as pool:
+        futures = {pool.submit(run_tagged, task): name for name, task in tasks.items()}
+        for future in as_completed(futures):
+            name = futures[future]
+            try:
+                dim_result = future.result()
+            except Exception as e:
+                print(f"[多维度审稿] {name}维度失败: {e}")
+                dim_result = {"score": 0, "issues": [], "failed": True, "error": str(e)}
+            finish(name, dim_result)
+
+    return _summarize_review(dimension_results, paragraphs, "multi")
+
+
+def _coerce_review_score(value, default=5):
+    """把模型给出的评分（8、"8"、"8分"、"8/10" 等）转为 0~10 的数值，无法识别时返回 default"""
+    if isinstance(value, bool):
+        return default
+    if not isinstance(value, (int, float)):
+        match = re.search(r'\d+(?:\.\d+)?', str(value or ''))
+        if not match:
+            return default
+        value = float(match.group(0))
+    value = min(max(float(value), 0.0), 10.0)
+    return int(value) if value.is_integer() else round(value, 1)
+
+
+def _summarize_review(dimension_results, paragraphs, review_mode):
+    """汇总各维度结果：总分、问题统计、段落ID校验与分析数据（维度按 REVIEW_DIMENSIONS 顺序）"""
+    for r in dimension_results.values():
+        r['score'] = _coerce_review_score(r.get('score'), 0)
+    # 问题按固定维度顺序汇总，与完成先后无关
+    all_issues = []
+    for name in REVIEW_DIMENSIONS:
+        all_issues.extend(dimension_results[name].get('issues', []))
+    emotion_result = dimension_results['情感']
+    narrative_result = dimension_results['叙事']
+    foreshadow_result = dimension_results['伏笔']
+    style_result = dimension_results['风格']
 
     # 计算总体评分
     scores = [r['score'] for r in dimension_results.values() if r.get('score', 0) > 0]
@@ -3950,13 +5018,15 @@ def sync_review_chapter_multi_dimension(paragraphs, context_info, project_path=N
         if issue.get('paragraph_id') not in valid_ids:
             # 尝试通过quote匹配
             matched = find_paragraph_by_quote(paragraphs, issue.get('quote', ''))
-            issue['paragraph_id'] = matched if matched else 'p1'
+            issue['paragraph_id'] = matched if matched else (paragraphs[0]['id'] if paragraphs else 'p1')
 
     result = {
         "overall_score": round(overall_score, 1),
+        "review_mode": review_mode,
         "dimension_scores": {
-            name: result['score'] for name, result in dimension_results.items()
+            name: dimension_results[name].get('score', 0) for name in REVIEW_DIMENSIONS
         },
+        "failed_dimensions": [name for name in REVIEW_DIMENSIONS if dimension_results[name].get('failed')],
         "issues": all_issues,
         "statistics": {
             "total_issues": len(all_issues),
@@ -3982,6 +5052,232 @@ def sync_review_chapter_multi_dimension(paragraphs, context_info, project_path=N
     return result
 
 
+# 合并审稿中各维度的检查要点、附加输出字段，以及问题的 (ID前缀, 类型)
+CONSOLIDATED_REVIEW_GUIDES = {
+    '人设': ("人物言行是否符合性格与身份；能力表现是否合理；人物关系互动是否符合设定；有无OOC。"
+             "每个问题注明 character（人物名）",
+             '', ('char', '人设不一致')),
+    '逻辑': ("事件因果、时间线是否清晰合理；人物行为动机是否充分；有无机械降神或不合理的巧合；"
+             "伏笔埋设是否自然；冲突解决是否合理",
+             '', ('logic', '剧情逻辑')),
+    '节奏': ("开头能否在3个段落内抓住读者；张弛是否得当、有无冗长的无意义描写；情绪高潮是否铺垫到位；"
+             "结尾是否有钩子；信息密度是否适中；场景转换是否自然",
+             '', ('pacing', '节奏把控')),
+    '情感': ("识别主要段落的情绪基调与强度；情绪转折是否合理、有无断层；整体情绪弧线是否符合故事发展",
+             '"emotion_curve": [{"paragraph_id": "p1", "emotion": "紧张", "intensity": 7}], '
+             '"analysis": "整体情绪走向描述", ',
+             ('emotion', '情绪曲线')),
+    '叙事': ("统计对话段落与描写段落的数量和比例；有无连续5段以上的纯对话或纯描写；对话是否推动剧情、塑造人物",
+             '"statistics": {"dialogue_count": 对话段落数, "description_count": 描写段落数, '
+             '"dialogue_ratio": "对话占比百分比"}, ',
+             ('narrative', '叙事方式')),
+    '伏笔': ("识别本章新埋设的伏笔与回收的前文伏笔；伏笔是否自然、不刻意；有无埋了但明显不会回收的断头伏笔",
+             '"foreshadowing": {"new": [{"paragraph_id": "p1", "content": "伏笔内容", "type": "物品/人物/剧情"}], '
+             '"resolved": [{"content": "回收的伏笔", "resolution": "如何回收"}]}, ',
+             ('foreshadow', '伏笔问题')),
+    '风格': ("文风（文言/白话、正式/口语）、用词习惯、句式是否统一；与前文是否协调；有无突兀的风格转换",
+             '"style_analysis": {"dominant_style": "主要风格描述", "sentence_pattern": "句式特点", '
+             '"vocabulary_level": "用词水平评价"}, ',
+             ('style', '风格一致性')),
+}
+
+
+def build_review_prefix(paragraphs, context_info):
+    """
+    合并审稿的固定前缀：设定上下文 + 带段落编号的正文
+    同一章节重复审稿时前缀不变，可被服务商的前缀缓存复用
+
+    Returns:
+        (前缀文本, 带编号的正文)
+    """
+    numbered_content = ""
+    for p in paragraphs:
+        numbered_content += f"【段落{p['id']}】({p.get('word_count', len(p['text']))}字)\n{p['text']}\n\n"
+    total_words = sum(p.get('word_count', len(p['text'])) for p in paragraphs)
+
+    prev_summary = context_info.get('prev_summary', '')
+    book_summary = context_info.get('book_summary', '')
+    prev_content = context_info.get('prev_content', '')
+    prefix = f"""【人物设定】
+{context_info.get('characters', '') or '无'}
+
+【世界观设定】
+{context_info.get('world_setting', '') or '无'}
+
+【本章大纲】
+{context_info.get('chapter_outline', '') or '无'}
+
+【前文剧情摘要】
+{prev_summary[:1000] if prev_summary else '无'}
+
+【全书剧情总纲】
+{book_summary[:1000] if book_summary else '无'}
+
+【前文章节片段】（用于风格对比）
+{prev_content[:1500] if prev_content else '无前文参考'}
+
+【待审章节】（共{len(paragraphs)}个段落，{total_words}字）
+{numbered_content}"""
+    return prefix, numbered_content
+
+
+def sync_review_chapter_consolidated(paragraphs, context_info, project_path=None, current_chapter=None,
+                                     on_dimension=None):
+    """
+    合并审稿：一次请求完成全部维度
+    正文只发送一次（分维度审稿每个维度各发送一次），请求或解析失败时退回分维度审稿
+
+    参数与返回值同 sync_review_chapter_multi_dimension
+    """
+    print(f"\n{'='*50}")
+    print(f"[合并审稿] 开始 | 段落数: {len(paragraphs)}")
+    print(f"{'='*50}")
+
+    task_type = "reviewer"
+    model_name = get_model(task_type)
+    temperature = get_temperature(task_type)
+
+    # 缺少设定的维度与分维度审稿一样跳过
+    skipped = set()
+    if not context_info.get('characters', ''):
+        skipped.add('人设')
+    if not (context_info.get('world_setting', '') or context_info.get('chapter_outline', '')):
+        skipped.add('逻辑')
+    active = [name for name in REVIEW_DIMENSIONS if name not in skipped]
+
+    prefix, numbered_content = build_review_prefix(paragraphs, context_info)
+    guides = "\n".join(f"{i+1}. 【{name}】{CONSOLIDATED_REVIEW_GUIDES[name][0]}"
+                       for i, name in enumerate(active))
+    schema = ",\n".join(
+        f'    "{name}": {{"score": 1-10分, {CONSOLIDATED_REVIEW_GUIDES[name][1]}"issues": [...]}}'
+        for name in active)
+    # 前缀在前、任务说明在后，前缀保持逐字节稳定
+    prompt = f"""{prefix}
+【任务】作为资深网文主编，对上面的待审章节一次性完成以下{len(active)}个维度的审稿：
+{guides}
+
+【输出要求】
+严格按JSON格式输出（不要用Markdown代码块），每个维度一个键：
+{{
+{schema}
+}}
+其中每个 issues 元素为：
+{{"paragraph_id": "段落ID", "quote": "问题原文引用", "problem": "问题描述", "severity": "严重/中等/轻微", "suggestion": "修改建议"}}
+
+注意：只报告真正的问题，不要过度解读；某维度没有问题时 issues 为空数组。
+"""
+
+    review_id = uuid.uuid4().hex[:12]
+    try:
+        current_client = get_client()
+        response = current_client.chat.completions.create(
+            model=model_name,
+            messages=[{"role": "user", "content": prompt}],
+            stream=False,
+            temperature=temperature
+        )
+        result = response.choices[0].message.content if response.choices else ""
+
+        parsed = None
+        clean = result.replace("```json", "").replace("```", "").strip()
+        start, end = clean.find('{'), clean.rfind('}')
+        if start >= 0 and end > start:
+            json_str = _clean_control_chars_in_json(clean[start:end+1])
+            try:
+                parsed = json.loads(json_str)
+            except json.JSONDecodeError:
+                parsed = _parse_json_aggressive(json_str)
+
+        # 节省量：分维度审稿时正文要多发送 (维度数 - 1) 次，按本次实际计费折算估算值；
+        # 解析失败要退回分维度审稿，不计节省
+        valid = isinstance(parsed, dict) and any(isinstance(parsed.get(name), dict) for name in active)
+        saved = 0
+        if valid:
+            billing = get_billing_service()
+            estimated = max(billing.estimate_tokens(prompt), 1)
+            actual = getattr(getattr(response, 'usage', None), 'prompt_tokens', None) or estimated
+            saved = int(billing.estimate_tokens(numbered_content) * actual / estimated) * max(len(active) - 1, 0)
+        # 无效输出单独归为 consolidated_failed：随后的分维度审稿另计一次，合并审稿的平均用量不受影响
+        mode = "consolidated" if valid else "consolidated_failed"
+        with tag_calls(review_mode=mode, review_id=review_id, saved_input_tokens=saved):
+            record_api_call(response, task_type, model_name, config_pricing=CFG.get('pricing', {}))
+        if not valid:
+            raise ValueError("未返回有效的JSON")
+    except Exception as e:
+        print(f"[合并审稿] 失败，改用分维度审稿: {e}")
+        return sync_review_chapter_multi_dimension(paragraphs, context_info, project_path, current_chapter,
+                                                   on_dimension)
+
+    dimension_results = {}
+    for name in REVIEW_DIMENSIONS:
+        data = parsed.get(name)
+        if name in skipped:
+            dim_result = {"score": 0, "issues": [], "skipped": True}
+        elif not isinstance(data, dict):
+            dim_result = {"score": 0, "issues": [], "failed": True, "error": "输出中缺少该维度"}
+        else:
+            id_prefix, issue_type = CONSOLIDATED_REVIEW_GUIDES[name][2]
+            raw_issues = data.get('issues')
+            # 模型输出不做信任：非列表的 issues、非对象的条目直接跳过
+            raw_issues = [issue for issue in raw_issues if isinstance(issue, dict)] \
+                if isinstance(raw_issues, list) else []
+            issues = []
+            for i, issue in enumerate(raw_issues):
+                description = str(issue.get('problem') or '')
+                if name == '人设':
+                    description = f"[{issue.get('character') or '人物'}] {description}"
+                issues.append({
+                    "id": f"{id_prefix}_{i+1}",
+                    "paragraph_id": str(issue.get('paragraph_id') or 'p1'),
+                    "dimension": name,
+                    "type": issue_type,
+                    "severity": str(issue.get('severity') or '轻微'),
+                    "quote": str(issue.get('quote') or ''),
+                    "description": description,
+                    "suggestion": str(issue.get('suggestion') or '')
+                })
+            dim_result = {"score": _coerce_review_score(data.get('score')), "issues": issues}
+            if name == '情感':
+                curve = data.get('emotion_curve')
+                curve = [dict(p, intensity=_coerce_review_score(p.get('intensity')))
+                         for p in curve if isinstance(p, dict)] if isinstance(curve, list) else []
+                dim_result.update(emotion_curve=curve, analysis=str(data.get('analysis') or ''))
+            elif name == '叙事':
+                stats = data.get('statistics')
+                dim_result['narrative_stats'] = stats if isinstance(stats, dict) else {}
+            elif name == '伏笔':
+                foreshadowing = data.get('foreshadowing')
+                foreshadowing = foreshadowing if isinstance(foreshadowing, dict) else {}
+                for key in ('new', 'resolved'):
+                    entries = foreshadowing.get(key)
+                    foreshadowing[key] = [e for e in entries if isinstance(e, dict)] if isinstance(entries, list) else []
+                dim_result['foreshadowing'] = foreshadowing
+                _save_review_foreshadowing(foreshadowing, project_path, current_chapter)
+            elif name == '风格':
+                style = data.get('style_analysis')
+                dim_result['style_analysis'] = style if isinstance(style, dict) else {}
+            print(f"[合并审稿] {name} | 评分: {dim_result['score']} | 问题数: {len(issues)}")
+        dimension_results[name] = dim_result
+        if on_dimension:
+            try:
+                on_dimension(name, dim_result)
+            except Exception as e:
+                print(f"[合并审稿] 进度回调异常: {e}")
+
+    print(f"[合并审稿] 约节省输入 {saved} tokens")
+    return _summarize_review(dimension_results, paragraphs, "consolidated")
+
+
+def sync_review_chapter_by_mode(paragraphs, context_info, project_path=None, current_chapter=None,
+                                on_dimension=None):
+    """按配置 review_mode 选择合并审稿（consolidated）或分维度审稿（multi，默认）"""
+    if CFG.get('review_mode') == 'consolidated':
+        return sync_review_chapter_consolidated(paragraphs, context_info, project_path, current_chapter,
+                                                on_dimension)
+    return sync_review_chapter_multi_dimension(paragraphs, context_info, project_path, current_chapter,
+                                               on_dimension)
+
+
 # ==================== 世界观结构化管理 ====================
 
 # 预设模板
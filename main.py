@@ -288,6 +288,7 @@ async def main_page():
     ui_refs['time_events'] = None
     ui_refs['timeline_container'] = None
     ui_refs['save_status'] = None
+    ui_refs['index_lag'] = None
     ui_refs['config_container'] = None
     ui_refs['loc_view_mode'] = None
     ui_refs['loc_graph_container'] = None
@@ -348,12 +349,8 @@ async def main_page():
         if not ui_refs['chapter_list']: return
         ui_refs['chapter_list'].clear()
 
-        # 预加载所有章节的字数统计
-        chapter_word_counts = {}
-        for chap in app_state.structure:
-            content = manager.load_chapter_content(chap['id'])
-            stats = backend.count_words(content)
-            chapter_word_counts[chap['id']] = stats['total_words']
+        # 预加载所有章节的字数统计（读缓存，不读正文）
+        chapter_word_counts = manager.get_chapter_word_counts([c['id'] for c in app_state.structure])
 
         with ui_refs['chapter_list']:
             for vol in app_state.volumes:
@@ -491,9 +488,9 @@ async def main_page():
                 # 二级 Tab Panels
                 with ui.tab_panels(set_tabs, value=t_world).classes('w-full flex-grow h-0'):
 
-                    # 2.1 世界观（结构化编辑器）
+                    # 2.1 世界观（结构化编辑器，设定加载完成后再渲染）
                     with ui.tab_panel(t_world).classes('h-full w-full p-0'):
-                        create_world_view_editor()
+                        world_view_container = ui.element('div').classes('h-full w-full')
 
                     # 2.2 人物
                     with ui.tab_panel(t_char).classes('h-full w-full p-2 flex flex-col'):
@@ -512,7 +509,6 @@ async def main_page():
                                 ui_refs['char_container'] = ui.column().classes('w-full p-1')
                             with ui.element('div').classes('w-full h-full').bind_visibility_from(ui_refs['char_view_mode'], 'text', backward=lambda x: x == 'graph'):
                                 ui_refs['char_graph_container'] = ui.column().classes('w-full h-full')
-                            settings.refresh_char_ui()
 
                     # 2.3 物品
                     with ui.tab_panel(t_item).classes('h-full w-full p-2 flex flex-col'):
@@ -522,7 +518,6 @@ async def main_page():
                         
                         with ui.scroll_area().classes('w-full flex-grow border'):
                             ui_refs['item_container'] = ui.column().classes('w-full p-1')
-                            settings.refresh_item_ui()
 
                     # 2.4 地点
                     with ui.tab_panel(t_loc).classes('h-full w-full p-2 flex flex-col'):
@@ -543,7 +538,6 @@ async def main_page():
 
                             with ui.element('div').classes('w-full h-full').bind_visibility_from(ui_refs['loc_view_mode'], 'text', backward=lambda x: x == 'graph'):
                                 ui_refs['loc_graph_container'] = ui.column().classes('w-full h-full')
-                            settings.refresh_loc_ui()
 
                     # 2.5 伏笔追踪
                     with ui.tab_panel(t_foreshadow).classes('h-full w-full p-2 flex flex-col'):
@@ -623,7 +617,13 @@ async def main_page():
                             ui_refs['goals_container'] = ui.column().classes('w-full')
                             settings.refresh_goals_ui()
 
-    # 启动加载
+    # 启动加载：设定实体在后台读取，就绪后再渲染世界观、人物、物品与地点面板（等待时不阻塞事件循环）
+    await app_state.wait_entities()
+    with world_view_container:
+        create_world_view_editor()
+    settings.refresh_char_ui()
+    settings.refresh_item_ui()
+    settings.refresh_loc_ui()
     await writing.load_chapter(0)
     await refresh_total_word_count()
 
@@ -898,7 +898,7 @@ async def call_ai_and_preview(prompt, action_type, **kwargs):
         try:
             print("\n[架构师-裂变] 请求 LLM 生成节点...")
             # 调用后端
-            res = await run.io_bound(backend.sync_call_llm, prompt, backend.get_prompt('json_only_architect_system'), "architect")
+            res = await backend.async_call_llm(prompt, backend.get_prompt('json_only_architect_system'), "architect")
             print(f"[架构师-裂变] LLM 返回: {len(res)} chars")
             
             # JSON 解析
@@ -1108,7 +1108,7 @@ async def generate_world_view_preview(prompt, auto_save=True):
         try:
             print("\n[架构师-世界观] 请求 LLM 生成世界观...")
             # 调用后端生成世界观
-            res = await run.io_bound(backend.sync_call_llm, prompt, backend.get_prompt('writer_system'), "architect")
+            res = await backend.async_call_llm(prompt, backend.get_prompt('writer_system'), "architect")
             print(f"[架构师-世界观] LLM 返回: {len(res)} chars")
 
             # ==========================================
@@ -0,0 +1,308 @@
+"""
+增量备份
+每本书一个备份库（backups/{书名}/）：
+- blobs/: 按 SHA-256 命名、zlib 压缩的文件分块，内容相同的分块只存一份
+- manifests/{备份ID}.json: 一次备份的完整文件清单（路径 -> 大小、修改时间、分块哈希）
+每次备份只读取大小或修改时间发生变化的文件，只写入新出现的分块；
+任意一个清单都能完整还原当时的项目。过期清单删除后，回收不再被引用的分块。
+SQLite 项目库经 backup API 取一致性副本后再分块，固定大小分块使未改动的数据页可复用。
+
+命令行：
+    python -m novel_modules.backup list projects/<书名>
+    python -m novel_modules.backup restore projects/<书名> <备份ID> <还原目录>
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+import zlib
+from datetime import datetime
+from typing import Optional, Dict, List, Any, Tuple
+
+# 分块大小
+BACKUP_CHUNK_SIZE = 256 * 1024
+# 默认保留的备份数
+DEFAULT_KEEP = 20
+# 每写入 1MB 分块数据让出的时间（秒，在释放存储锁之后），避免与自动保存争抢磁盘
+THROTTLE_SECONDS_PER_MB = 0.02
+
+# 不备份的目录与文件（暂存区、导出文件、可重建的索引与缓存、SQLite 日志文件）
+EXCLUDE_DIRS = {".staging", "exports"}
+EXCLUDE_FILES = {"search_index.db", "search_index.db-wal", "search_index.db-shm",
+                 "chapter_stats.json", "project.db-wal", "project.db-shm"}
+SQLITE_FILES = {"project.db"}
+
+
+def lower_thread_priority():
+    """降低当前线程的调度优先级（Linux 下 nice 只作用于调用线程，其他平台不处理）"""
+    if sys.platform.startswith("linux"):
+        try:
+            os.nice(10)
+        except OSError:
+            pass
+
+
+class BackupEngine:
+    """基于分块哈希清单的增量备份"""
+
+    def __init__(self, project_root: str, backup_dir: str, lock: Optional[Any] = None):
+        """
+        Args:
+            project_root: 项目目录
+            backup_dir: 本项目的备份库目录
+            lock: 遍历与读取项目文件期间整体持有的锁（存储写锁），事务不会在备份中途提交
+        """
+        self.project_root = project_root
+        self.backup_dir = backup_dir
+        self.blobs_dir = os.path.join(backup_dir, "blobs")
+        self.manifests_dir = os.path.join(backup_dir, "manifests")
+        self.lock = lock or threading.RLock()
+
+    # ==================== 分块 ====================
+
+    def _blob_path(self, digest: str) -> str:
+        return os.path.join(self.blobs_dir, digest[:2], digest[2:])
+
+    def _store_chunks(self, data: bytes) -> Tuple[List[str], int]:
+        """分块写入，返回 (分块哈希列表, 新写入的字节数)"""
+        digests, written = [], 0
+        for i in range(0, len(data), BACKUP_CHUNK_SIZE) or [0]:
+            chunk = data[i:i + BACKUP_CHUNK_SIZE]
+            digest = hashlib.sha256(chunk).hexdigest()
+            path = self._blob_path(digest)
+            if not os.path.exists(path):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                blob = zlib.compress(chunk, 6)
+                with open(path + ".tmp", 'wb') as f:
+                    f.write(blob)
+                os.replace(path + ".tmp", path)
+                written += len(blob)
+            digests.append(digest)
+        return digests, written
+
+    def _load_chunks(self, digests: List[str]) -> bytes:
+        parts = []
+        for digest in digests:
+            with open(self._blob_path(digest), 'rb') as f:
+                chunk = zlib.decompress(f.read())
+            if hashlib.sha256(chunk).hexdigest() != digest:
+                raise ValueError(f"分块校验失败: {digest}")
+            parts.append(chunk)
+        return b"".join(parts)
+
+    # ==================== 清单 ====================
+
+    def _manifest_path(self, backup_id: str) -> str:
+        return os.path.join(self.manifests_dir, f"{backup_id}.json")
+
+    def _backup_ids(self) -> List[str]:
+        if not os.path.isdir(self.manifests_dir):
+            return []
+        return sorted(name[:-5] for name in os.listdir(self.manifests_dir) if name.endswith(".json"))
+
+    def load_manifest(self, backup_id: str) -> Optional[Dict]:
+        try:
+            with open(self._manifest_path(backup_id), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return None
+
+    def list_backups(self) -> List[Dict]:
+        """备份列表（新的在前）"""
+        result = []
+        for backup_id in reversed(self._backup_ids()):
+            manifest = self.load_manifest(backup_id)
+            if manifest is None:
+                continue
+            result.append({
+                "id": backup_id,
+                "time": manifest.get("created", backup_id),
+                "files": len(manifest.get("files", {})),
+                "size": sum(e["size"] for e in manifest.get("files", {}).values()),
+                "changed": manifest.get("changed", 0),
+                "new_bytes": manifest.get("new_bytes", 0)
+            })
+        return result
+
+    # ==================== 备份 ====================
+
+    def _iter_files(self):
+        for dirpath, dirnames, filenames in os.walk(self.project_root):
+            dirnames[:] = sorted(d for d in dirnames if d not in EXCLUDE_DIRS)
+            for name in sorted(filenames):
+                if name in EXCLUDE_FILES or name.endswith(".tmp"):
+                    continue
+                path = os.path.join(dirpath, name)
+                yield os.path.relpath(path, self.project_root).replace(os.sep, "/"), path
+
+    def _read_sqlite(self, path: str) -> bytes:
+        """通过 SQLite backup API 取得一致性副本（不受 WAL 中未合并页影响）"""
+        os.makedirs(self.backup_dir, exist_ok=True)
+        tmp_path = os.path.join(self.backup_dir, "sqlite_copy.tmp")
+        src = sqlite3.connect(path)
+        dst = sqlite3.connect(tmp_path)
+        try:
+            src.backup(dst)
+        finally:
+            dst.close()
+            src.close()
+        try:
+            with open(tmp_path, 'rb') as f:
+                return f.read()
+        finally:
+            os.remove(tmp_path)
+
+    def create_backup(self, keep: int = DEFAULT_KEEP, throttle: bool = True) -> Dict:
+        """
+        执行一次增量备份
+
+        Args:
+            keep: 保留的备份数，超出的旧备份删除并回收分块
+            throttle: 是否按写入量让出时间（后台运行时使用）
+
+        Returns:
+            {"id", "files", "changed", "new_bytes", "removed_blobs"}
+        """
+        ids = self._backup_ids()
+        previous = (self.load_manifest(ids[-1]) or {}).get("files", {}) if ids else {}
+
+        # 1. 持有存储锁完成遍历与读取：多文件事务（清单 + 各章正文）不会在备份中途提交，
+        #    得到的是同一时刻的项目；只读入变化的文件，分块压缩与写入放到锁外
+        files, pending = {}, []
+        with self.lock:
+            for rel, path in self._iter_files():
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue  # 遍历期间被删除
+                old = previous.get(rel)
+                if rel not in SQLITE_FILES and old and old["size"] == st.st_size and old["mtime_ns"] == st.st_mtime_ns:
+                    files[rel] = old  # 未变化：沿用上次的分块，不读取文件
+                    continue
+                try:
+                    if rel in SQLITE_FILES:
+                        data = self._read_sqlite(path)
+                    else:
+                        with open(path, 'rb') as f:
+                            data = f.read()
+                except (OSError, sqlite3.Error) as e:
+                    print(f"[Backup] 读取失败，跳过 {rel}: {e}")
+                    if old:
+                        files[rel] = old
+                    continue
+                files[rel] = None  # 占位，保持清单按遍历顺序
+                pending.append((rel, st.st_mtime_ns, data, old))
+
+        # 2. 锁外分块写入
+        changed, new_bytes = 0, 0
+        for rel, mtime_ns, data, old in pending:
+            chunks, written = self._store_chunks(data)
+            files[rel] = {"size": len(data), "mtime_ns": mtime_ns, "chunks": chunks}
+            if not old or old["chunks"] != chunks:
+                changed += 1
+            new_bytes += written
+            if throttle:
+                time.sleep(THROTTLE_SECONDS_PER_MB * len(data) / (1024 * 1024))
+
+        now = datetime.now()
+        backup_id = now.strftime("%Y%m%d_%H%M%S")
+        suffix = 1
+        while os.path.exists(self._manifest_path(backup_id)):
+            backup_id = f"{now.strftime('%Y%m%d_%H%M%S')}_{suffix}"
+            suffix += 1
+        manifest = {
+            "id": backup_id,
+            "created": now.strftime("%Y-%m-%d %H:%M:%S"),
+            "changed": changed,
+            "new_bytes": new_bytes,
+            "files": files
+        }
+        os.makedirs(self.manifests_dir, exist_ok=True)
+        tmp_path = self._manifest_path(backup_id) + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False)
+        os.replace(tmp_path, self._manifest_path(backup_id))
+
+        removed = self.prune(keep)
+        return {"id": backup_id, "files": len(files), "changed": changed,
+                "new_bytes": new_bytes, "removed_blobs": removed}
+
+    # ==================== 清理 ====================
+
+    def prune(self, keep: int = DEFAULT_KEEP) -> int:
+        """只保留最近 keep 个备份，并回收无引用的分块；返回删除的分块数"""
+        ids = self._backup_ids()
+        if keep > 0 and len(ids) > keep:
+            for backup_id in ids[:-keep]:
+                try: os.remove(self._manifest_path(backup_id))
+                except OSError: pass
+        return self.collect_garbage()
+
+    def collect_garbage(self) -> int:
+        """删除不被任何清单引用的分块"""
+        live = set()
+        for backup_id in self._backup_ids():
+            manifest = self.load_manifest(backup_id)
+            if manifest is None:
+                return 0  # 清单损坏时不冒险删除
+            for entry in manifest.get("files", {}).values():
+                live.update(entry["chunks"])
+        removed = 0
+        if not os.path.isdir(self.blobs_dir):
+            return 0
+        for prefix in os.listdir(self.blobs_dir):
+            sub = os.path.join(self.blobs_dir, prefix)
+            for name in os.listdir(sub):
+                if prefix + name not in live:
+                    try:
+                        os.remove(os.path.join(sub, name))
+                        removed += 1
+                    except OSError:
+                        pass
+        return removed
+
+    # ==================== 还原 ====================
+
+    def restore(self, backup_id: str, target_dir: str) -> Tuple[bool, str]:
+        """
+        将指定备份还原到 target_dir（必须不存在或为空目录，不覆盖现有项目）
+
+        Returns:
+            (是否成功, 提示信息)
+        """
+        manifest = self.load_manifest(backup_id)
+        if manifest is None:
+            return False, f"备份不存在: {backup_id}"
+        if os.path.isdir(target_dir) and os.listdir(target_dir):
+            return False, f"目标目录非空: {target_dir}"
+        try:
+            for rel, entry in manifest["files"].items():
+                path = os.path.join(target_dir, *rel.split("/"))
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                with open(path, 'wb') as f:
+                    f.write(self._load_chunks(entry["chunks"]))
+        except (OSError, ValueError, zlib.error) as e:
+            return False, f"还原失败: {e}"
+        return True, f"已还原 {len(manifest['files'])} 个文件到 {target_dir}"
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3 or sys.argv[1] not in ("list", "restore"):
+        print(__doc__)
+        sys.exit(1)
+    root = sys.argv[2]
+    engine = BackupEngine(root, os.path.join("backups", os.path.basename(os.path.normpath(root))))
+    if sys.argv[1] == "list":
+        for b in engine.list_backups():
+            print(f"{b['id']}  {b['time']}  {b['files']} 个文件  变化 {b['changed']}  新增 {b['new_bytes'] // 1024} KB")
+    elif len(sys.argv) >= 5:
+        ok, msg = engine.restore(sys.argv[3], sys.argv[4])
+        print(msg)
+        sys.exit(0 if ok else 1)
+    else:
+        print(__doc__)
+        sys.exit(1)
@@ -5,6 +5,8 @@ Token 计费管理系统
 
 import json
 import os
+import threading
+from contextlib import contextmanager
 from datetime import datetime, timedelta
 from typing import Optional, Dict, List, Any
 
@@ -21,6 +23,24 @@ DEFAULT_PRICING = {
     "claude-3-haiku": {"input": 0.0018, "output": 0.009},  # $0.00025, $0.00125
 }
 
+# 当前线程附加到调用记录上的标签（见 tag_calls）
+_call_tags = threading.local()
+
+
+@contextmanager
+def tag_calls(**tags):
+    """
+    在当前线程内为之后记录的调用附加标签，用于对比不同的调用方式
+
+    例: with tag_calls(review_mode="consolidated", review_id="..."):
+    """
+    previous = getattr(_call_tags, 'tags', {})
+    _call_tags.tags = {**previous, **tags}
+    try:
+        yield
+    finally:
+        _call_tags.tags = previous
+
 
 class BillingService:
     """计费服务核心类"""
@@ -28,6 +48,7 @@ class BillingService:
     def __init__(self, data_dir: str = "data/global"):
         self.data_dir = data_dir
         self.billing_file = os.path.join(data_dir, "billing.json")
+        self._lock = threading.RLock()  # 多个审稿维度可能同时记录
         self._ensure_data_dir()
         self._load_data()
 
@@ -108,38 +129,43 @@ class BillingService:
 
     def record_call(self, book_name: str, task_type: str, model: str,
                     input_tokens: int, output_tokens: int, cost: float,
-                    status: str = "success", config_pricing: Optional[Dict] = None) -> Dict:
+                    status: str = "success", config_pricing: Optional[Dict] = None,
+                    cached_input_tokens: int = 0) -> Dict:
         """
         记录一次 API 调用
+        cached_input_tokens 为命中服务商前缀缓存的输入 token 数（已包含在 input_tokens 中）
         """
         # 如果没有提供 cost，自动计算
         if cost == 0 and (input_tokens > 0 or output_tokens > 0):
             cost = self.calculate_cost(model, input_tokens, output_tokens, config_pricing)
 
-        record = {
-            "id": len(self.data["records"]) + 1,
-            "timestamp": datetime.now().isoformat(),
-            "book_name": book_name,
-            "task_type": task_type,
-            "model": model,
-            "input_tokens": input_tokens,
-            "output_tokens": output_tokens,
-            "cost": cost,
-            "status": status
-        }
+        with self._lock:
+            record = {
+                "id": len(self.data["records"]) + 1,
+                "timestamp": datetime.now().isoformat(),
+                "book_name": book_name,
+                "task_type": task_type,
+                "model": model,
+                "input_tokens": input_tokens,
+                "output_tokens": output_tokens,
+                "cached_input_tokens": cached_input_tokens,
+                "cost": cost,
+                "status": status
+            }
+            record.update(getattr(_call_tags, 'tags', {}))
 
-        self.data["records"].append(record)
+            self.data["records"].append(record)
 
-        # 更新统计
-        self.data["stats"]["total_input_tokens"] += input_tokens
-        self.data["stats"]["total_output_tokens"] += output_tokens
-        self.data["stats"]["total_cost"] += cost
-        self.data["stats"]["total_calls"] += 1
+            # 更新统计
+            self.data["stats"]["total_input_tokens"] += input_tokens
+            self.data["stats"]["total_output_tokens"] += output_tokens
+            self.data["stats"]["total_cost"] += cost
+            self.data["stats"]["total_calls"] += 1
 
-        # 从余额中扣除
-        self.data["balance"] -= cost
+            # 从余额中扣除
+            self.data["balance"] -= cost
 
-        self._save_data()
+            self._save_data()
         return record
 
     def get_balance(self) -> float:
@@ -245,6 +271,35 @@ class BillingService:
             "output_tokens": sum(r["output_tokens"] for r in month_records)
         }
 
+    def get_review_mode_stats(self) -> Dict[str, Dict]:
+        """
+        按审稿模式汇总（分维度审稿 multi / 合并审稿 consolidated；
+        合并审稿输出无效而改用分维度时，失败的那次请求记为 consolidated_failed）
+        返回: {"multi": {"reviews": 3, "calls": 21, "input_tokens": ..., "avg_input_tokens": ...,
+                         "saved_input_tokens": ..., "cost": ...}, ...}
+        """
+        modes = {}
+        review_ids = {}
+        for r in self.data["records"]:
+            mode = r.get("review_mode")
+            if not mode:
+                continue
+            entry = modes.setdefault(mode, {"reviews": 0, "calls": 0, "input_tokens": 0,
+                                            "cached_input_tokens": 0, "output_tokens": 0,
+                                            "saved_input_tokens": 0, "cost": 0.0})
+            entry["calls"] += 1
+            entry["input_tokens"] += r["input_tokens"]
+            entry["cached_input_tokens"] += r.get("cached_input_tokens", 0)
+            entry["output_tokens"] += r["output_tokens"]
+            entry["saved_input_tokens"] += r.get("saved_input_tokens", 0)
+            entry["cost"] += r["cost"]
+            review_ids.setdefault(mode, set()).add(r.get("review_id"))
+        for mode, entry in modes.items():
+            entry["reviews"] = len(review_ids[mode])
+            entry["avg_input_tokens"] = entry["input_tokens"] // max(entry["reviews"], 1)
+            entry["avg_cost"] = entry["cost"] / max(entry["reviews"], 1)
+        return modes
+
     def clear_records(self, before_date: Optional[str] = None):
         """
         清理记录
@@ -320,15 +375,22 @@ def record_api_call(response, task_type: str, model: str, book_name: str = None,
             except:
                 book_name = "Unknown"
 
+        # 前缀缓存命中数：DeepSeek 为 prompt_cache_hit_tokens，OpenAI 为 prompt_tokens_details.cached_tokens
+        usage = response.usage
+        cached = getattr(usage, 'prompt_cache_hit_tokens', None)
+        if cached is None:
+            cached = getattr(getattr(usage, 'prompt_tokens_details', None), 'cached_tokens', None)
+
         return billing.record_call(
             book_name=book_name,
             task_type=task_type,
             model=model,
-            input_tokens=response.usage.prompt_tokens,
-            output_tokens=response.usage.completion_tokens,
+            input_tokens=usage.prompt_tokens,
+            output_tokens=usage.completion_tokens,
             cost=0,
             status=status,
-            config_pricing=config_pricing
+            config_pricing=config_pricing,
+            cached_input_tokens=cached or 0
         )
     except Exception as e:
         print(f"[Billing] 记录失败: {e}")
@@ -1,8 +1,25 @@
 # novel_modules/bookshelf.py
 from nicegui import ui
 from .state import app_state, library,ui_refs
+from datetime import datetime
 import backend
 
+# 书架排序选项
+SORT_OPTIONS = {
+    'last_modified': '最近修改',
+    'name': '书名',
+    'word_count': '字数',
+    'chapter_count': '章节数'
+}
+
+
+def _format_words(count):
+    return f"{count / 10000:.1f} 万字" if count >= 10000 else f"{count} 字"
+
+
+def _format_time(ts):
+    return datetime.fromtimestamp(ts).strftime('%Y-%m-%d %H:%M') if ts else '-'
+
 def open_bookshelf_dialog():
     """打开书架弹窗"""
     
@@ -17,8 +34,17 @@ def open_bookshelf_dialog():
                 ui.label('我的书架').classes('text-2xl font-bold text-gray-800')
             ui.button(icon='close', on_click=dialog.close).props('flat round')
 
+        # --- 筛选与排序（清单已缓存元数据，切换时即时重排） ---
+        view = {'page': 1}
+        with ui.row().classes('w-full items-center gap-4 mb-2'):
+            keyword_input = ui.input(placeholder='搜索书名或简介').props('dense clearable').classes('w-64') \
+                .on('update:model-value', lambda: reset_and_refresh())
+            sort_select = ui.select(SORT_OPTIONS, value='last_modified', label='排序',
+                                    on_change=lambda: reset_and_refresh()).props('dense').classes('w-32')
+
         # --- 内容区 ---
         content_area = ui.column().classes('w-full flex-grow overflow-auto')
+        pager_area = ui.row().classes('w-full justify-center')
 
         # --- 核心逻辑函数定义 (放在前面确保引用正常) ---
         
@@ -41,6 +67,8 @@ def open_bookshelf_dialog():
                 if ui_refs.get('editor_content'): ui_refs['editor_content'].value = ""
                 if ui_refs.get('editor_outline'): ui_refs['editor_outline'].value = ""
             
+            # 新书的设定实体在后台加载，等待就绪后再刷新面板
+            await app_state.wait_entities()
             settings.refresh_char_ui()
             settings.refresh_loc_ui()
             
@@ -107,6 +135,7 @@ def open_bookshelf_dialog():
                             app_state.load_project(res)
                             backend.CFG['last_open_book'] = res
                             backend.save_global_config(backend.CFG)
+                            await app_state.wait_entities()
                         d_rename.close()
                         refresh_grid()
                     else:
@@ -139,12 +168,24 @@ def open_bookshelf_dialog():
             d_create.open()
 
         # --- 界面刷新函数 ---
+        def reset_and_refresh():
+            view['page'] = 1
+            refresh_grid()
+
+        def go_page(page):
+            view['page'] = page
+            refresh_grid()
+
         def refresh_grid():
             content_area.clear()
-            books = library.list_books()
+            pager_area.clear()
+            result = library.page_books(page=view['page'], sort_by=sort_select.value,
+                                        keyword=(keyword_input.value or '').strip())
+            view['page'] = result['page']
+            books = result['books']
             
             with content_area:
-                ui.label(f'共 {len(books)} 部作品').classes('text-sm text-gray-500 mb-2')
+                ui.label(f'共 {result["total"]} 部作品').classes('text-sm text-gray-500 mb-2')
                 
                 with ui.grid(columns=4).classes('w-full gap-4'):
                     # 1. 新建卡片
@@ -160,17 +201,25 @@ def open_bookshelf_dialog():
                         bg_cls = 'bg-purple-50' if is_active else 'bg-white'
                         
                         # 【重要修改】卡片不再整体响应点击，而是拆分为两个区域
-                        with ui.card().classes(f'w-full h-40 p-0 flex flex-col justify-between transition-all {border_cls} {bg_cls}'):
+                        with ui.card().classes(f'w-full h-48 p-0 flex flex-col justify-between transition-all {border_cls} {bg_cls}'):
                             
                             # 区域A：上半部分 (点击切换书籍)
                             # 使用 w-full flex-grow 让它占据除按钮外的所有空间
                             with ui.column().classes('w-full flex-grow p-4 cursor-pointer gap-1') \
                                     .on('click', lambda b=book['name']: switch_and_close(b)):
                                 
-                                ui.icon('book', color='purple' if is_active else 'gray').classes('mb-1')
-                                ui.label(book['name']).classes('text-lg font-bold leading-tight truncate w-full')
-                                if is_active:
-                                    ui.badge('当前编辑', color='purple').props('outline size=xs')
+                                with ui.row().classes('w-full items-center gap-2 no-wrap'):
+                                    ui.icon('book', color='purple' if is_active else 'gray')
+                                    ui.label(book['name']).classes('text-lg font-bold leading-tight truncate')
+                                    if is_active:
+                                        ui.badge('当前编辑', color='purple').props('outline size=xs')
+                                ui.label(
+                                    f"{_format_words(book.get('word_count', 0))} · {book.get('chapter_count', 0)} 章"
+                                ).classes('text-xs text-gray-600')
+                                if book.get('summary'):
+                                    ui.label(book['summary']).classes('text-xs text-gray-500 line-clamp-2 w-full')
+                                ui.label(f"修改于 {_format_time(book.get('last_modified'))}") \
+                                    .classes('text-xs text-gray-400')
                             
                             # 区域B：下半部分 (操作按钮)
                             # 独立的背景色区分，且不绑定切换事件
@@ -183,6 +232,14 @@ def open_bookshelf_dialog():
                                 ui.button(icon='delete', on_click=lambda e, b=book['name']: open_delete_confirm(b)) \
                                     .props('flat round dense color=red size=sm').tooltip('删除')
 
+                                if book.get('vector_count') is not None:
+                                    ui.label(f"记忆 {book['vector_count']} 条").classes('text-xs text-gray-400 self-center mr-auto order-first')
+
+            if result['pages'] > 1:
+                with pager_area:
+                    ui.pagination(1, result['pages'], direction_links=True, value=result['page'],
+                                  on_change=lambda e: go_page(e.value)).props('max-pages=9')
+
         refresh_grid()
     
     dialog.open()
\ No newline at end of file
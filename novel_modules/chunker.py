@@ -0,0 +1,153 @@
+"""
+段落对齐的 RAG 切片
+以章节段落（NovelManager.load_chapter_paragraphs 的结果）为单位装箱：
+- 整段装入，直到达到 token 预算；超长段落按句子切分，超长句子才按长度硬切
+- 切片之间不重叠，切片文本即章节全文中 [start, end) 的原样片段
+- 每个切片记录所含段落ID与字符偏移，检索结果可直接定位回段落
+"""
+
+import re
+from typing import Dict, List, Any
+
+# 段落之间的分隔符（与 NovelManager.paragraphs_to_text 一致）
+PARAGRAPH_SEPARATOR = "\n\n"
+# 默认每个切片的 token 预算
+DEFAULT_TOKEN_BUDGET = 500
+# 短于该字数的切片并入前一个切片，不单独成片
+MIN_CHUNK_CHARS = 50
+
+# 句末标点（含紧随其后的引号、括号）
+_SENTENCE_END = re.compile(r'[^。！？!?…；;\n]*(?:[。！？!?…；;]+[”’」』）)"\']*|\n|$)')
+_CJK = re.compile(r'[\u4e00-\u9fff\u3400-\u4dbf]')
+_WORD = re.compile(r'[A-Za-z0-9]+')
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    估算嵌入模型的 token 数
+    汉字按 1 个 token，连续字母数字按 1.3 个，其余字符按 0.5 个
+    """
+    if not text:
+        return 0
+    cjk = len(_CJK.findall(text))
+    words = _WORD.findall(text)
+    other = len(text) - cjk - sum(len(w) for w in words)
+    return int(cjk + len(words) * 1.3 + max(other, 0) * 0.5)
+
+
+def split_sentences(text: str) -> List[str]:
+    """按句末标点切分，拼接结果与原文完全一致"""
+    sentences = [m.group(0) for m in _SENTENCE_END.finditer(text) if m.group(0)]
+    return sentences or [text]
+
+
+def _hard_split(text: str, budget: int) -> List[str]:
+    """单句超出预算时按估算长度硬切"""
+    pieces, start = [], 0
+    while start < len(text):
+        end = start + 1
+        while end < len(text) and estimate_tokens(text[start:end + 1]) <= budget:
+            end += 1
+        pieces.append(text[start:end])
+        start = end
+    return pieces
+
+
+def _paragraph_pieces(text: str, budget: int) -> List[str]:
+    """把超长段落切成不超过预算的片段（尽量在句末断开）"""
+    pieces, current = [], ""
+    for sentence in split_sentences(text):
+        if estimate_tokens(sentence) > budget:
+            if current:
+                pieces.append(current)
+                current = ""
+            pieces.extend(_hard_split(sentence, budget))
+        elif estimate_tokens(current + sentence) > budget:
+            pieces.append(current)
+            current = sentence
+        else:
+            current += sentence
+    if current:
+        pieces.append(current)
+    return pieces
+
+
+def chunk_paragraphs(paragraphs: List[Dict[str, Any]], budget: int = DEFAULT_TOKEN_BUDGET,
+                     min_chars: int = MIN_CHUNK_CHARS) -> List[Dict[str, Any]]:
+    """
+    按段落装箱切片
+
+    Args:
+        paragraphs: [{"id", "text", ...}]，顺序即章节顺序
+        budget: 每个切片的 token 预算
+        min_chars: 短于此长度的切片并入前一个切片
+
+    Returns:
+        [{"text", "paragraph_ids", "start", "end"}, ...]
+        start/end 为切片在章节全文（段落以空行连接）中的字符偏移
+    """
+    budget = max(int(budget), 16)
+    # 先把每段拆成 (段落ID, 起始偏移, 片段文本) 的单元，超长段落拆成多个单元
+    units = []
+    offset = 0
+    for para in paragraphs:
+        text = para.get('text', '')
+        if estimate_tokens(text) <= budget:
+            units.append((para.get('id'), offset, text))
+        else:
+            piece_offset = offset
+            for piece in _paragraph_pieces(text, budget):
+                units.append((para.get('id'), piece_offset, piece))
+                piece_offset += len(piece)
+        offset += len(text) + len(PARAGRAPH_SEPARATOR)
+    full_text = PARAGRAPH_SEPARATOR.join(p.get('text', '') for p in paragraphs)
+
+    chunks = []
+    current = None
+    for para_id, start, text in units:
+        end = start + len(text)
+        if current is not None and estimate_tokens(full_text[current['start']:end]) <= budget:
+            current['end'] = end
+            if para_id not in current['paragraph_ids']:
+                current['paragraph_ids'].append(para_id)
+            continue
+        if current is not None:
+            chunks.append(current)
+        current = {"start": start, "end": end, "paragraph_ids": [para_id]}
+    if current is not None:
+        chunks.append(current)
+
+    # 过短的切片（多为场景分隔符、单句对白）并入前一片，位于开头时并入后一片
+    merged, carry = [], None
+    for chunk in chunks:
+        if carry is not None:
+            chunk = {"start": carry['start'], "end": chunk['end'],
+                     "paragraph_ids": carry['paragraph_ids'] + [p for p in chunk['paragraph_ids']
+                                                                if p not in carry['paragraph_ids']]}
+            carry = None
+        if len(full_text[chunk['start']:chunk['end']].strip()) >= min_chars:
+            merged.append(chunk)
+        elif merged:
+            merged[-1]['end'] = chunk['end']
+            merged[-1]['paragraph_ids'] += [p for p in chunk['paragraph_ids'] if p not in merged[-1]['paragraph_ids']]
+        else:
+            carry = chunk
+    # 整章都不足 min_chars 时不生成切片
+
+    result = []
+    for chunk in merged:
+        text = full_text[chunk['start']:chunk['end']]
+        result.append({
+            "text": text,
+            "paragraph_ids": [p for p in chunk['paragraph_ids'] if p is not None],
+            "start": chunk['start'],
+            "end": chunk['end']
+        })
+    return result
+
+
+def text_to_simple_paragraphs(text: str) -> List[Dict[str, Any]]:
+    """没有段落结构时按空行切分（无段落ID），保证拼接后与原文一致"""
+    if not text:
+        return []
+    return [{"id": None, "text": part} for part in text.split(PARAGRAPH_SEPARATOR)]
@@ -0,0 +1,75 @@
+"""
+项目文档内存缓存
+缓存解析后的设定、人物、物品、地点、分卷与章节结构，
+以存储签名（文件 mtime+size 或 SQLite 修订号）校验，外部修改后自动失效。
+缓存内数据冻结为只读结构（dict -> MappingProxyType，list -> tuple），
+调用方无法意外改坏缓存；需要修改时用 thaw_json 得到可变副本
+"""
+
+import threading
+from types import MappingProxyType
+from typing import Optional, Dict, List, Any
+
+
+def freeze_json(obj: Any) -> Any:
+    """将 JSON 结构递归冻结为只读视图"""
+    if isinstance(obj, (dict, MappingProxyType)):
+        return MappingProxyType({k: freeze_json(v) for k, v in obj.items()})
+    if isinstance(obj, (list, tuple)):
+        return tuple(freeze_json(v) for v in obj)
+    return obj
+
+
+def thaw_json(obj: Any) -> Any:
+    """将只读视图递归还原为可变的 dict/list 副本"""
+    if isinstance(obj, (dict, MappingProxyType)):
+        return {k: thaw_json(v) for k, v in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [thaw_json(v) for v in obj]
+    return obj
+
+
+class DocumentCache:
+    """按签名校验的只读文档缓存"""
+
+    def __init__(self):
+        self._entries: Dict[str, tuple] = {}
+        self._lock = threading.Lock()
+
+    def get(self, name: str, signature: Optional[List]) -> Optional[Any]:
+        """
+        读取缓存
+
+        Args:
+            name: 文档名
+            signature: 存储中文档的当前签名
+
+        Returns:
+            只读视图；未命中或签名不一致时返回 None
+        """
+        if signature is None:
+            return None
+        with self._lock:
+            entry = self._entries.get(name)
+        if entry is None or entry[0] != signature:
+            return None
+        return entry[1]
+
+    def put(self, name: str, signature: Optional[List], data: Any) -> Any:
+        """
+        写入缓存并返回冻结后的只读视图
+        签名为空（文档不存在）时只冻结不缓存
+        """
+        view = freeze_json(data)
+        if signature is not None:
+            with self._lock:
+                self._entries[name] = (signature, view)
+        return view
+
+    def invalidate(self, name: Optional[str] = None):
+        """使单个文档（或全部）缓存失效"""
+        with self._lock:
+            if name is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(name, None)
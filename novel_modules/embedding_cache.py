@@ -0,0 +1,241 @@
+"""
+嵌入向量缓存
+文本哈希 -> float32 向量的磁盘缓存，供向量服务在调用嵌入模型前查询：
+- vectors.f32: 定长槽位的向量文件，内存映射读写（每槽 dim 个 float32）
+- index.db: SQLite 索引（哈希 -> 槽位、校验和、最近使用序号）
+容量按字节上限折算成槽位数，写满后淘汰最久未使用的条目并复用其槽位；
+嵌入模型或向量维度变化时整体清空。重复保存、全局替换后复现的分块、
+重建向量库和重复的检索问句都直接命中缓存，不再重新计算
+"""
+
+import hashlib
+import mmap
+import os
+import sqlite3
+import threading
+import zlib
+from array import array
+from typing import Optional, Dict, List, Any
+
+# 默认容量上限
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+# 向量文件每次扩容的槽位数
+GROW_SLOTS = 1024
+
+
+def text_key(text: str) -> str:
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+
+class EmbeddingCache:
+    """内存映射的 float32 向量缓存（LRU 淘汰，容量有上限）"""
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS entries (
+        hash TEXT PRIMARY KEY, slot INTEGER UNIQUE NOT NULL,
+        crc INTEGER NOT NULL, last_used INTEGER NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS idx_entries_lru ON entries (last_used);
+    CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+    """
+
+    def __init__(self, cache_dir: str, max_bytes: int = DEFAULT_MAX_BYTES, model_key: str = "default"):
+        """
+        Args:
+            cache_dir: 缓存目录
+            max_bytes: 向量文件大小上限
+            model_key: 嵌入模型标识，与缓存记录的不一致时清空缓存
+        """
+        os.makedirs(cache_dir, exist_ok=True)
+        self.cache_dir = cache_dir
+        self.max_bytes = max(0, int(max_bytes))
+        self.model_key = model_key
+        self._lock = threading.RLock()
+        self.conn = sqlite3.connect(os.path.join(cache_dir, "index.db"), check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(self.SCHEMA)
+
+        self.vector_path = os.path.join(cache_dir, "vectors.f32")
+        if not os.path.exists(self.vector_path):
+            open(self.vector_path, 'wb').close()
+        self._file = open(self.vector_path, 'r+b')
+        self._mm = None
+        self._capacity = 0
+
+        self.dim = None
+        meta = dict(self.conn.execute("SELECT key, value FROM meta").fetchall())
+        if meta.get("model", model_key) != model_key:
+            self._reset(None)
+        elif meta.get("dim"):
+            self.dim = int(meta["dim"])
+            self._map()
+        self._tick = self.conn.execute("SELECT COALESCE(MAX(last_used), 0) FROM entries").fetchone()[0]
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    # ==================== 向量文件 ====================
+
+    @property
+    def slot_bytes(self) -> int:
+        return self.dim * 4
+
+    @property
+    def max_slots(self) -> int:
+        return self.max_bytes // self.slot_bytes if self.dim else 0
+
+    def _map(self):
+        """按当前文件大小重新映射"""
+        if self._mm is not None:
+            self._mm.close()
+            self._mm = None
+        size = os.fstat(self._file.fileno()).st_size
+        self._capacity = size // self.slot_bytes if self.dim else 0
+        if size > 0:
+            self._mm = mmap.mmap(self._file.fileno(), 0)
+
+    def _ensure_capacity(self, slot: int):
+        if slot < self._capacity:
+            return
+        new_capacity = min(self.max_slots, max(slot + 1, self._capacity + GROW_SLOTS))
+        # 先解除映射再扩容（Windows 不允许修改已映射文件的大小）
+        if self._mm is not None:
+            self._mm.close()
+            self._mm = None
+        self._file.truncate(new_capacity * self.slot_bytes)
+        self._map()
+
+    def _reset(self, dim: Optional[int]):
+        """清空缓存（模型或维度变化时）"""
+        if self._mm is not None:
+            self._mm.close()
+            self._mm = None
+        self._file.truncate(0)
+        self._capacity = 0
+        with self.conn:
+            self.conn.execute("DELETE FROM entries")
+            self.conn.execute("DELETE FROM meta")
+            self.conn.execute("INSERT INTO meta (key, value) VALUES ('model', ?)", (self.model_key,))
+            if dim:
+                self.conn.execute("INSERT INTO meta (key, value) VALUES ('dim', ?)", (str(dim),))
+        self.dim = dim
+
+    # ==================== 读写 ====================
+
+    def get_many(self, texts: List[str]) -> List[Optional[List[float]]]:
+        """
+        批量查询
+
+        Returns:
+            与 texts 等长的列表，未命中（或校验失败）的位置为 None
+        """
+        results: List[Optional[List[float]]] = [None] * len(texts)
+        if not texts:
+            return results
+        keys = [text_key(t) for t in texts]
+        with self._lock:
+            if self.dim is None or self._mm is None:
+                self.misses += len(texts)
+                return results
+            rows = {}
+            unique = list(set(keys))
+            for i in range(0, len(unique), 500):
+                batch = unique[i:i + 500]
+                rows.update((h, (slot, crc)) for h, slot, crc in self.conn.execute(
+                    f"SELECT hash, slot, crc FROM entries WHERE hash IN ({','.join('?' * len(batch))})", batch))
+            used, corrupt = [], []
+            for i, key in enumerate(keys):
+                row = rows.get(key)
+                if row is None or row[0] >= self._capacity:
+                    continue
+                raw = self._mm[row[0] * self.slot_bytes:(row[0] + 1) * self.slot_bytes]
+                if zlib.crc32(raw) != row[1]:
+                    corrupt.append(key)
+                    continue
+                results[i] = array('f', raw).tolist()
+                used.append(key)
+            self._tick += 1
+            with self.conn:
+                if used:
+                    self.conn.executemany("UPDATE entries SET last_used = ? WHERE hash = ?",
+                                          [(self._tick, k) for k in set(used)])
+                if corrupt:
+                    self.conn.executemany("DELETE FROM entries WHERE hash = ?", [(k,) for k in set(corrupt)])
+            self.hits += len(used)
+            self.misses += len(texts) - len(used)
+        return results
+
+    def put_many(self, texts: List[str], vectors: List[Any]):
+        """写入向量（维度与缓存不一致时清空后按新维度重建）"""
+        if not texts or self.max_bytes <= 0:
+            return
+        with self._lock:
+            dim = len(vectors[0])
+            if self.dim != dim:
+                self._reset(dim)
+            if self.max_slots == 0:
+                return
+            self._tick += 1
+            pending = {}
+            for text, vector in zip(texts, vectors):
+                pending[text_key(text)] = array('f', vector).tobytes()
+            existing = set()
+            keys = list(pending)
+            for i in range(0, len(keys), 500):
+                batch = keys[i:i + 500]
+                existing.update(r[0] for r in self.conn.execute(
+                    f"SELECT hash FROM entries WHERE hash IN ({','.join('?' * len(batch))})", batch))
+            new_keys = [k for k in keys if k not in existing][:self.max_slots]
+            if not new_keys:
+                return
+            with self.conn:
+                # 槽位从文件末尾顺序分配，满了再淘汰
+                next_slot = self.conn.execute("SELECT COALESCE(MAX(slot) + 1, 0) FROM entries").fetchone()[0]
+                free = list(range(next_slot, min(self.max_slots, next_slot + len(new_keys))))
+                shortage = len(new_keys) - len(free)
+                if shortage > 0 and self.conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0] < self.max_slots:
+                    # 校验失败删除的条目会留下空槽，优先复用
+                    taken = {r[0] for r in self.conn.execute("SELECT slot FROM entries")} | set(free)
+                    holes = [s for s in range(self.max_slots) if s not in taken][:shortage]
+                    free += holes
+                    shortage -= len(holes)
+                if shortage > 0:
+                    victims = self.conn.execute(
+                        "SELECT hash, slot FROM entries ORDER BY last_used LIMIT ?", (shortage,)).fetchall()
+                    self.conn.executemany("DELETE FROM entries WHERE hash = ?", [(h,) for h, _ in victims])
+                    free += [slot for _, slot in victims]
+                    self.evictions += len(victims)
+                self._ensure_capacity(max(free))
+                rows = []
+                for key, slot in zip(new_keys, free):
+                    raw = pending[key]
+                    self._mm[slot * self.slot_bytes:(slot + 1) * self.slot_bytes] = raw
+                    rows.append((key, slot, zlib.crc32(raw), self._tick))
+                self.conn.executemany(
+                    "INSERT INTO entries (hash, slot, crc, last_used) VALUES (?, ?, ?, ?)", rows)
+
+    # ==================== 统计 ====================
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            entries = self.conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+            total = self.hits + self.misses
+            return {
+                "entries": entries,
+                "max_entries": self.max_slots,
+                "bytes": self._capacity * self.slot_bytes if self.dim else 0,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / total, 3) if total else 0.0
+            }
+
+    def close(self):
+        with self._lock:
+            if self._mm is not None:
+                self._mm.flush()
+                self._mm.close()
+                self._mm = None
+            self._file.close()
+            self.conn.close()
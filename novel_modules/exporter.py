@@ -0,0 +1,326 @@
+"""
+全书导出
+按分卷顺序逐章读取正文（每章只读一次），同时分发给各格式的写入线程，
+边读边写入磁盘，内存中只保留少量待写章节：
+- txt: 纯文本
+- md: Markdown（卷为二级标题，章为三级标题）
+- epub: EPUB 3 电子书（zipfile 流式写入）
+- txt_volumes: 按分卷拆分的纯文本，打包为一个 zip
+总字数取自章节字数缓存，不为统计再读一遍正文
+"""
+
+import html
+import os
+import queue
+import threading
+import uuid
+import zipfile
+from datetime import datetime
+from typing import Optional, Dict, List, Any, Callable, Tuple
+
+# 每个格式写入线程的待写队列长度（决定导出时的内存上限）
+EXPORT_QUEUE_SIZE = 8
+
+# 未归属任何分卷的章节
+UNGROUPED_VOLUME = "未分卷"
+
+
+def _split_paragraphs(content: str) -> List[str]:
+    return [p.strip() for p in content.split("\n\n") if p.strip()]
+
+
+# ==================== 各格式写入器 ====================
+
+class TxtWriter:
+    """纯文本"""
+
+    suffix = ".txt"
+
+    def __init__(self, path: str, book_title: str, total_words: int):
+        self.f = open(path, 'w', encoding='utf-8')
+        self.f.write(f"《{book_title}》\n总字数：{total_words}\n{'=' * 30}\n\n\n")
+
+    def volume(self, title: str):
+        self.f.write(f"{title}\n{'=' * 20}\n\n")
+
+    def chapter(self, title: str, content: str):
+        self.f.write(f"{title}\n{'-' * 20}\n{content}\n\n\n")
+
+    def finish(self):
+        self.f.close()
+
+    def abort(self):
+        self.f.close()
+
+
+class MarkdownWriter(TxtWriter):
+    """Markdown"""
+
+    suffix = ".md"
+
+    def __init__(self, path: str, book_title: str, total_words: int):
+        self.f = open(path, 'w', encoding='utf-8')
+        self.f.write(f"# {book_title}\n\n> 总字数：{total_words}\n\n")
+
+    def volume(self, title: str):
+        self.f.write(f"## {title}\n\n")
+
+    def chapter(self, title: str, content: str):
+        self.f.write(f"### {title}\n\n")
+        for para in _split_paragraphs(content):
+            self.f.write(para.replace("\n", "  \n") + "\n\n")
+
+
+class VolumeTxtWriter:
+    """按分卷拆分的纯文本，每卷一个 txt，打包为 zip"""
+
+    suffix = "_分卷.zip"
+
+    def __init__(self, path: str, book_title: str, total_words: int):
+        self.zf = zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED)
+        self.book_title = book_title
+        self.entry = None
+        self.count = 0
+
+    def _close_entry(self):
+        if self.entry is not None:
+            self.entry.close()
+            self.entry = None
+
+    def volume(self, title: str):
+        self._close_entry()
+        self.count += 1
+        safe = "".join(c for c in title if c not in '\\/:*?"<>|').strip() or f"卷{self.count}"
+        self.entry = self.zf.open(f"{self.count:02d}_{safe}.txt", 'w')
+        self.entry.write(f"《{self.book_title}》 {title}\n{'=' * 30}\n\n\n".encode('utf-8'))
+
+    def chapter(self, title: str, content: str):
+        self.entry.write(f"{title}\n{'-' * 20}\n{content}\n\n\n".encode('utf-8'))
+
+    def finish(self):
+        self._close_entry()
+        self.zf.close()
+
+    def abort(self):
+        self.finish()
+
+
+class EpubWriter:
+    """EPUB 3（附 NCX 目录以兼容旧阅读器），章节页随读随写，目录与 OPF 在结束时写入"""
+
+    suffix = ".epub"
+
+    def __init__(self, path: str, book_title: str, total_words: int):
+        self.zf = zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED)
+        # mimetype 必须是第一个且不压缩
+        self.zf.writestr(zipfile.ZipInfo("mimetype"), "application/epub+zip", compress_type=zipfile.ZIP_STORED)
+        self.zf.writestr("META-INF/container.xml",
+                         '<?xml version="1.0" encoding="UTF-8"?>\n'
+                         '<container version="1.0" xmlns="urn:oasis:names:tc:opendocument:xmlns:container">'
+                         '<rootfiles><rootfile full-path="OEBPS/content.opf" media-type="application/oebps-package+xml"/>'
+                         '</rootfiles></container>')
+        self.book_title = book_title
+        self.uid = f"urn:uuid:{uuid.uuid4()}"
+        # (文件名, 标题, 是否为卷标题页)
+        self.pages: List[Tuple[str, str, bool]] = []
+
+    def _page(self, title: str, body: str) -> str:
+        return ('<?xml version="1.0" encoding="UTF-8"?>\n<!DOCTYPE html>\n'
+                '<html xmlns="http://www.w3.org/1999/xhtml" xml:lang="zh-CN">'
+                f'<head><meta charset="utf-8"/><title>{html.escape(title)}</title></head>'
+                f'<body>{body}</body></html>')
+
+    def volume(self, title: str):
+        name = f"page_{len(self.pages) + 1:05d}.xhtml"
+        self.zf.writestr(f"OEBPS/{name}", self._page(title, f"<h1>{html.escape(title)}</h1>"))
+        self.pages.append((name, title, True))
+
+    def chapter(self, title: str, content: str):
+        name = f"page_{len(self.pages) + 1:05d}.xhtml"
+        body = f"<h2>{html.escape(title)}</h2>" + "".join(
+            f"<p>{html.escape(p).replace(chr(10), '<br/>')}</p>" for p in _split_paragraphs(content))
+        self.zf.writestr(f"OEBPS/{name}", self._page(title, body))
+        self.pages.append((name, title, False))
+
+    def _nav(self) -> str:
+        items, open_volume = [], False
+        for name, title, is_volume in self.pages:
+            link = f'<a href="{name}">{html.escape(title)}</a>'
+            if is_volume:
+                if open_volume:
+                    items.append("</ol></li>")
+                items.append(f"<li>{link}<ol>")
+                open_volume = True
+            else:
+                items.append(f"<li>{link}</li>")
+        if open_volume:
+            items.append("</ol></li>")
+        return ('<?xml version="1.0" encoding="UTF-8"?>\n<!DOCTYPE html>\n'
+                '<html xmlns="http://www.w3.org/1999/xhtml" xmlns:epub="http://www.idpf.org/2007/ops" xml:lang="zh-CN">'
+                '<head><meta charset="utf-8"/><title>目录</title></head><body>'
+                f'<nav epub:type="toc"><h1>目录</h1><ol>{"".join(items)}</ol></nav></body></html>')
+
+    def _ncx(self) -> str:
+        points = "".join(
+            f'<navPoint id="np{i}" playOrder="{i}"><navLabel><text>{html.escape(title)}</text></navLabel>'
+            f'<content src="{name}"/></navPoint>'
+            for i, (name, title, _) in enumerate(self.pages, 1))
+        return ('<?xml version="1.0" encoding="UTF-8"?>\n'
+                '<ncx xmlns="http://www.daisy.org/z3986/2005/ncx/" version="2005-1">'
+                f'<head><meta name="dtb:uid" content="{self.uid}"/></head>'
+                f'<docTitle><text>{html.escape(self.book_title)}</text></docTitle>'
+                f'<navMap>{points}</navMap></ncx>')
+
+    def _opf(self) -> str:
+        modified = datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%SZ")
+        manifest = "".join(f'<item id="p{i}" href="{name}" media-type="application/xhtml+xml"/>'
+                           for i, (name, _, _) in enumerate(self.pages, 1))
+        spine = "".join(f'<itemref idref="p{i}"/>' for i in range(1, len(self.pages) + 1))
+        return ('<?xml version="1.0" encoding="UTF-8"?>\n'
+                '<package xmlns="http://www.idpf.org/2007/opf" version="3.0" unique-identifier="bookid" xml:lang="zh-CN">'
+                '<metadata xmlns:dc="http://purl.org/dc/elements/1.1/">'
+                f'<dc:identifier id="bookid">{self.uid}</dc:identifier>'
+                f'<dc:title>{html.escape(self.book_title)}</dc:title><dc:language>zh-CN</dc:language>'
+                f'<meta property="dcterms:modified">{modified}</meta></metadata>'
+                '<manifest><item id="nav" href="nav.xhtml" media-type="application/xhtml+xml" properties="nav"/>'
+                f'<item id="ncx" href="toc.ncx" media-type="application/x-dtbncx+xml"/>{manifest}</manifest>'
+                f'<spine toc="ncx">{spine}</spine></package>')
+
+    def finish(self):
+        self.zf.writestr("OEBPS/nav.xhtml", self._nav())
+        self.zf.writestr("OEBPS/toc.ncx", self._ncx())
+        self.zf.writestr("OEBPS/content.opf", self._opf())
+        self.zf.close()
+
+    def abort(self):
+        self.zf.close()
+
+
+# 格式 -> (显示名称, 写入器)
+EXPORT_FORMATS = {
+    "txt": ("TXT", TxtWriter),
+    "md": ("Markdown", MarkdownWriter),
+    "epub": ("EPUB", EpubWriter),
+    "txt_volumes": ("分卷 TXT", VolumeTxtWriter),
+}
+
+
+# ==================== 导出流程 ====================
+
+class _FormatWorker(threading.Thread):
+    """单个格式的写入线程：从有界队列取章节写入文件，出错后继续消费队列以免阻塞读取方"""
+
+    def __init__(self, writer_cls, path: str, book_title: str, total_words: int):
+        super().__init__(daemon=True)
+        self.writer_cls = writer_cls
+        self.path = path
+        self.args = (book_title, total_words)
+        self.queue = queue.Queue(maxsize=EXPORT_QUEUE_SIZE)
+        self.error: Optional[str] = None
+
+    def run(self):
+        writer = None
+        try:
+            writer = self.writer_cls(self.path, *self.args)
+        except Exception as e:
+            self.error = str(e)
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+            if self.error is not None:
+                continue
+            try:
+                if item[0] == "volume":
+                    writer.volume(item[1])
+                else:
+                    writer.chapter(item[1], item[2])
+            except Exception as e:
+                self.error = str(e)
+        if writer is None:
+            return
+        try:
+            if self.error is None:
+                writer.finish()
+            else:
+                writer.abort()
+        except Exception as e:
+            self.error = self.error or str(e)
+
+
+def ordered_chapters(volumes: List[Dict], structure: List[Dict]) -> List[Tuple[str, List[Dict]]]:
+    """按侧边栏顺序（分卷列表顺序，卷内按目录顺序）分组章节，无效分卷的章节归入“未分卷”"""
+    groups = []
+    known = set()
+    for vol in volumes:
+        known.add(vol['id'])
+        chapters = [c for c in structure if c.get('volume_id') == vol['id']]
+        if chapters:
+            groups.append((vol.get('title', ''), chapters))
+    orphans = [c for c in structure if c.get('volume_id') not in known]
+    if orphans:
+        groups.append((UNGROUPED_VOLUME, orphans))
+    return groups
+
+
+def export_novel(manager, formats: List[str], output_dir: Optional[str] = None,
+                 progress_callback: Optional[Callable[[int, int, str], None]] = None) -> Dict[str, Any]:
+    """
+    流式导出全书
+
+    Args:
+        manager: NovelManager
+        formats: 导出格式列表（EXPORT_FORMATS 的键）
+        output_dir: 输出目录，默认为项目下的 exports/
+        progress_callback: 进度回调 (done, total, message)
+
+    Returns:
+        {"files": {格式: 文件路径}, "errors": {格式: 错误信息}, "chapters": 章节数, "total_words": 总字数}
+    """
+    book_title = os.path.basename(os.path.normpath(manager.root_dir))
+    output_dir = output_dir or os.path.join(manager.root_dir, "exports")
+    os.makedirs(output_dir, exist_ok=True)
+    groups = ordered_chapters(manager.view_doc('volumes'), manager.view_doc('structure'))
+    chapter_ids = [c['id'] for _, chapters in groups for c in chapters]
+    # 字数取自缓存（保存时已写入），不另读正文
+    total_words = sum(manager.get_chapter_word_counts(chapter_ids).values())
+
+    stamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    workers = {}
+    for fmt in formats:
+        if fmt not in EXPORT_FORMATS:
+            continue
+        writer_cls = EXPORT_FORMATS[fmt][1]
+        path = os.path.join(output_dir, f"{book_title}_{stamp}{writer_cls.suffix}")
+        workers[fmt] = _FormatWorker(writer_cls, path, book_title, total_words)
+        workers[fmt].start()
+
+    def send(item):
+        for worker in workers.values():
+            worker.queue.put(item)
+
+    done = 0
+    try:
+        for vol_title, chapters in groups:
+            send(("volume", vol_title))
+            for chap in chapters:
+                content = manager.load_chapter_content(chap['id'])
+                send(("chapter", f"第{chap['id']}章 {chap['title']}", content))
+                done += 1
+                if progress_callback:
+                    progress_callback(done, len(chapter_ids), chap['title'])
+    finally:
+        send(None)
+        for worker in workers.values():
+            worker.join()
+
+    files, errors = {}, {}
+    for fmt, worker in workers.items():
+        if worker.error is None:
+            files[fmt] = worker.path
+        else:
+            errors[fmt] = worker.error
+            print(f"[Export] {fmt} 导出失败: {worker.error}")
+            try: os.remove(worker.path)
+            except OSError: pass
+    return {"files": files, "errors": errors, "chapters": len(chapter_ids), "total_words": total_words}
@@ -0,0 +1,184 @@
+"""
+向量库后台写入队列
+章节保存后只在这里登记"该章需要重新索引"，由有界的工作线程在后台完成切片与嵌入：
+- 队列落在 SQLite（每个向量库一个队列名），进程重启后未完成的章节继续处理
+- 同一章重复保存只保留一条任务；处理期间再次保存的，处理完后会再处理一次
+- 任务执行时才读取章节最新内容，合并后的多次保存只嵌入一次
+- 失败的任务按指数退避重试，超过次数后放弃并打印日志
+"""
+
+import os
+import sqlite3
+import threading
+import time
+from typing import Optional, Dict, List, Any, Callable, Iterable
+
+# 默认工作线程数
+DEFAULT_WORKERS = 2
+# 最大重试次数
+MAX_ATTEMPTS = 5
+# 首次重试等待（秒），之后每次翻倍
+RETRY_BASE_SECONDS = 2.0
+
+
+class IngestQueue:
+    """持久化、按章节合并的后台索引队列"""
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS jobs (
+        queue TEXT NOT NULL, chapter_id TEXT NOT NULL,
+        seq INTEGER NOT NULL, attempts INTEGER NOT NULL DEFAULT 0,
+        not_before REAL NOT NULL DEFAULT 0, enqueued_at REAL NOT NULL,
+        PRIMARY KEY (queue, chapter_id)
+    );
+    """
+
+    def __init__(self, db_path: str, queue_name: str, handler: Callable[[Any], Any],
+                 workers: int = DEFAULT_WORKERS):
+        """
+        Args:
+            db_path: 队列数据库文件
+            queue_name: 队列名（同一数据库可容纳多本书的队列）
+            handler: 处理函数 handler(chapter_id)，抛出异常视为失败
+            workers: 工作线程上限；线程按需启动，队列清空后退出
+        """
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        self.queue_name = queue_name
+        self.handler = handler
+        self.workers = max(1, int(workers))
+        self._cond = threading.Condition()
+        self._running: Dict[str, int] = {}  # 处理中的章节 -> 认领时的 seq
+        self._threads = 0
+        self._seq = 0
+        self._paused = True  # 处理函数就绪（resume）前只登记不处理
+        self.processed = 0
+        self.failed = 0
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(self.SCHEMA)
+        self._seq = self.conn.execute(
+            "SELECT COALESCE(MAX(seq), 0) FROM jobs WHERE queue = ?", (queue_name,)).fetchone()[0]
+
+    # ==================== 登记 ====================
+
+    def enqueue(self, chapter_ids: Iterable[Any]):
+        """登记需要重新索引的章节（已在队列中的只刷新版本号，不重复排队）"""
+        now = time.time()
+        with self._cond:
+            rows = []
+            for chapter_id in chapter_ids:
+                self._seq += 1
+                rows.append((self.queue_name, str(chapter_id), self._seq, now))
+            if not rows:
+                return
+            with self.conn:
+                self.conn.executemany(
+                    "INSERT INTO jobs (queue, chapter_id, seq, attempts, not_before, enqueued_at) "
+                    "VALUES (?, ?, ?, 0, 0, ?) "
+                    "ON CONFLICT (queue, chapter_id) DO UPDATE SET "
+                    "seq = excluded.seq, attempts = 0, not_before = 0", rows)
+            self._spawn()
+            self._cond.notify_all()
+
+    def resume(self):
+        """处理函数已就绪：开始处理（含上次退出时遗留的任务）"""
+        with self._cond:
+            self._paused = False
+            self._spawn()
+            self._cond.notify_all()
+
+    def pending_count(self) -> int:
+        """尚未完成的章节数（含处理中的）"""
+        with self._cond:
+            return self.conn.execute(
+                "SELECT COUNT(*) FROM jobs WHERE queue = ?", (self.queue_name,)).fetchone()[0]
+
+    def pending_ids(self) -> List[str]:
+        with self._cond:
+            return [r[0] for r in self.conn.execute(
+                "SELECT chapter_id FROM jobs WHERE queue = ? ORDER BY enqueued_at", (self.queue_name,))]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            return {"pending": self.pending_count(), "running": len(self._running),
+                    "threads": self._threads, "processed": self.processed, "failed": self.failed}
+
+    def wait_idle(self, timeout: Optional[float] = None) -> bool:
+        """等待队列清空（测试或退出前使用），返回是否已清空"""
+        deadline = None if timeout is None else time.time() + timeout
+        with self._cond:
+            while self.pending_count() > 0:
+                remaining = None if deadline is None else deadline - time.time()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining if remaining is not None else 1.0)
+            return True
+
+    # ==================== 工作线程 ====================
+
+    def _spawn(self):
+        """按待处理量补足工作线程（调用方持有 _cond）"""
+        if self._paused:
+            return
+        pending = self.conn.execute(
+            "SELECT COUNT(*) FROM jobs WHERE queue = ?", (self.queue_name,)).fetchone()[0]
+        while self._threads < min(self.workers, pending - len(self._running)):
+            self._threads += 1
+            threading.Thread(target=self._worker, daemon=True, name=f"ingest-{self._threads}").start()
+
+    def _claim(self):
+        """认领一个可执行的任务；没有可执行任务时返回 (None, 需等待秒数)"""
+        rows = self.conn.execute(
+            "SELECT chapter_id, seq, attempts, not_before FROM jobs WHERE queue = ? ORDER BY enqueued_at",
+            (self.queue_name,)).fetchall()
+        now = time.time()
+        wait = None
+        for chapter_id, seq, attempts, not_before in rows:
+            if chapter_id in self._running:
+                continue
+            if not_before > now:
+                wait = not_before - now if wait is None else min(wait, not_before - now)
+                continue
+            self._running[chapter_id] = seq
+            return (chapter_id, seq, attempts), None
+        return None, wait
+
+    def _worker(self):
+        while True:
+            with self._cond:
+                job, wait = self._claim()
+                if job is None:
+                    if wait is None:
+                        # 没有任务（其余在别的线程处理中）：线程退出
+                        self._threads -= 1
+                        self._cond.notify_all()
+                        return
+                    self._cond.wait(min(wait, 5.0))
+                    continue
+            chapter_id, seq, attempts = job
+            error = None
+            try:
+                self.handler(int(chapter_id) if chapter_id.lstrip('-').isdigit() else chapter_id)
+            except Exception as e:
+                error = e
+            with self._cond:
+                self._running.pop(chapter_id, None)
+                with self.conn:
+                    if error is None:
+                        # 处理期间又被保存过（seq 变化）则保留任务，稍后再处理一次
+                        self.conn.execute("DELETE FROM jobs WHERE queue = ? AND chapter_id = ? AND seq = ?",
+                                          (self.queue_name, chapter_id, seq))
+                        self.processed += 1
+                    elif attempts + 1 >= MAX_ATTEMPTS:
+                        print(f"[Ingest] 第{chapter_id}章索引失败 {MAX_ATTEMPTS} 次，已放弃: {error}")
+                        self.conn.execute("DELETE FROM jobs WHERE queue = ? AND chapter_id = ? AND seq = ?",
+                                          (self.queue_name, chapter_id, seq))
+                        self.failed += 1
+                    else:
+                        print(f"[Ingest] 第{chapter_id}章索引失败，稍后重试: {error}")
+                        self.conn.execute(
+                            "UPDATE jobs SET attempts = ?, not_before = ? WHERE queue = ? AND chapter_id = ? AND seq = ?",
+                            (attempts + 1, time.time() + RETRY_BASE_SECONDS * (2 ** attempts),
+                             self.queue_name, chapter_id, seq))
+                self._cond.notify_all()
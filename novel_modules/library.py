@@ -0,0 +1,170 @@
+"""
+书架清单
+书库目录下的 library.json 缓存每本书的元数据（字数、章节数、分卷数、最后修改时间、简介、向量库条目数），
+书架只读这一个文件即可排序、筛选和分页，不必逐本打开项目；
+各书保存时只更新自己的条目，文件在进程外被修改时按签名自动重新加载
+"""
+
+import json
+import os
+import threading
+from typing import Optional, Dict, List, Any, Tuple
+
+MANIFEST_FILE = "library.json"
+# 书架卡片上展示的简介长度
+SUMMARY_LENGTH = 120
+# 可排序字段
+SORT_KEYS = ("last_modified", "name", "word_count", "chapter_count")
+
+_manifests: Dict[str, "LibraryManifest"] = {}
+_manifests_lock = threading.Lock()
+
+
+def get_library_manifest(base_dir: str) -> "LibraryManifest":
+    """同一书库目录在进程内共享一个清单实例（书架与各书的管理器共用同一把锁）"""
+    key = os.path.abspath(base_dir)
+    with _manifests_lock:
+        manifest = _manifests.get(key)
+        if manifest is None:
+            manifest = _manifests[key] = LibraryManifest(base_dir)
+        return manifest
+
+
+class LibraryManifest:
+    """书库级元数据清单"""
+
+    VERSION = 1
+
+    def __init__(self, base_dir: str):
+        """
+        Args:
+            base_dir: 书库目录（每本书一个子目录）
+        """
+        self.base_dir = base_dir
+        self.path = os.path.join(base_dir, MANIFEST_FILE)
+        self._lock = threading.RLock()
+        self._signature = None
+        self.data = {"version": self.VERSION, "books": {}}
+
+    # ==================== 读写 ====================
+
+    def _file_signature(self) -> Optional[Tuple[int, int]]:
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return None
+        return (st.st_mtime_ns, st.st_size)
+
+    def _load(self):
+        """文件签名变化时重新读取（其他进程也可能更新清单）"""
+        signature = self._file_signature()
+        if signature == self._signature:
+            return
+        self._signature = signature
+        self.data = {"version": self.VERSION, "books": {}}
+        if signature is None:
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if data.get("version") == self.VERSION and isinstance(data.get("books"), dict):
+                self.data = data
+        except (json.JSONDecodeError, IOError) as e:
+            print(f"[Library] 书架清单读取失败，将重建: {e}")
+
+    def _save(self):
+        os.makedirs(self.base_dir, exist_ok=True)
+        tmp_file = self.path + ".tmp"
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump(self.data, f, ensure_ascii=False)
+        os.replace(tmp_file, self.path)
+        self._signature = self._file_signature()
+
+    # ==================== 条目 ====================
+
+    def get(self, name: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            self._load()
+            entry = self.data["books"].get(name)
+            return dict(entry) if entry is not None else None
+
+    def entries(self) -> Dict[str, Dict[str, Any]]:
+        """全部条目的副本 {书名: 元数据}"""
+        with self._lock:
+            self._load()
+            return {name: dict(entry) for name, entry in self.data["books"].items()}
+
+    def update(self, name: str, **fields) -> bool:
+        """
+        合并更新一本书的条目，只在有字段变化时写盘
+
+        Args:
+            name: 书名（即项目目录名）
+            **fields: word_count / chapter_count / volume_count / last_modified / summary / vector_count 等
+
+        Returns:
+            是否写入了新内容
+        """
+        with self._lock:
+            self._load()
+            entry = self.data["books"].setdefault(name, {})
+            changed = {k: v for k, v in fields.items() if entry.get(k) != v}
+            if not changed:
+                return False
+            entry.update(changed)
+            self._save()
+            return True
+
+    def remove(self, name: str):
+        with self._lock:
+            self._load()
+            if self.data["books"].pop(name, None) is not None:
+                self._save()
+
+    def rename(self, old_name: str, new_name: str):
+        with self._lock:
+            self._load()
+            entry = self.data["books"].pop(old_name, None)
+            if entry is not None:
+                self.data["books"][new_name] = entry
+                self._save()
+
+    def prune(self, names: List[str]):
+        """删除不在 names 中的条目（项目目录已在外部删除）"""
+        with self._lock:
+            self._load()
+            stale = [name for name in self.data["books"] if name not in names]
+            for name in stale:
+                del self.data["books"][name]
+            if stale:
+                self._save()
+
+
+def make_summary(settings: Dict) -> str:
+    """书架卡片简介：优先全书梗概，其次世界观"""
+    text = (settings.get("book_summary") or settings.get("world_view") or "").strip()
+    text = " ".join(text.split())
+    return text[:SUMMARY_LENGTH] + ("..." if len(text) > SUMMARY_LENGTH else "")
+
+
+def sort_books(books: List[Dict], sort_by: str = "last_modified", reverse: Optional[bool] = None) -> List[Dict]:
+    """
+    排序书架条目
+
+    Args:
+        books: 含 name 与元数据的条目列表
+        sort_by: SORT_KEYS 之一
+        reverse: 是否降序；None 时书名升序、其余降序
+
+    Returns:
+        排序后的新列表
+    """
+    if sort_by not in SORT_KEYS:
+        sort_by = "last_modified"
+    if reverse is None:
+        reverse = sort_by != "name"
+    if sort_by == "name":
+        key = lambda b: b["name"]
+    else:
+        key = lambda b: (b.get(sort_by) or 0, b["name"])
+    return sorted(books, key=key, reverse=reverse)
@@ -0,0 +1,67 @@
+"""
+异步 LLM 客户端
+进程内共享 AsyncOpenAI 客户端，底层为带连接池的 httpx.AsyncClient：
+- 多个会话同时流式生成时复用 keep-alive 连接，不为每次调用新建连接，也不占用线程
+- httpx 异步客户端只能在创建它的事件循环中使用，因此按事件循环分别缓存
+- API Key、Base URL 或连接数配置变化后，下次获取时换用新客户端，旧客户端在其事件循环中关闭
+"""
+
+import asyncio
+import threading
+import weakref
+from typing import Optional, Tuple
+
+import httpx
+from openai import AsyncOpenAI
+
+# 连接池默认上限（同时进行的请求数）
+DEFAULT_MAX_CONNECTIONS = 20
+# 空闲保活连接数上限
+DEFAULT_MAX_KEEPALIVE = 10
+# 流式生成时两次数据之间最长等待（秒）；建立连接单独限时
+DEFAULT_TIMEOUT = httpx.Timeout(120.0, connect=10.0)
+
+# 事件循环 -> (配置键, 客户端)
+_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Tuple[tuple, AsyncOpenAI]]" = weakref.WeakKeyDictionary()
+_clients_lock = threading.Lock()
+
+
+def get_async_client(api_key: str, base_url: Optional[str] = None,
+                     max_connections: Optional[int] = None) -> AsyncOpenAI:
+    """
+    获取当前事件循环共享的异步客户端（必须在协程中调用）
+
+    Args:
+        api_key: API Key
+        base_url: 接口地址，None 为官方地址
+        max_connections: 连接池上限，None 为 DEFAULT_MAX_CONNECTIONS
+
+    Returns:
+        AsyncOpenAI 客户端
+    """
+    loop = asyncio.get_running_loop()
+    max_connections = max(1, int(max_connections or DEFAULT_MAX_CONNECTIONS))
+    key = (api_key, base_url, max_connections)
+    with _clients_lock:
+        cached = _clients.get(loop)
+        if cached is not None and cached[0] == key:
+            return cached[1]
+        http_client = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=max_connections,
+                                max_keepalive_connections=min(max_connections, DEFAULT_MAX_KEEPALIVE)),
+            timeout=DEFAULT_TIMEOUT)
+        client = AsyncOpenAI(api_key=api_key, base_url=base_url, http_client=http_client)
+        _clients[loop] = (key, client)
+    if cached is not None:
+        # 配置已变化：旧客户端上正在进行的请求结束后关闭其连接池
+        loop.create_task(_close_later(cached[1]))
+    return client
+
+
+async def _close_later(client: AsyncOpenAI, delay: float = 300.0):
+    await asyncio.sleep(delay)
+    try:
+        await client.close()
+    except Exception as e:
+        print(f"[LLM Router] 关闭旧连接池失败: {e}")
+
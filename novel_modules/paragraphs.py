@@ -0,0 +1,213 @@
+"""
+章节段落序列
+段落使用稳定且永不复用的ID（p1, p2, ...，只增不减），顺序由独立的排序键 order 决定。
+插入、删除不会重新编号，审稿记录中的 paragraph_id 在编辑前后保持有效；
+ID 索引与排序键二分查找使按ID取段落为 O(1)、定位为 O(log n)
+"""
+
+import re
+from bisect import bisect_left, insort
+from difflib import SequenceMatcher
+from typing import Optional, Dict, List, Any, Callable
+
+# 相邻段落排序键的初始间隔
+ORDER_STEP = 1024.0
+# 间隔小于该值时整体重排排序键
+MIN_ORDER_GAP = 1e-6
+
+
+def paragraph_seq(para_id: Any) -> Optional[int]:
+    """解析 pN 形式的段落ID，返回 N"""
+    m = re.fullmatch(r'p(\d+)', str(para_id))
+    return int(m.group(1)) if m else None
+
+
+class ParagraphSequence:
+    """有序段落集合：稳定ID + 排序键 + ID 索引"""
+
+    def __init__(self, paragraphs: List[Dict], next_seq: int = 0):
+        """
+        Args:
+            paragraphs: 按顺序排列的段落列表（本对象接管其所有权）
+            next_seq: 下一个可分配的段落序号（已持久化的值）
+        """
+        self.items: List[Dict] = list(paragraphs)
+        seqs = [paragraph_seq(p.get('id')) for p in self.items]
+        self.next_seq = max([next_seq, 1] + [s + 1 for s in seqs if s is not None])
+
+        # 旧数据：缺失/重复ID 重新分配，缺失或乱序的排序键整体重排
+        seen = set()
+        for p in self.items:
+            if not p.get('id') or p['id'] in seen:
+                p['id'] = self.allocate_id()
+            seen.add(p['id'])
+        orders = [p.get('order') for p in self.items]
+        if any(o is None for o in orders) or any(a >= b for a, b in zip(orders, orders[1:])):
+            self.rebalance()
+        self._reindex()
+
+    def _reindex(self):
+        self._by_id = {p['id']: p for p in self.items}
+        self._orders = [p['order'] for p in self.items]
+
+    def __len__(self) -> int:
+        return len(self.items)
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def to_list(self) -> List[Dict]:
+        """返回段落列表副本"""
+        return [dict(p) for p in self.items]
+
+    def get(self, para_id: str) -> Optional[Dict]:
+        """按ID取段落，O(1)"""
+        return self._by_id.get(para_id)
+
+    def index_of(self, para_id: str) -> int:
+        """段落当前位置，O(log n)；不存在时返回 -1"""
+        p = self._by_id.get(para_id)
+        if p is None:
+            return -1
+        return bisect_left(self._orders, p['order'])
+
+    def allocate_id(self) -> str:
+        """分配新的段落ID（永不复用）"""
+        para_id = f"p{self.next_seq}"
+        self.next_seq += 1
+        return para_id
+
+    def order_after(self, after_id: Optional[str]) -> Optional[float]:
+        """
+        计算插入到 after_id 之后的排序键（after_id 为 None 表示开头）
+        间隔不足时返回 None，调用方需先 rebalance
+        """
+        idx = self.index_of(after_id) if after_id is not None else -1
+        prev_order = self._orders[idx] if idx >= 0 else 0.0
+        next_order = self._orders[idx + 1] if idx + 1 < len(self._orders) else prev_order + 2 * ORDER_STEP
+        order = (prev_order + next_order) / 2
+        if order - prev_order < MIN_ORDER_GAP or next_order - order < MIN_ORDER_GAP:
+            return None
+        return order
+
+    def rebalance(self):
+        """按当前顺序重新均匀分配排序键"""
+        for i, p in enumerate(self.items, 1):
+            p['order'] = i * ORDER_STEP
+        self._reindex()
+
+    def apply(self, op: Dict):
+        """应用单个段落操作（格式见 storage.apply_paragraph_ops）"""
+        kind = op.get("op")
+        if kind == "set":
+            old = self._by_id.get(op["id"])
+            if old is not None:
+                para = dict(op["para"])
+                para['order'] = old['order']
+                self.items[self.index_of(op["id"])] = para
+                self._by_id[op["id"]] = para
+        elif kind == "insert":
+            para = dict(op["para"])
+            if para.get('order') is None:
+                para['order'] = self.order_after(op.get("after"))
+            idx = bisect_left(self._orders, para['order'])
+            insort(self._orders, para['order'])
+            self.items.insert(idx, para)
+            self._by_id[para['id']] = para
+            seq = paragraph_seq(para['id'])
+            if seq is not None and seq >= self.next_seq:
+                self.next_seq = seq + 1
+        elif kind == "delete":
+            idx = self.index_of(op["id"])
+            if idx >= 0:
+                self.items.pop(idx)
+                self._orders.pop(idx)
+                del self._by_id[op["id"]]
+        elif kind == "rebalance":
+            self.rebalance()
+        elif kind == "renumber":
+            # 旧版日志中的重新编号操作
+            for i, p in enumerate(self.items, 1):
+                p['id'] = f"p{i}"
+            self.next_seq = max(self.next_seq, len(self.items) + 1)
+            self._reindex()
+
+    @staticmethod
+    def _align_block(old: List[Dict], texts: List[str]) -> Dict[int, Dict]:
+        """
+        在一段改动区内按文本相似度（保持先后顺序）配对新旧段落
+        返回 {新段落下标: 旧段落}；区块过大时退化为按位置配对
+        """
+        if not old or not texts:
+            return {}
+        if len(old) * len(texts) > 400:
+            return {k: old[k] for k in range(min(len(old), len(texts)))}
+        matched = {}
+        last = -1
+        for para in old:
+            best, best_ratio = None, 0.5
+            for k in range(last + 1, len(texts)):
+                matcher = SequenceMatcher(None, para['text'], texts[k], autojunk=False)
+                if matcher.quick_ratio() <= best_ratio:
+                    continue
+                ratio = matcher.ratio()
+                if ratio > best_ratio:
+                    best, best_ratio = k, ratio
+            if best is not None:
+                matched[best] = para
+                last = best
+        if not matched and len(old) == len(texts):
+            # 逐段改写：按位置对应
+            return {k: old[k] for k in range(len(old))}
+        return matched
+
+    def reconcile(self, texts: List[str], make_paragraph: Callable[[str, str], Dict]) -> List[Dict]:
+        """
+        将整章新文本（已切分的段落文本列表）与现有段落对齐，
+        未改动或原位修改的段落沿用原ID与排序键，新增段落分配新ID
+
+        Args:
+            texts: 新的段落文本列表
+            make_paragraph: (para_id, text) -> 段落字典
+
+        Returns:
+            新的段落列表（含 order）
+        """
+        old = self.items
+        matcher = SequenceMatcher(None, [p['text'] for p in old], texts, autojunk=False)
+        result: List[Dict] = []
+        for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+            if tag == 'equal':
+                result.extend(dict(old[i]) for i in range(i1, i2))
+            elif tag in ('replace', 'insert'):
+                matched = self._align_block(old[i1:i2], texts[j1:j2])
+                for k in range(j2 - j1):
+                    if k in matched:
+                        # 原位修改：保留ID与排序键
+                        para = make_paragraph(matched[k]['id'], texts[j1 + k])
+                        para['order'] = matched[k]['order']
+                    else:
+                        para = make_paragraph(self.allocate_id(), texts[j1 + k])
+                        para['order'] = None
+                    result.append(para)
+
+        # 为新增段落在前后邻居之间分配排序键
+        i = 0
+        while i < len(result):
+            if result[i]['order'] is not None:
+                i += 1
+                continue
+            j = i
+            while j < len(result) and result[j]['order'] is None:
+                j += 1
+            lo = result[i - 1]['order'] if i > 0 else 0.0
+            hi = result[j]['order'] if j < len(result) else lo + (j - i + 1) * ORDER_STEP
+            step = (hi - lo) / (j - i + 1)
+            if step < MIN_ORDER_GAP:
+                for n, p in enumerate(result, 1):
+                    p['order'] = n * ORDER_STEP
+                break
+            for k in range(i, j):
+                result[k]['order'] = lo + step * (k - i + 1)
+            i = j
+        return result
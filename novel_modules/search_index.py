@@ -0,0 +1,357 @@
+"""
+全文检索索引
+基于字符 bigram 的持久化倒排索引（SQLite），对中文无需分词。
+文档以 key 标识并按 group 分组（如某一章的全部段落、全部人物字段），
+支持按组增量同步、短语与多词查询，命中结果按 BM25 排序并返回位置与预览；
+rank() 另提供不要求全部命中的相关度排序，供 RAG 的词法召回使用
+"""
+
+import hashlib
+import json
+import math
+import re
+import sqlite3
+import threading
+from collections import Counter
+from typing import Optional, Dict, List, Any, Tuple, Iterable, Callable
+
+# 文本末尾哨兵，保证每个字符都至少出现在一个 bigram 的首位（单字查询可走前缀匹配）
+_SENTINEL = "\x00"
+_MAX_CHAR = "\U0010ffff"
+
+# BM25 参数
+BM25_K1 = 1.2
+BM25_B = 0.75
+# rank() 最多使用的查询 bigram 数（按文档频率从低到高取，高频 gram 区分度低且倒排最长）
+RANK_MAX_GRAMS = 64
+
+
+def text_bigrams(text: str) -> Counter:
+    """文本的 bigram 频次"""
+    padded = text + _SENTINEL
+    return Counter(padded[i:i + 2] for i in range(len(text)))
+
+
+def parse_query(query: str) -> List[str]:
+    """拆分查询：双引号内为短语，其余按空白分词"""
+    terms = []
+    for phrase, word in re.findall(r'"([^"]+)"|(\S+)', query or ""):
+        term = phrase or word
+        if term and term not in terms:
+            terms.append(term)
+    return terms
+
+
+def make_preview(text: str, term: str, window: int = 20) -> str:
+    """命中位置前后截取预览片段"""
+    idx = text.find(term)
+    if idx == -1: return text[:50]
+    start = max(0, idx - window)
+    end = min(len(text), idx + len(term) + window)
+    return f"...{text[start:end]}..."
+
+
+class NgramIndex:
+    """bigram 倒排索引"""
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS docs (
+        id INTEGER PRIMARY KEY, key TEXT UNIQUE NOT NULL, grp TEXT NOT NULL,
+        text TEXT NOT NULL, hash TEXT NOT NULL, length INTEGER NOT NULL, meta TEXT
+    );
+    CREATE INDEX IF NOT EXISTS idx_docs_grp ON docs (grp);
+    CREATE TABLE IF NOT EXISTS postings (
+        gram TEXT NOT NULL, doc INTEGER NOT NULL, tf INTEGER NOT NULL,
+        PRIMARY KEY (gram, doc)
+    ) WITHOUT ROWID;
+    CREATE INDEX IF NOT EXISTS idx_postings_doc ON postings (doc);
+    CREATE TABLE IF NOT EXISTS sources (
+        grp TEXT PRIMARY KEY, signature TEXT NOT NULL
+    );
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self._lock = threading.RLock()
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(self.SCHEMA)
+
+    # ==================== 写入 ====================
+
+    @staticmethod
+    def _hash(text: str, meta: Optional[Dict]) -> str:
+        raw = text + "\x01" + json.dumps(meta, ensure_ascii=False, sort_keys=True)
+        return hashlib.md5(raw.encode('utf-8')).hexdigest()
+
+    def _delete_ids(self, ids: Iterable[int]):
+        for doc_id in ids:
+            self.conn.execute("DELETE FROM postings WHERE doc = ?", (doc_id,))
+            self.conn.execute("DELETE FROM docs WHERE id = ?", (doc_id,))
+
+    def _upsert(self, key: str, text: str, group: str, meta: Optional[Dict], known_hash: Optional[str]) -> bool:
+        digest = self._hash(text, meta)
+        if digest == known_hash:
+            return False
+        row = self.conn.execute("SELECT id FROM docs WHERE key = ?", (key,)).fetchone()
+        if row:
+            self._delete_ids([row[0]])
+        cur = self.conn.execute(
+            "INSERT INTO docs (key, grp, text, hash, length, meta) VALUES (?, ?, ?, ?, ?, ?)",
+            (key, group, text, digest, len(text), json.dumps(meta, ensure_ascii=False)))
+        doc_id = cur.lastrowid
+        self.conn.executemany(
+            "INSERT INTO postings (gram, doc, tf) VALUES (?, ?, ?)",
+            [(gram, doc_id, tf) for gram, tf in text_bigrams(text).items()])
+        return True
+
+    def upsert(self, key: str, text: str, group: str, meta: Optional[Dict] = None) -> bool:
+        """写入单个文档，内容未变化时跳过；返回是否有更新"""
+        with self._lock, self.conn:
+            row = self.conn.execute("SELECT hash FROM docs WHERE key = ?", (key,)).fetchone()
+            return self._upsert(key, text, group, meta, row[0] if row else None)
+
+    def delete(self, key: str):
+        with self._lock, self.conn:
+            row = self.conn.execute("SELECT id FROM docs WHERE key = ?", (key,)).fetchone()
+            if row:
+                self._delete_ids([row[0]])
+
+    def sync_group(self, group: str, docs: Dict[str, Tuple[str, Optional[Dict]]],
+                   signature: Optional[Any] = None) -> int:
+        """
+        将一组文档同步为给定内容：新增/变化的重建倒排，多余的删除
+
+        Args:
+            group: 组名
+            docs: {key: (text, meta)}
+            signature: 数据源签名，记录后用于判断该组是否过期
+
+        Returns:
+            实际重建的文档数
+        """
+        with self._lock, self.conn:
+            existing = {k: (i, h) for i, k, h in self.conn.execute(
+                "SELECT id, key, hash FROM docs WHERE grp = ?", (group,)).fetchall()}
+            changed = 0
+            for key, (text, meta) in docs.items():
+                if self._upsert(key, text, group, meta, existing.get(key, (None, None))[1]):
+                    changed += 1
+            self._delete_ids(i for k, (i, _) in existing.items() if k not in docs)
+            self._set_signature(group, signature)
+        return changed
+
+    def delete_group(self, group: str):
+        with self._lock, self.conn:
+            ids = [r[0] for r in self.conn.execute("SELECT id FROM docs WHERE grp = ?", (group,)).fetchall()]
+            self._delete_ids(ids)
+            self.conn.execute("DELETE FROM sources WHERE grp = ?", (group,))
+
+    # ==================== 数据源签名 ====================
+
+    def _set_signature(self, group: str, signature: Optional[Any]):
+        if signature is None:
+            self.conn.execute("DELETE FROM sources WHERE grp = ?", (group,))
+        else:
+            self.conn.execute("INSERT OR REPLACE INTO sources (grp, signature) VALUES (?, ?)",
+                              (group, json.dumps(signature)))
+
+    def set_signature(self, group: str, signature: Optional[Any]):
+        """记录数据源签名（None 表示标记为过期）"""
+        with self._lock, self.conn:
+            self._set_signature(group, signature)
+
+    def get_signature(self, group: str) -> Optional[Any]:
+        with self._lock:
+            row = self.conn.execute("SELECT signature FROM sources WHERE grp = ?", (group,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def groups(self, prefix: str = "") -> List[str]:
+        """列出已索引的组（含仅记录了签名的空组）"""
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT grp FROM docs WHERE grp >= ? AND grp < ? UNION "
+                "SELECT grp FROM sources WHERE grp >= ? AND grp < ?",
+                (prefix, prefix + _MAX_CHAR, prefix, prefix + _MAX_CHAR)).fetchall()
+        return [r[0] for r in rows]
+
+    # ==================== 查询 ====================
+
+    def _candidate_ids(self, term: str, group_prefix: str) -> set:
+        """按 bigram 倒排求交集，得到可能包含 term 的文档（稀有 gram 优先）"""
+        if len(term) == 1:
+            rows = self.conn.execute(
+                "SELECT DISTINCT doc FROM postings WHERE gram >= ? AND gram <= ?",
+                (term, term + _MAX_CHAR)).fetchall()
+            ids = {r[0] for r in rows}
+        else:
+            grams = {term[i:i + 2] for i in range(len(term) - 1)}
+            dfs = sorted((self.conn.execute(
+                "SELECT COUNT(*) FROM postings WHERE gram = ?", (g,)).fetchone()[0], g) for g in grams)
+            ids = None
+            for df, gram in dfs:
+                if df == 0:
+                    return set()
+                docs = {r[0] for r in self.conn.execute(
+                    "SELECT doc FROM postings WHERE gram = ?", (gram,)).fetchall()}
+                ids = docs if ids is None else ids & docs
+                if not ids:
+                    return set()
+        if group_prefix and ids:
+            allowed = {r[0] for r in self.conn.execute(
+                "SELECT id FROM docs WHERE grp >= ? AND grp < ?",
+                (group_prefix, group_prefix + _MAX_CHAR)).fetchall()}
+            ids &= allowed
+        return ids
+
+    def _corpus_stats(self) -> Tuple[int, float]:
+        row = self.conn.execute("SELECT COUNT(*), AVG(length) FROM docs").fetchone()
+        return row[0] or 0, row[1] or 1.0
+
+    def search(self, query: str, limit: Optional[int] = 50, literal: bool = False,
+               group_prefix: str = "", max_positions: int = 50) -> List[Dict]:
+        """
+        查询（所有词都必须出现在同一文档中）
+
+        Args:
+            query: 查询串；literal=False 时支持 "短语" 与空格分隔的多词
+            limit: 最多返回条数，None 表示不限
+            literal: 为 True 时整个 query 作为一个精确短语
+            group_prefix: 只在组名以此开头的文档中查找
+            max_positions: 每个文档最多返回的命中位置数
+
+        Returns:
+            [{"key", "group", "meta", "score", "count", "positions", "preview"}, ...]，按得分降序
+        """
+        terms = [query] if literal else parse_query(query)
+        if not terms or not all(terms):
+            return []
+        with self._lock:
+            candidates = None
+            for term in sorted(terms, key=len, reverse=True):
+                ids = self._candidate_ids(term, group_prefix)
+                candidates = ids if candidates is None else candidates & ids
+                if not candidates:
+                    return []
+            n_docs, avg_len = self._corpus_stats()
+            rows = []
+            id_list = list(candidates)
+            for i in range(0, len(id_list), 500):
+                batch = id_list[i:i + 500]
+                rows += self.conn.execute(
+                    f"SELECT id, key, grp, text, length, meta FROM docs WHERE id IN ({','.join('?' * len(batch))})",
+                    batch).fetchall()
+
+        # 逐文档核对精确命中位置（bigram 只做候选过滤）
+        matches = []
+        df = Counter()
+        for doc_id, key, group, text, length, meta in rows:
+            positions = {}
+            for term in terms:
+                found, start = [], text.find(term)
+                while start != -1:
+                    found.append(start)
+                    start = text.find(term, start + len(term))
+                if not found:
+                    break
+                positions[term] = found
+            else:
+                matches.append((key, group, text, length, meta, positions))
+                df.update(positions.keys())
+
+        hits = []
+        for key, group, text, length, meta, positions in matches:
+            score = 0.0
+            for term, found in positions.items():
+                idf = math.log(1 + (n_docs - df[term] + 0.5) / (df[term] + 0.5))
+                tf = len(found)
+                score += idf * tf * (BM25_K1 + 1) / (tf + BM25_K1 * (1 - BM25_B + BM25_B * length / avg_len))
+            first = terms[0]
+            hits.append({
+                "key": key,
+                "group": group,
+                "meta": json.loads(meta) if meta else None,
+                "score": round(score, 4),
+                "count": len(positions[first]),
+                "positions": positions[first][:max_positions],
+                "preview": make_preview(text, first)
+            })
+        hits.sort(key=lambda h: h["score"], reverse=True)
+        return hits if limit is None else hits[:limit]
+
+    def doc_count(self, group_prefix: str = "") -> int:
+        with self._lock:
+            return self.conn.execute(
+                "SELECT COUNT(*) FROM docs WHERE grp >= ? AND grp < ?",
+                (group_prefix, group_prefix + _MAX_CHAR)).fetchone()[0]
+
+    def rank(self, query: str, limit: int = 20, group_prefix: str = "",
+             doc_filter: Optional[Callable[[Optional[Dict]], bool]] = None) -> List[Dict]:
+        """
+        相关度排序查询（不要求全部命中）：查询串拆成 bigram，按 BM25 累加各 gram 的得分
+        适合长问句召回（如章节大纲），人名、功法名等专有名词的 bigram 文档频率低，权重自然更高
+
+        Args:
+            query: 查询串
+            limit: 最多返回条数
+            group_prefix: 只在组名以此开头的文档中查找
+            doc_filter: 按文档 meta 过滤，返回 False 的文档跳过
+
+        Returns:
+            [{"key", "group", "meta", "text", "score", "match"}, ...]，按得分降序
+            match 为得分相对"平均长度文档各 gram 恰好出现一次"的比例（上限 1），可跨查询比较，
+            用于判断命中是否足够相关
+        """
+        query = query.strip()
+        grams = text_bigrams(query)
+        grams.pop(query[-1:] + _SENTINEL, None)
+        if not grams:
+            return []
+        with self._lock:
+            n_docs, avg_len = self._corpus_stats()
+            if n_docs == 0:
+                return []
+            dfs = []
+            # 参照得分：平均长度文档中每个 gram 出现一次时词频项为 1；语料中没有的 gram 同样计入，
+            # 这样只命中查询中一小部分（常见）gram 的文档 match 较低
+            max_score = 0.0
+            for gram in grams:
+                df = self.conn.execute("SELECT COUNT(*) FROM postings WHERE gram = ?", (gram,)).fetchone()[0]
+                if df:
+                    dfs.append((df, gram))
+                else:
+                    max_score += math.log(1 + (n_docs + 0.5) / 0.5) * grams[gram]
+            dfs.sort()
+            scores: Dict[int, float] = {}
+            for df, gram in dfs[:RANK_MAX_GRAMS]:
+                idf = math.log(1 + (n_docs - df + 0.5) / (df + 0.5))
+                max_score += idf * grams[gram]
+                for doc_id, tf, length in self.conn.execute(
+                        "SELECT p.doc, p.tf, d.length FROM postings p JOIN docs d ON d.id = p.doc "
+                        "WHERE p.gram = ? AND d.grp >= ? AND d.grp < ?",
+                        (gram, group_prefix, group_prefix + _MAX_CHAR)):
+                    norm = tf * (BM25_K1 + 1) / (tf + BM25_K1 * (1 - BM25_B + BM25_B * length / avg_len))
+                    scores[doc_id] = scores.get(doc_id, 0.0) + idf * norm * grams[gram]
+
+            ranked = sorted(scores.items(), key=lambda s: s[1], reverse=True)
+            hits = []
+            for i in range(0, len(ranked), 200):
+                batch = ranked[i:i + 200]
+                rows = {r[0]: r[1:] for r in self.conn.execute(
+                    f"SELECT id, key, grp, text, meta FROM docs WHERE id IN ({','.join('?' * len(batch))})",
+                    [doc_id for doc_id, _ in batch])}
+                for doc_id, score in batch:
+                    key, group, text, meta = rows[doc_id]
+                    meta = json.loads(meta) if meta else None
+                    if doc_filter is not None and not doc_filter(meta):
+                        continue
+                    hits.append({"key": key, "group": group, "meta": meta, "text": text, "score": round(score, 4),
+                                 "match": round(min(score / max_score, 1.0), 4) if max_score else 0.0})
+                    if len(hits) >= limit:
+                        return hits
+            return hits
+
+    def close(self):
+        with self._lock:
+            self.conn.close()
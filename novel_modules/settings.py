@@ -544,8 +544,24 @@ def refresh_api_ui():
                     .bind_value(local_cfg, 'api_key').classes('w-full').props('type=password')
                 ui.input('Base URL', value=local_cfg.get('base_url', '')) \
                     .bind_value(local_cfg, 'base_url').classes('w-full')
+                ui.number('最大并发连接数', value=local_cfg.get('llm_max_connections', 20), min=1, max=200) \
+                    .bind_value(local_cfg, 'llm_max_connections').classes('w-full') \
+                    .tooltip('流式生成共享的 HTTP 连接池上限，多人同时使用时可调高')
+                ui.number('审稿并发请求数', value=local_cfg.get('review_concurrency', 4), min=1, max=16) \
+                    .bind_value(local_cfg, 'review_concurrency').classes('w-full') \
+                    .tooltip('多维度审稿、分段审稿时同时发出的请求数，接口限流较严时可调低')
+                ui.select({'multi': '分维度审稿（每维度一次请求）', 'consolidated': '合并审稿（一次请求，正文只发送一次）'},
+                          value=local_cfg.get('review_mode', 'multi'), label='审稿模式') \
+                    .bind_value(local_cfg, 'review_mode').classes('w-full') \
+                    .tooltip('合并审稿可大幅减少输入 token，两种模式的消耗可在费用管理中对比')
                 ui.number('Chunk Size (RAG切片大小)', value=local_cfg.get('chunk_size', 500), min=100, max=2000) \
                     .bind_value(local_cfg, 'chunk_size').classes('w-full')
+                ui.number('RAG 词法检索权重', value=local_cfg.get('rag_lexical_weight', 0.5), min=0.0, max=1.0, step=0.1, format='%.1f') \
+                    .bind_value(local_cfg, 'rag_lexical_weight').classes('w-full') \
+                    .tooltip('与向量检索按排名融合：0 为纯向量检索，1 为纯关键词(BM25)检索；人名、功法名等专有名词较多时可调高')
+                ui.switch('RAG 只检索本卷', value=local_cfg.get('rag_volume_scope', False)) \
+                    .bind_value(local_cfg, 'rag_volume_scope') \
+                    .tooltip('生成正文时只从当前分卷的历史章节中检索背景片段')
 
         # 2. 模型路由配置
         with ui.card().classes('w-full p-4 mb-4 bg-green-50'):
@@ -570,6 +586,9 @@ def refresh_api_ui():
             ui.number('自动备份间隔 (分钟)', value=local_cfg.get('backup_interval', 30), min=0, max=1440) \
                 .bind_value(local_cfg, 'backup_interval').classes('w-full') \
                 .tooltip('设置为 0 则关闭自动备份')
+            ui.number('保留备份数', value=local_cfg.get('backup_keep', 20), min=1, max=500) \
+                .bind_value(local_cfg, 'backup_keep').classes('w-full') \
+                .tooltip('增量备份只存储变化的文件，保留更多备份占用的空间也很少')
             ui.label('💡 提示：每次点击"保存"按钮时，系统会自动为当前章节创建"历史快照"。').classes('text-xs text-grey-600 mt-2')
 
         # 保存按钮
@@ -617,6 +636,7 @@ def refresh_prompts_ui():
         '辅助类': [
             ('knowledge_filter_system', '🧹 知识清洗', '过滤RAG检索结果的提示词'),
             ('summary_chapter_system', '📄 章节摘要', '生成章节摘要的提示词'),
+            ('summary_volume_system', '📚 分卷摘要', '由本卷章节摘要汇总分卷摘要的提示词'),
             ('summary_book_system', '📖 全书总结', '生成全书总纲的提示词'),
             ('inspiration_assistant_system', '💡 灵感助手', '灵感百宝箱使用的提示词'),
         ],
@@ -786,10 +806,43 @@ def open_global_search_dialog():
                 
                 async def execute():
                     confirm_d.close()
-                    ui.notify('正在批量替换...', spinner=True)
-                    msg = await run.io_bound(manager.global_replace, selected_results, old_term, new_term)
-                    ui.notify(msg, type='positive', timeout=5000)
+
+                    # 替换在工作线程中逐章进行，进度由定时器轮询刷新
+                    progress = {"done": 0, "total": 1, "message": "准备中..."}
+                    def on_progress(done, total, message):
+                        progress.update(done=done, total=max(total, 1), message=message)
+
+                    with ui.dialog().props('persistent') as progress_d, ui.card().classes('w-96'):
+                        ui.label('正在批量替换...').classes('text-h6')
+                        progress_bar = ui.linear_progress(value=0, show_value=False).classes('w-full')
+                        progress_label = ui.label('').classes('text-sm text-grey-7')
+                    progress_d.open()
+
+                    def refresh_progress():
+                        progress_bar.set_value(progress['done'] / progress['total'])
+                        progress_label.set_text(f"{progress['message']} ({progress['done']}/{progress['total']})")
+                    progress_timer = ui.timer(0.2, refresh_progress)
+
+                    try:
+                        msg, changed_chapters = await run.io_bound(
+                            manager.global_replace, selected_results, old_term, new_term, on_progress)
+                    finally:
+                        progress_timer.cancel()
+                        progress_d.close()
+                    msg_type = 'negative' if msg.startswith('替换失败') else ('warning' if msg.startswith('替换中断') else 'positive')
+                    ui.notify(msg, type=msg_type, timeout=5000)
                     dialog.close()
+
+                    # 内存中的设定与资料同步为替换后的版本，避免后续保存覆盖
+                    app_state.settings = manager.load_settings()
+                    app_state.structure = manager.load_structure()
+                    app_state.characters = manager.load_characters()
+                    app_state.items = manager.load_items()
+                    app_state.locations = manager.load_locations()
+
+                    # 只为正文有改动的章节排队增量更新向量库
+                    if changed_chapters:
+                        app_state.queue_memory_updates(changed_chapters)
                     # 刷新一下当前章节，防止编辑器里还是旧的
                     from . import writing
                     if app_state.current_chapter_idx >= 0:
@@ -1012,7 +1065,24 @@ def refresh_billing_ui():
                         # 金额
                         ui.label(f'¥{day["cost"]:.3f}').classes('text-xs text-blue-600')
 
-        # 4. 详细记录
+        # 4. 审稿模式对比
+        review_modes = billing.get_review_mode_stats()
+        if review_modes:
+            with ui.card().classes('w-full p-4 mb-4 bg-white'):
+                ui.label('🧾 审稿模式对比（每次审稿平均）').classes('text-lg font-bold text-grey-8 mb-2')
+                mode_names = {'multi': '分维度审稿', 'consolidated': '合并审稿',
+                              'consolidated_failed': '合并审稿失败（已改用分维度）'}
+                with ui.grid(columns=2).classes('w-full gap-4'):
+                    for mode, s in review_modes.items():
+                        with ui.card().classes('p-3 bg-grey-1'):
+                            ui.label(f"{mode_names.get(mode, mode)} · {s['reviews']} 次").classes('font-bold')
+                            ui.label(f"输入 {s['avg_input_tokens']} tokens | 请求 {s['calls'] // max(s['reviews'], 1)} 次 | ¥{s['avg_cost']:.4f}").classes('text-sm')
+                            if s['cached_input_tokens']:
+                                ui.label(f"前缀缓存命中 {s['cached_input_tokens']} tokens").classes('text-xs text-grey-6')
+                            if s['saved_input_tokens']:
+                                ui.label(f"累计节省输入约 {s['saved_input_tokens']} tokens").classes('text-xs text-green-600')
+
+        # 5. 详细记录
         with ui.card().classes('w-full p-4 bg-white'):
             with ui.row().classes('w-full justify-between items-center mb-2'):
                 ui.label('📜 调用记录').classes('text-lg font-bold text-grey-8')
@@ -0,0 +1,304 @@
+"""
+章节历史快照存储
+每章一个内容寻址的对象库（snapshots/chapters/{章节ID}/），对象以全文 SHA-256 命名：
+- 相同内容只存一份（重复保存不产生新对象，与最新版本相同时不记录新快照）
+- 同一章的后续版本按行存为相对上一版本的差量，每隔 KEYFRAME_INTERVAL 个版本存一次完整关键帧
+- 对象均经 zlib 压缩
+每章的 index.json 记录该章的快照列表（时间、大小、预览、哈希）与对象依赖关系，
+保存一章只重写该章的索引，列出历史也只读这一个文件；
+旧版 snapshots/{章节ID}/*.txt 在首次访问该章时自动导入，全书共用的 snapshots/index.json 在打开时拆分
+"""
+
+import glob
+import hashlib
+import json
+import os
+import shutil
+import threading
+import zlib
+from datetime import datetime
+from difflib import SequenceMatcher
+from typing import Optional, Dict, List, Any
+
+# 差量链最大长度，超过后存完整关键帧
+KEYFRAME_INTERVAL = 16
+# 单章保留的快照数
+MAX_SNAPSHOTS_PER_CHAPTER = 50
+# 差量中新增内容超过全文该比例时直接存全文
+DELTA_MAX_RATIO = 0.5
+
+
+def compute_line_delta(base: str, text: str) -> List:
+    """
+    计算 text 相对 base 的按行差量
+    返回操作列表：["c", i1, i2] 复制 base 的第 i1~i2 行，["i", "内容"] 插入新内容
+    """
+    base_lines = base.splitlines(keepends=True)
+    lines = text.splitlines(keepends=True)
+    ops = []
+    for tag, i1, i2, j1, j2 in SequenceMatcher(None, base_lines, lines, autojunk=False).get_opcodes():
+        if tag == 'equal':
+            ops.append(["c", i1, i2])
+        elif j2 > j1:
+            ops.append(["i", "".join(lines[j1:j2])])
+    return ops
+
+
+def apply_line_delta(base: str, ops: List) -> str:
+    """按差量还原全文"""
+    base_lines = base.splitlines(keepends=True)
+    parts = []
+    for op in ops:
+        if op[0] == "c":
+            parts.extend(base_lines[op[1]:op[2]])
+        else:
+            parts.append(op[1])
+    return "".join(parts)
+
+
+class SnapshotStore:
+    """内容寻址 + 差量压缩的章节快照库（按章节分别存储）"""
+
+    INDEX_VERSION = 2
+
+    def __init__(self, snapshot_dir: str):
+        """
+        Args:
+            snapshot_dir: 项目的 snapshots 目录
+        """
+        self.snapshot_dir = snapshot_dir
+        self.chapters_dir = os.path.join(snapshot_dir, "chapters")
+        self._lock = threading.RLock()
+        self._chapters: Dict[str, Dict] = {}  # 已加载的章节索引
+        with self._lock:
+            self._split_shared_index()
+
+    # ==================== 索引 ====================
+
+    def _chapter_dir(self, chapter_id: Any) -> str:
+        return os.path.join(self.chapters_dir, str(chapter_id))
+
+    def _chapter(self, chapter_id: Any) -> Dict:
+        """章节索引 {"version", "snapshots": [快照...], "objects": {哈希: {"base", "depth"}}}，首次访问时导入旧快照"""
+        key = str(chapter_id)
+        if key in self._chapters:
+            return self._chapters[key]
+        index = {"version": self.INDEX_VERSION, "snapshots": [], "objects": {}}
+        index_file = os.path.join(self._chapter_dir(key), "index.json")
+        if os.path.exists(index_file):
+            try:
+                with open(index_file, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                if data.get("version") == self.INDEX_VERSION:
+                    index = data
+            except (json.JSONDecodeError, IOError) as e:
+                print(f"[Snapshot] 第{key}章索引读取失败: {e}")
+        self._chapters[key] = index
+        self._import_legacy(key)
+        return index
+
+    def _save_chapter(self, chapter_id: Any):
+        key = str(chapter_id)
+        chapter_dir = self._chapter_dir(key)
+        os.makedirs(chapter_dir, exist_ok=True)
+        index_file = os.path.join(chapter_dir, "index.json")
+        tmp_file = index_file + ".tmp"
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump(self._chapters[key], f, ensure_ascii=False)
+        os.replace(tmp_file, index_file)
+
+    # ==================== 对象 ====================
+
+    def _object_path(self, chapter_id: Any, digest: str) -> str:
+        return os.path.join(self._chapter_dir(chapter_id), digest[:2], digest[2:])
+
+    def _write_object(self, chapter_id: Any, digest: str, payload: Dict):
+        path = self._object_path(chapter_id, digest)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_file = path + ".tmp"
+        with open(tmp_file, 'wb') as f:
+            f.write(zlib.compress(json.dumps(payload, ensure_ascii=False).encode('utf-8'), 9))
+        os.replace(tmp_file, path)
+
+    def _read_object(self, chapter_id: Any, digest: str) -> Dict:
+        with open(self._object_path(chapter_id, digest), 'rb') as f:
+            return json.loads(zlib.decompress(f.read()).decode('utf-8'))
+
+    def _resolve(self, chapter_id: Any, digest: str) -> str:
+        """沿差量链回溯到关键帧，再逐级应用差量得到全文"""
+        chain = []
+        payload = self._read_object(chapter_id, digest)
+        while "text" not in payload:
+            chain.append(payload["ops"])
+            payload = self._read_object(chapter_id, payload["base"])
+        text = payload["text"]
+        for ops in reversed(chain):
+            text = apply_line_delta(text, ops)
+        return text
+
+    def _store_object(self, chapter_id: Any, content: str, base: Optional[str]) -> str:
+        """写入内容对象（已存在则直接复用），返回哈希"""
+        digest = hashlib.sha256(content.encode('utf-8')).hexdigest()
+        objects = self._chapter(chapter_id)["objects"]
+        if digest in objects and os.path.exists(self._object_path(chapter_id, digest)):
+            return digest
+
+        payload, depth = {"text": content}, 0
+        if base is not None and base in objects and objects[base]["depth"] + 1 < KEYFRAME_INTERVAL:
+            try:
+                ops = compute_line_delta(self._resolve(chapter_id, base), content)
+                inserted = sum(len(op[1]) for op in ops if op[0] == "i")
+                if inserted <= len(content) * DELTA_MAX_RATIO:
+                    payload, depth = {"base": base, "ops": ops}, objects[base]["depth"] + 1
+            except (OSError, ValueError, KeyError) as e:
+                print(f"[Snapshot] 基准版本读取失败，改存全文: {e}")
+        self._write_object(chapter_id, digest, payload)
+        objects[digest] = {"base": payload.get("base"), "depth": depth}
+        return digest
+
+    # ==================== 旧数据导入 ====================
+
+    def _import_legacy(self, chapter_id: str) -> bool:
+        """导入旧版 snapshots/{章节ID}/*.txt 全文快照，导入后删除原文件"""
+        legacy_dir = os.path.join(self.snapshot_dir, chapter_id)
+        if not os.path.isdir(legacy_dir):
+            return False
+        files = sorted(glob.glob(os.path.join(legacy_dir, "*.txt")))
+        for path in files:
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    content = f.read()
+            except (OSError, UnicodeDecodeError) as e:
+                print(f"[Snapshot] 旧快照读取失败 {path}: {e}")
+                continue
+            self._append(chapter_id, content, os.path.basename(path)[:-4])
+        # 索引落盘后再删除旧文件
+        self._save_chapter(chapter_id)
+        for path in files:
+            try: os.remove(path)
+            except OSError: pass
+        try: os.rmdir(legacy_dir)
+        except OSError: pass
+        if files:
+            print(f"[Snapshot] 第{chapter_id}章导入 {len(files)} 个旧快照")
+        return True
+
+    def _split_shared_index(self):
+        """把全书共用的 snapshots/index.json（及 objects/ 对象库）拆分到各章目录"""
+        shared_index = os.path.join(self.snapshot_dir, "index.json")
+        if not os.path.exists(shared_index):
+            return
+        shared_objects = os.path.join(self.snapshot_dir, "objects")
+        try:
+            with open(shared_index, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (json.JSONDecodeError, IOError) as e:
+            print(f"[Snapshot] 旧索引读取失败，跳过拆分: {e}")
+            return
+        objects = data.get("objects", {})
+        for key, entries in data.get("chapters", {}).items():
+            chapter_objects = {}
+            for e in entries:
+                digest = e["hash"]
+                while digest is not None and digest not in chapter_objects and digest in objects:
+                    chapter_objects[digest] = objects[digest]
+                    src = os.path.join(shared_objects, digest[:2], digest[2:])
+                    dst = self._object_path(key, digest)
+                    os.makedirs(os.path.dirname(dst), exist_ok=True)
+                    try:
+                        shutil.copyfile(src, dst)
+                    except OSError as err:
+                        print(f"[Snapshot] 对象迁移失败 {digest[:8]}: {err}")
+                    digest = objects[digest].get("base")
+            self._chapters[key] = {"version": self.INDEX_VERSION, "snapshots": entries, "objects": chapter_objects}
+            self._save_chapter(key)
+        # 各章落盘后再删除共用索引与对象库
+        os.remove(shared_index)
+        shutil.rmtree(shared_objects, ignore_errors=True)
+        print(f"[Snapshot] 快照索引已按章节拆分（{len(data.get('chapters', {}))} 章）")
+
+    # ==================== 公共接口 ====================
+
+    def _append(self, chapter_id: Any, content: str, raw_ts: str) -> Optional[str]:
+        entries = self._chapter(chapter_id)["snapshots"]
+        base = entries[-1]["hash"] if entries else None
+        digest = self._store_object(chapter_id, content, base)
+        if digest == base:
+            return None  # 与最新版本相同，不重复记录
+        try:
+            display_time = datetime.strptime(raw_ts, "%Y%m%d_%H%M%S").strftime("%Y-%m-%d %H:%M:%S")
+        except ValueError:
+            display_time = raw_ts
+        entries.append({
+            "hash": digest,
+            "raw_ts": raw_ts,
+            "time": display_time,
+            "size": len(content),
+            "preview": content[:100].replace("\n", " ") + "..."
+        })
+        if len(entries) > MAX_SNAPSHOTS_PER_CHAPTER:
+            del entries[:-MAX_SNAPSHOTS_PER_CHAPTER]
+            self._collect_garbage(chapter_id)
+        return digest
+
+    def add(self, chapter_id: Any, content: str) -> Optional[str]:
+        """
+        记录章节快照（只重写该章的索引）
+
+        Returns:
+            快照ID；与该章最新快照内容相同时返回 None
+        """
+        with self._lock:
+            digest = self._append(chapter_id, content, datetime.now().strftime("%Y%m%d_%H%M%S"))
+            if digest is None:
+                return None
+            self._save_chapter(chapter_id)
+            return f"{chapter_id}:{digest}"
+
+    def list_snapshots(self, chapter_id: Any) -> List[Dict]:
+        """章节快照列表（新的在前），只读该章索引不读对象"""
+        with self._lock:
+            entries = self._chapter(chapter_id)["snapshots"]
+            return [{"id": f"{chapter_id}:{e['hash']}", "time": e["time"], "raw_ts": e["raw_ts"],
+                     "size": e["size"], "preview": e["preview"]} for e in reversed(entries)]
+
+    def read(self, snapshot_id: str) -> Optional[str]:
+        """读取快照全文（snapshot_id 为 list_snapshots 返回的 id），不存在或损坏时返回 None"""
+        chapter_id, _, digest = str(snapshot_id).rpartition(":")
+        with self._lock:
+            if not chapter_id or digest not in self._chapter(chapter_id)["objects"]:
+                return None
+            try:
+                return self._resolve(chapter_id, digest)
+            except (OSError, ValueError, KeyError, zlib.error) as e:
+                print(f"[Snapshot] 快照读取失败: {e}")
+                return None
+
+    def _collect_garbage(self, chapter_id: Any):
+        """删除该章不再被任何快照（及其差量链）引用的对象"""
+        index = self._chapter(chapter_id)
+        objects = index["objects"]
+        live = set()
+        for e in index["snapshots"]:
+            digest = e["hash"]
+            while digest is not None and digest not in live:
+                live.add(digest)
+                digest = objects.get(digest, {}).get("base")
+        for digest in [d for d in objects if d not in live]:
+            del objects[digest]
+            try: os.remove(self._object_path(chapter_id, digest))
+            except OSError: pass
+
+    def stats(self) -> Dict[str, Any]:
+        """快照数、对象数与对象占用字节数（遍历全部章节）"""
+        with self._lock:
+            totals = {"snapshots": 0, "objects": 0, "bytes": 0}
+            keys = os.listdir(self.chapters_dir) if os.path.isdir(self.chapters_dir) else []
+            for key in keys:
+                index = self._chapter(key)
+                totals["snapshots"] += len(index["snapshots"])
+                totals["objects"] += len(index["objects"])
+                for digest in index["objects"]:
+                    try: totals["bytes"] += os.path.getsize(self._object_path(key, digest))
+                    except OSError: pass
+            return totals
@@ -1,6 +1,8 @@
 from nicegui import ui
 import backend
 import os
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
 
 # 初始化库管理器
 library = backend.LibraryManager()
@@ -8,21 +10,58 @@ library = backend.LibraryManager()
 # 全局配置 (不再硬编码 project_dir，而是动态变)
 CFG = backend.CFG
 
+# 项目后台加载线程池（设定实体、向量库与嵌入模型在这里加载，不占用事件循环）
+_loader = ThreadPoolExecutor(max_workers=2, thread_name_prefix="project-loader")
+
+# 后台加载的设定实体
+ENTITY_FIELDS = ('settings', 'characters', 'items', 'locations')
+
+
+def _lazy_entity(field):
+    """设定实体属性：首次读取时等待后台加载完成（事件循环中请先 await wait_entities()）；赋值直接覆盖"""
+    def getter(self):
+        self._ensure_entities()
+        return self._entities[field]
+
+    def setter(self, value):
+        self._entities[field] = value
+
+    return property(getter, setter)
+
+
+def _report_load_error(future):
+    if future.exception() is not None:
+        print(f"[RAG Error] 向量库加载失败: {future.exception()}")
+
+
+def _open_memory(book_name, manager):
+    """打开向量库并接上章节读取函数（上次退出时未完成的索引任务随即继续），并校正分块的分卷信息"""
+    memory = backend.MemoryManager(book_name=book_name)
+    memory.attach_loader(manager.load_chapter_paragraphs, manager.chapter_volumes)
+    memory.sync_chapter_volumes(manager.chapter_volumes())
+    return memory
+
 class AppState:
+    # 设定实体在后台加载，读取时才等待
+    settings = _lazy_entity('settings')
+    characters = _lazy_entity('characters')
+    items = _lazy_entity('items')
+    locations = _lazy_entity('locations')
+
     def __init__(self):
         self.current_book_name = ""
         # 初始暂时不加载具体数据，或者加载最后一次打开的书
         # 这里为了演示，我们先留空，等 UI 触发加载
         self.manager = None
-        self.memory = None
+        self._memory = None
+        # 后台加载任务（切换书籍时整体替换，旧书的结果不会写入新书）
+        self._memory_future = None
+        self._entities_future = None
 
         # 数据层占位
         self.volumes = []
         self.structure = []
-        self.settings = {}
-        self.characters = []
-        self.items = []
-        self.locations = []
+        self._entities = {'settings': {}, 'characters': [], 'items': [], 'locations': []}
 
         # 运行时状态
         self.current_chapter_idx = 0
@@ -59,37 +98,116 @@ class AppState:
         # 1. 实例化新的管理器
         project_path = os.path.join("projects", book_name)
         self.manager = backend.NovelManager(project_root=project_path)
-        self.memory = backend.MemoryManager(book_name=book_name)
         
         # 2. 更新全局引用 (非常重要，否则 backend.py 里的 manager 还是旧的)
         # 注意：这里我们修改 state.py 导出的 manager 对象
         # 但 Python 模块导入机制决定了直接替换全局变量比较麻烦
         # 更好的方式是 state.manager 指向最新的
         
-        # 3. 重新加载所有数据到内存
+        # 3. 先同步加载目录（侧边栏与当前章节只依赖分卷和章节结构）
         self.volumes = self.manager.load_volumes()
         self.structure = self.manager.load_structure()
-        self.settings = self.manager.load_settings()
-        self.characters = self.manager.load_characters()
-        self.items = self.manager.load_items()
-        self.locations = self.manager.load_locations()
+
+        # 4. 设定实体、向量库与嵌入模型转入后台，用到时再等待
+        manager = self.manager
+        self._entities = {}
+        self._entities_future = _loader.submit(
+            lambda: {field: getattr(manager, f"load_{field}")() for field in ENTITY_FIELDS})
+        self._memory = None
+        self._memory_future = _loader.submit(_open_memory, book_name, manager)
+        self._memory_future.add_done_callback(_report_load_error)
         
-        # 4. 重置 UI 状态
+        # 5. 重置 UI 状态
         self.current_chapter_idx = 0
         self.current_content = ""
         self.expanded_volumes = set()
         if self.volumes: self.expanded_volumes.add(self.volumes[0]['id'])
         
-        # 5. 持久化记录
-        CFG['last_open_book'] = book_name
-        backend.save_global_config(CFG) # 保存到 config.json
+        # 6. 持久化记录（未变化时不重写 config.json）
+        if CFG.get('last_open_book') != book_name:
+            CFG['last_open_book'] = book_name
+            _loader.submit(backend.save_global_config, dict(CFG))
 
-        # 6. 触发全局 UI 刷新
+        # 7. 触发全局 UI 刷新
         if self.refresh_sidebar: self.refresh_sidebar()
         if self.refresh_total_word_count: 
             # 这是一个 async 函数，这里只能尽力调用，或者由 UI 层触发
             pass 
 
+    # ================= 后台加载就绪 =================
+
+    def _ensure_entities(self):
+        """等待设定实体加载完成（已被赋值的字段保留赋值结果）"""
+        future = self._entities_future
+        if future is None:
+            return
+        loaded = future.result()
+        if future is self._entities_future:
+            for field, value in loaded.items():
+                self._entities.setdefault(field, value)
+            self._entities_future = None
+
+    async def wait_entities(self):
+        """异步等待设定实体就绪（页面渲染、切换书籍及读取人物与世界观的异步入口先调用，避免阻塞事件循环）"""
+        future = self._entities_future
+        if future is not None:
+            await asyncio.wrap_future(future)
+        self._ensure_entities()
+
+    @property
+    def memory(self):
+        """向量库管理器；后台尚未加载完成时阻塞等待（事件循环中请先 await wait_memory()），加载失败时为 None"""
+        if self._memory is None and self._memory_future is not None:
+            future = self._memory_future
+            if future.exception() is not None:
+                return None  # 错误已由 _report_load_error 打印
+            memory = future.result()
+            if future is self._memory_future:
+                self._memory = memory
+                self._memory_future = None
+            return memory
+        return self._memory
+
+    @memory.setter
+    def memory(self, value):
+        self._memory = value
+        self._memory_future = None
+
+    @property
+    def memory_ready(self):
+        return self._memory is not None or (self._memory_future is not None and self._memory_future.done())
+
+    async def wait_memory(self):
+        """异步等待向量库与嵌入模型就绪；加载失败时返回 None，调用方跳过向量检索与索引同步"""
+        future = self._memory_future
+        if future is not None:
+            try:
+                await asyncio.wrap_future(future)
+            except Exception:
+                return None  # 错误已由 _report_load_error 打印
+        return self.memory
+
+    def queue_memory_updates(self, chapter_ids):
+        """登记需要重新索引的章节；向量库仍在后台加载时，加载完成后再登记"""
+        chapter_ids = list(chapter_ids)
+        future = self._memory_future
+        if future is not None and not future.done():
+            def enqueue(f):
+                if f.exception() is None:
+                    f.result().queue_chapter_updates(chapter_ids)
+            future.add_done_callback(enqueue)
+            return
+        memory = self.memory
+        if memory is not None:
+            memory.queue_chapter_updates(chapter_ids)
+
+    def pending_memory_updates(self):
+        """索引落后的章节数（向量库未就绪时为 0）"""
+        if not self.memory_ready:
+            return 0
+        memory = self.memory
+        return memory.pending_chapters() if memory is not None else 0
+
     def get_current_chapter(self):
         if not self.structure: return None
         if self.current_chapter_idx >= len(self.structure):
@@ -204,7 +322,7 @@ ui_refs = {
     'char_count': None, 'total_count': None,
     'char_view_mode': None, 'char_graph_container': None,
     'time_label': None, 'time_events': None, 'timeline_container': None,
-    'save_status': None, 'config_container': None,
+    'save_status': None, 'index_lag': None, 'config_container': None,
     # 【新增】地点视图控制
     'loc_view_mode': None,
     'loc_graph_container': None,
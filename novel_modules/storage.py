@@ -0,0 +1,768 @@
+"""
+项目存储后端
+NovelManager 的底层读写接口，提供两种实现：
+- JsonProjectStore: 原有的 JSON/TXT 文件布局（默认）
+- SqliteProjectStore: 每个项目一个 SQLite 数据库（WAL 模式），
+  实体、分卷、章节、段落均按行更新，多实体写入可放在同一事务中
+
+段落编辑以追加式操作日志记录（JSON 后端为 chapters/{id}_paragraphs.log），
+读取时重放，日志过大时压缩回 JSON/TXT 物化文件
+
+迁移工具：
+    python -m novel_modules.storage projects/<书名> [projects/<书名2> ...]
+"""
+
+import json
+import os
+import shutil
+import sqlite3
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Optional, Dict, List, Any, Tuple
+
+from novel_modules.paragraphs import ORDER_STEP
+
+# 文档名 -> JSON 文件名
+DOC_FILES = {
+    "settings": "setting.json",
+    "characters": "characters.json",
+    "items": "items.json",
+    "locations": "locations.json",
+    "volumes": "volumes.json",
+    "structure": "structure.json",
+}
+
+# 列表型文档（按行存储）；其余为字典型文档（按字段存储）
+LIST_DOCS = ("characters", "items", "locations", "volumes", "structure")
+
+SQLITE_DB_NAME = "project.db"
+
+# 段落日志超过该大小且超过正文大小时压缩
+JOURNAL_COMPACT_MIN_BYTES = 32 * 1024
+
+# JSON 后端事务暂存目录与提交清单
+STAGING_DIR = ".staging"
+STAGING_MANIFEST = "manifest.json"
+
+
+def _dump_row(data: Any) -> str:
+    """单行数据序列化，用于存储和判断是否变化"""
+    return json.dumps(data, ensure_ascii=False)
+
+
+def apply_paragraph_ops(paragraphs: List[Dict], ops: List[Dict]) -> List[Dict]:
+    """
+    在段落列表上原地重放操作
+
+    操作格式：
+        {"op": "set", "id": pid, "para": {...}}          替换段落
+        {"op": "insert", "after": pid|None, "para": {...}} 在 pid 之后插入（None 表示开头）
+        {"op": "delete", "id": pid}                      删除段落
+        {"op": "rebalance"}                              按当前顺序重排排序键 order
+        {"op": "renumber"}                               按顺序重新编号为 p1..pN（旧版日志）
+    插入操作可附带 "next_seq"，记录已分配的最大段落序号，保证ID不被复用
+    """
+    for op in ops:
+        kind = op.get("op")
+        if kind == "set":
+            for i, p in enumerate(paragraphs):
+                if p.get("id") == op["id"]:
+                    para = dict(op["para"])
+                    if "order" in p:
+                        para.setdefault("order", p["order"])
+                    paragraphs[i] = para
+                    break
+        elif kind == "insert":
+            idx = 0
+            if op.get("after") is not None:
+                idx = next((i + 1 for i, p in enumerate(paragraphs) if p.get("id") == op["after"]),
+                           len(paragraphs))
+            paragraphs.insert(idx, dict(op["para"]))
+        elif kind == "delete":
+            paragraphs[:] = [p for p in paragraphs if p.get("id") != op["id"]]
+        elif kind == "rebalance":
+            for i, p in enumerate(paragraphs, 1):
+                p["order"] = i * ORDER_STEP
+        elif kind == "renumber":
+            for i, p in enumerate(paragraphs, 1):
+                p["id"] = f"p{i}"
+    return paragraphs
+
+
+def _replay_next_seq(data: Dict, ops: List[Dict]):
+    """从操作日志中恢复 next_seq"""
+    seqs = [op["next_seq"] for op in ops if "next_seq" in op]
+    if seqs:
+        data["next_seq"] = max([data.get("next_seq", 0)] + seqs)
+
+
+def _paragraph_metadata(paragraphs: List[Dict]) -> Dict:
+    return {
+        "paragraph_count": len(paragraphs),
+        "total_words": sum(p.get('word_count', 0) for p in paragraphs),
+        "updated_at": datetime.now().isoformat()
+    }
+
+
+# ================= JSON 文件存储 =================
+
+class JsonProjectStore:
+    """
+    JSON/TXT 文件存储
+    事务内的所有写入（文档、正文、段落、日志、删除）先写到暂存目录，读取时透明地读暂存副本；
+    提交时先落盘提交清单再逐个 os.replace，清单写入即视为提交成功，
+    中途崩溃后下次打开时按清单继续完成；未写清单的暂存文件直接丢弃
+    """
+
+    backend = "json"
+
+    def __init__(self, root_dir: str):
+        self.root_dir = root_dir
+        self.chapters_dir = os.path.join(root_dir, "chapters")
+        self._lock = threading.RLock()
+        self._depth = 0
+        # 目标文件 -> 暂存文件（None 表示事务内已删除）
+        self._staged: Dict[str, Optional[str]] = {}
+        self._recover_staging()
+
+    def _doc_path(self, name: str) -> str:
+        return os.path.join(self.root_dir, DOC_FILES[name])
+
+    def _text_path(self, chapter_id: Any) -> str:
+        return os.path.join(self.chapters_dir, f"{chapter_id}.txt")
+
+    def _paragraph_path(self, chapter_id: Any) -> str:
+        return os.path.join(self.chapters_dir, f"{chapter_id}_paragraphs.json")
+
+    def _journal_path(self, chapter_id: Any) -> str:
+        return os.path.join(self.chapters_dir, f"{chapter_id}_paragraphs.log")
+
+    @staticmethod
+    def _stat_signature(path: Optional[str]) -> Optional[List[int]]:
+        if path is None:
+            return None
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        return [st.st_mtime_ns, st.st_size]
+
+    def _signature(self, path: str) -> Optional[List[int]]:
+        """文件签名；事务内已改动的文件尚未提交，返回 None 使各级缓存不记录未提交的内容"""
+        if path in self._staged:
+            return None
+        return self._stat_signature(path)
+
+    # --- 事务暂存 ---
+    def _staging_dir(self) -> str:
+        return os.path.join(self.root_dir, STAGING_DIR)
+
+    def _read_path(self, path: str) -> Optional[str]:
+        """实际应读取的文件：事务内已暂存的读暂存副本，已删除的返回 None"""
+        with self._lock:
+            return self._staged.get(path, path)
+
+    def _write_path(self, path: str, append: bool = False) -> str:
+        """
+        实际应写入的文件：事务外即目标文件，事务内为暂存文件
+        append=True 时首次暂存会先复制原文件，以便追加写入
+        """
+        if self._depth == 0:
+            return path
+        staged = self._staged.get(path)
+        if staged is None:
+            os.makedirs(self._staging_dir(), exist_ok=True)
+            staged = os.path.join(self._staging_dir(), f"{len(self._staged)}_{os.path.basename(path)}")
+            if append and path not in self._staged and os.path.exists(path):
+                shutil.copyfile(path, staged)
+            self._staged[path] = staged
+        return staged
+
+    def _remove(self, path: str):
+        with self._lock:
+            if self._depth == 0:
+                if os.path.exists(path):
+                    os.remove(path)
+                return
+            staged = self._staged.get(path)
+            if staged and os.path.exists(staged):
+                os.remove(staged)
+            self._staged[path] = None
+
+    def _commit_staged(self):
+        """提交暂存文件：暂存文件刷盘 -> 原子写入清单（提交点）-> 逐个替换目标文件"""
+        staged, self._staged = self._staged, {}
+        if not staged:
+            return
+        entries = []
+        for target, src in staged.items():
+            if src is not None:
+                with open(src, 'rb+') as f:
+                    os.fsync(f.fileno())
+            entries.append([os.path.relpath(target, self.root_dir),
+                            os.path.basename(src) if src is not None else None])
+        manifest = os.path.join(self._staging_dir(), STAGING_MANIFEST)
+        with open(manifest + ".tmp", 'w', encoding='utf-8') as f:
+            json.dump(entries, f, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(manifest + ".tmp", manifest)
+        self._apply_manifest(entries)
+        shutil.rmtree(self._staging_dir(), ignore_errors=True)
+
+    def _apply_manifest(self, entries: List[List]):
+        for target, src in entries:
+            target = os.path.join(self.root_dir, target)
+            if src is None:
+                if os.path.exists(target):
+                    os.remove(target)
+            else:
+                src = os.path.join(self._staging_dir(), src)
+                if os.path.exists(src):  # 重放时已替换过的跳过
+                    os.replace(src, target)
+
+    def _discard_staged(self):
+        self._staged = {}
+        shutil.rmtree(self._staging_dir(), ignore_errors=True)
+
+    def _recover_staging(self):
+        """处理上次中断的事务：清单已落盘则继续完成提交，否则丢弃暂存文件"""
+        if not os.path.isdir(self._staging_dir()):
+            return
+        manifest = os.path.join(self._staging_dir(), STAGING_MANIFEST)
+        if os.path.exists(manifest):
+            try:
+                with open(manifest, 'r', encoding='utf-8') as f:
+                    self._apply_manifest(json.load(f))
+                print("[Storage] 已完成上次中断的事务提交")
+            except (OSError, json.JSONDecodeError) as e:
+                print(f"[Storage] 事务恢复失败: {e}")
+                return
+        self._discard_staged()
+
+    # --- 文档 ---
+    def has_doc(self, name: str) -> bool:
+        path = self._read_path(self._doc_path(name))
+        return path is not None and os.path.exists(path)
+
+    def read_doc(self, name: str) -> Any:
+        """读取文档，不存在时抛出 FileNotFoundError，损坏时抛出 JSONDecodeError"""
+        path = self._read_path(self._doc_path(name))
+        if path is None:
+            raise FileNotFoundError(name)
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def write_doc(self, name: str, data: Any):
+        with self._lock:
+            with open(self._write_path(self._doc_path(name)), 'w', encoding='utf-8') as f:
+                json.dump(data, f, ensure_ascii=False, indent=4)
+
+    def doc_signature(self, name: str) -> Optional[List]:
+        """文档签名 (mtime_ns, size)，不存在或事务内已改动时返回 None"""
+        return self._signature(self._doc_path(name))
+
+    # --- 章节正文 ---
+    def read_chapter_text(self, chapter_id: Any) -> Optional[str]:
+        if self.journal_size(chapter_id) > 0:
+            # 日志尚未压缩，TXT 已过期，从段落重放结果拼接
+            data = self.read_paragraph_doc(chapter_id) or {}
+            return '\n\n'.join(p['text'] for p in data.get('paragraphs', []))
+        path = self._read_path(self._text_path(chapter_id))
+        if path is None or not os.path.exists(path):
+            return None
+        with open(path, 'r', encoding='utf-8') as f:
+            return f.read()
+
+    def write_chapter_text(self, chapter_id: Any, text: str):
+        with self._lock:
+            with open(self._write_path(self._text_path(chapter_id)), 'w', encoding='utf-8') as f:
+                f.write(text)
+
+    def chapter_signature(self, chapter_id: Any) -> Optional[List]:
+        """正文、段落文件与段落日志的组合签名，章节不存在时返回 None"""
+        paths = (self._text_path(chapter_id), self._paragraph_path(chapter_id), self._journal_path(chapter_id))
+        if any(path in self._staged for path in paths):
+            return None
+        sigs = [self._stat_signature(path) for path in paths]
+        if sigs[0] is None and sigs[1] is None:
+            return None
+        return [v for sig in sigs for v in (sig or [0, 0])]
+
+    # --- 段落 ---
+    def read_paragraph_doc(self, chapter_id: Any) -> Optional[Dict]:
+        """读取段落文档，不存在或损坏时返回 None"""
+        path = self._read_path(self._paragraph_path(chapter_id))
+        data = None
+        if path is not None and os.path.exists(path):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+            except (json.JSONDecodeError, KeyError):
+                data = None
+        ops = self._read_journal(chapter_id)
+        if ops:
+            if data is None:
+                data = {"chapter_id": chapter_id, "paragraphs": [], "metadata": {}}
+            apply_paragraph_ops(data.setdefault("paragraphs", []), ops)
+            _replay_next_seq(data, ops)
+        return data
+
+    def write_paragraph_doc(self, chapter_id: Any, data: Dict):
+        with self._lock:
+            with open(self._write_path(self._paragraph_path(chapter_id)), 'w', encoding='utf-8') as f:
+                json.dump(data, f, ensure_ascii=False, indent=2)
+            # 物化文件已是最新，日志作废
+            self._remove(self._journal_path(chapter_id))
+
+    def _read_journal(self, chapter_id: Any) -> List[Dict]:
+        path = self._read_path(self._journal_path(chapter_id))
+        if path is None or not os.path.exists(path):
+            return []
+        ops = []
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    ops.append(json.loads(line))
+                except json.JSONDecodeError:
+                    break  # 末尾写了一半的记录，丢弃
+        return ops
+
+    def append_paragraph_ops(self, chapter_id: Any, ops: List[Dict]):
+        """追加段落操作，只写入本次改动"""
+        with self._lock:
+            with open(self._write_path(self._journal_path(chapter_id), append=True), 'a', encoding='utf-8') as f:
+                f.write("".join(_dump_row(op) + "\n" for op in ops))
+
+    def journal_size(self, chapter_id: Any) -> int:
+        path = self._read_path(self._journal_path(chapter_id))
+        try:
+            return os.path.getsize(path) if path is not None else 0
+        except OSError:
+            return 0
+
+    def needs_compaction(self, chapter_id: Any) -> bool:
+        size = self.journal_size(chapter_id)
+        if size <= JOURNAL_COMPACT_MIN_BYTES:
+            return False
+        text_sig = self._stat_signature(self._read_path(self._text_path(chapter_id)))
+        return size > (text_sig[1] if text_sig else 0)
+
+    def compact_paragraphs(self, chapter_id: Any):
+        """将日志重放结果写回 JSON/TXT 物化文件并清空日志"""
+        data = self.read_paragraph_doc(chapter_id)
+        if data is None:
+            return
+        paragraphs = data.get("paragraphs", [])
+        data["metadata"] = _paragraph_metadata(paragraphs)
+        self.write_chapter_text(chapter_id, '\n\n'.join(p['text'] for p in paragraphs))
+        self.write_paragraph_doc(chapter_id, data)
+
+    def delete_chapter(self, chapter_id: Any):
+        for path in (self._text_path(chapter_id), self._paragraph_path(chapter_id),
+                     self._journal_path(chapter_id)):
+            self._remove(path)
+
+    def list_chapter_ids(self) -> List[str]:
+        if not os.path.exists(self.chapters_dir):
+            return []
+        return [name[:-4] for name in os.listdir(self.chapters_dir) if name.endswith(".txt")]
+
+    # --- 事务 ---
+    @property
+    def lock(self):
+        """存储读写锁；外部直接读取项目文件（如备份）时持有，避免读到写了一半的文件"""
+        return self._lock
+
+    @property
+    def in_transaction(self) -> bool:
+        return self._depth > 0
+
+    @contextmanager
+    def transaction(self):
+        with self._lock:
+            self._depth += 1
+            try:
+                yield self
+            except BaseException:
+                self._depth -= 1
+                if self._depth == 0:
+                    self._discard_staged()
+                raise
+            self._depth -= 1
+            if self._depth == 0:
+                self._commit_staged()
+
+    def close(self):
+        pass
+
+
+# ================= SQLite 存储 =================
+
+class SqliteProjectStore:
+    """
+    SQLite 存储（WAL 模式）
+    列表型文档每个元素一行，settings 每个字段一行，段落每段一行；
+    写入时只更新内容发生变化的行。事务内改动过的文档/章节签名返回 None，
+    避免缓存记录可能回滚的内容
+    """
+
+    backend = "sqlite"
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS doc_rows (
+        doc TEXT NOT NULL, pos INTEGER NOT NULL, data TEXT NOT NULL,
+        PRIMARY KEY (doc, pos)
+    );
+    CREATE TABLE IF NOT EXISTS doc_fields (
+        doc TEXT NOT NULL, key TEXT NOT NULL, pos INTEGER NOT NULL, data TEXT NOT NULL,
+        PRIMARY KEY (doc, key)
+    );
+    CREATE TABLE IF NOT EXISTS chapters (
+        chapter_id TEXT PRIMARY KEY, content TEXT NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS paragraphs (
+        chapter_id TEXT NOT NULL, pid TEXT NOT NULL, pos INTEGER NOT NULL, data TEXT NOT NULL,
+        PRIMARY KEY (chapter_id, pid)
+    );
+    CREATE TABLE IF NOT EXISTS paragraph_meta (
+        chapter_id TEXT PRIMARY KEY, data TEXT NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS revisions (
+        name TEXT PRIMARY KEY, rev INTEGER NOT NULL
+    );
+    """
+
+    def __init__(self, root_dir: str):
+        self.root_dir = root_dir
+        self.db_path = os.path.join(root_dir, SQLITE_DB_NAME)
+        self._lock = threading.RLock()
+        self._depth = 0
+        # 当前事务内已改动的修订号名
+        self._dirty = set()
+        self.conn = sqlite3.connect(self.db_path, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(self.SCHEMA)
+
+    def _bump(self, name: str):
+        """递增修订号，作为缓存校验签名"""
+        self.conn.execute(
+            "INSERT INTO revisions (name, rev) VALUES (?, 1) "
+            "ON CONFLICT(name) DO UPDATE SET rev = rev + 1", (name,))
+        self._dirty.add(name)
+
+    def _signature(self, name: str) -> Optional[List]:
+        with self._lock:
+            if name in self._dirty:
+                return None
+            rev = self._revision(name)
+        return None if rev is None else [rev]
+
+    def _revision(self, name: str) -> Optional[int]:
+        row = self.conn.execute("SELECT rev FROM revisions WHERE name = ?", (name,)).fetchone()
+        return row[0] if row else None
+
+    # --- 文档 ---
+    def has_doc(self, name: str) -> bool:
+        with self._lock:
+            return self._revision(f"doc:{name}") is not None
+
+    def read_doc(self, name: str) -> Any:
+        with self._lock:
+            if self._revision(f"doc:{name}") is None:
+                raise FileNotFoundError(name)
+            if name in LIST_DOCS:
+                rows = self.conn.execute(
+                    "SELECT data FROM doc_rows WHERE doc = ? ORDER BY pos", (name,)).fetchall()
+                return [json.loads(r[0]) for r in rows]
+            rows = self.conn.execute(
+                "SELECT key, data FROM doc_fields WHERE doc = ? ORDER BY pos", (name,)).fetchall()
+            return {k: json.loads(v) for k, v in rows}
+
+    def write_doc(self, name: str, data: Any):
+        with self.transaction():
+            if name in LIST_DOCS:
+                old = dict(self.conn.execute(
+                    "SELECT pos, data FROM doc_rows WHERE doc = ?", (name,)).fetchall())
+                for pos, item in enumerate(data):
+                    row = _dump_row(item)
+                    if old.get(pos) != row:
+                        self.conn.execute(
+                            "INSERT OR REPLACE INTO doc_rows (doc, pos, data) VALUES (?, ?, ?)",
+                            (name, pos, row))
+                if len(old) > len(data):
+                    self.conn.execute(
+                        "DELETE FROM doc_rows WHERE doc = ? AND pos >= ?", (name, len(data)))
+            else:
+                old = {k: (p, v) for k, p, v in self.conn.execute(
+                    "SELECT key, pos, data FROM doc_fields WHERE doc = ?", (name,)).fetchall()}
+                for pos, (key, value) in enumerate(data.items()):
+                    row = _dump_row(value)
+                    if old.get(key) != (pos, row):
+                        self.conn.execute(
+                            "INSERT OR REPLACE INTO doc_fields (doc, key, pos, data) VALUES (?, ?, ?, ?)",
+                            (name, key, pos, row))
+                for key in set(old) - set(data):
+                    self.conn.execute("DELETE FROM doc_fields WHERE doc = ? AND key = ?", (name, key))
+            self._bump(f"doc:{name}")
+
+    def doc_signature(self, name: str) -> Optional[List]:
+        """文档签名（修订号），不存在或事务内已改动时返回 None"""
+        return self._signature(f"doc:{name}")
+
+    # --- 章节正文 ---
+    def read_chapter_text(self, chapter_id: Any) -> Optional[str]:
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT content FROM chapters WHERE chapter_id = ?", (str(chapter_id),)).fetchone()
+            if row:
+                return row[0]
+            # 段落编辑后正文行被置空，由段落行拼接
+            if not self.conn.execute("SELECT 1 FROM paragraph_meta WHERE chapter_id = ?",
+                                     (str(chapter_id),)).fetchone():
+                return None
+            rows = self.conn.execute(
+                "SELECT data FROM paragraphs WHERE chapter_id = ? ORDER BY pos", (str(chapter_id),)).fetchall()
+        return '\n\n'.join(json.loads(r[0])['text'] for r in rows)
+
+    def write_chapter_text(self, chapter_id: Any, text: str):
+        with self.transaction():
+            self.conn.execute(
+                "INSERT OR REPLACE INTO chapters (chapter_id, content) VALUES (?, ?)",
+                (str(chapter_id), text))
+            self._bump(f"chap:{chapter_id}")
+
+    def chapter_signature(self, chapter_id: Any) -> Optional[List]:
+        return self._signature(f"chap:{chapter_id}")
+
+    # --- 段落 ---
+    def read_paragraph_doc(self, chapter_id: Any) -> Optional[Dict]:
+        key = str(chapter_id)
+        with self._lock:
+            meta = self.conn.execute(
+                "SELECT data FROM paragraph_meta WHERE chapter_id = ?", (key,)).fetchone()
+            if not meta:
+                return None
+            rows = self.conn.execute(
+                "SELECT data FROM paragraphs WHERE chapter_id = ? ORDER BY pos", (key,)).fetchall()
+        data = json.loads(meta[0])
+        data["paragraphs"] = [json.loads(r[0]) for r in rows]
+        return data
+
+    def write_paragraph_doc(self, chapter_id: Any, data: Dict):
+        key = str(chapter_id)
+        paragraphs = data.get("paragraphs", [])
+        meta = {k: v for k, v in data.items() if k != "paragraphs"}
+        with self.transaction():
+            old = {pid: (pos, row) for pid, pos, row in self.conn.execute(
+                "SELECT pid, pos, data FROM paragraphs WHERE chapter_id = ?", (key,)).fetchall()}
+            pids = [p.get("id") for p in paragraphs]
+            if len(set(pids)) != len(pids):
+                # ID 重复时无法按行比对，整章重写
+                self.conn.execute("DELETE FROM paragraphs WHERE chapter_id = ?", (key,))
+                old = {}
+                pids = [f"#{i}" for i in range(len(paragraphs))]
+            for pos, (pid, para) in enumerate(zip(pids, paragraphs)):
+                # 有排序键时以其作为行位置，插入段落无需移动后续行
+                pos = para.get("order", pos)
+                row = _dump_row(para)
+                if old.get(pid) != (pos, row):
+                    self.conn.execute(
+                        "INSERT OR REPLACE INTO paragraphs (chapter_id, pid, pos, data) VALUES (?, ?, ?, ?)",
+                        (key, pid, pos, row))
+            for pid in set(old) - set(pids):
+                self.conn.execute(
+                    "DELETE FROM paragraphs WHERE chapter_id = ? AND pid = ?", (key, pid))
+            self.conn.execute(
+                "INSERT OR REPLACE INTO paragraph_meta (chapter_id, data) VALUES (?, ?)",
+                (key, _dump_row(meta)))
+            self._bump(f"chap:{key}")
+
+    def append_paragraph_ops(self, chapter_id: Any, ops: List[Dict]):
+        """段落操作直接落到对应行，正文行置空待下次压缩"""
+        key = str(chapter_id)
+        with self.transaction():
+            for op in ops:
+                kind = op.get("op")
+                if kind == "set":
+                    self.conn.execute(
+                        "UPDATE paragraphs SET data = ? WHERE chapter_id = ? AND pid = ?",
+                        (_dump_row(op["para"]), key, op["id"]))
+                elif kind == "insert" and op["para"].get("order") is not None:
+                    self.conn.execute(
+                        "INSERT OR REPLACE INTO paragraphs (chapter_id, pid, pos, data) VALUES (?, ?, ?, ?)",
+                        (key, op["para"]["id"], op["para"]["order"], _dump_row(op["para"])))
+                elif kind == "insert":
+                    pos = 0
+                    if op.get("after") is not None:
+                        row = self.conn.execute(
+                            "SELECT pos FROM paragraphs WHERE chapter_id = ? AND pid = ?",
+                            (key, op["after"])).fetchone()
+                        if row:
+                            pos = row[0] + 1
+                        else:
+                            pos = self.conn.execute(
+                                "SELECT COALESCE(MAX(pos) + 1, 0) FROM paragraphs WHERE chapter_id = ?",
+                                (key,)).fetchone()[0]
+                    self.conn.execute(
+                        "UPDATE paragraphs SET pos = pos + 1 WHERE chapter_id = ? AND pos >= ?", (key, pos))
+                    self.conn.execute(
+                        "INSERT OR REPLACE INTO paragraphs (chapter_id, pid, pos, data) VALUES (?, ?, ?, ?)",
+                        (key, op["para"]["id"], pos, _dump_row(op["para"])))
+                elif kind == "delete":
+                    self.conn.execute(
+                        "DELETE FROM paragraphs WHERE chapter_id = ? AND pid = ?", (key, op["id"]))
+                elif kind in ("rebalance", "renumber"):
+                    doc = self.read_paragraph_doc(key) or {"paragraphs": []}
+                    self.conn.execute("DELETE FROM paragraphs WHERE chapter_id = ?", (key,))
+                    for pos, para in enumerate(apply_paragraph_ops(doc["paragraphs"], [op])):
+                        self.conn.execute(
+                            "INSERT INTO paragraphs (chapter_id, pid, pos, data) VALUES (?, ?, ?, ?)",
+                            (key, para["id"], para.get("order", pos), _dump_row(para)))
+            if any("next_seq" in op for op in ops):
+                row = self.conn.execute(
+                    "SELECT data FROM paragraph_meta WHERE chapter_id = ?", (key,)).fetchone()
+                meta = json.loads(row[0]) if row else {"chapter_id": chapter_id}
+                _replay_next_seq(meta, ops)
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO paragraph_meta (chapter_id, data) VALUES (?, ?)",
+                    (key, _dump_row(meta)))
+            self.conn.execute("DELETE FROM chapters WHERE chapter_id = ?", (key,))
+            self._bump(f"chap:{key}")
+
+    def journal_size(self, chapter_id: Any) -> int:
+        return 0
+
+    def needs_compaction(self, chapter_id: Any) -> bool:
+        return False
+
+    def compact_paragraphs(self, chapter_id: Any):
+        """重新物化正文行，并刷新段落元数据"""
+        data = self.read_paragraph_doc(chapter_id)
+        if data is None:
+            return
+        data["metadata"] = _paragraph_metadata(data.get("paragraphs", []))
+        with self.transaction():
+            self.write_paragraph_doc(chapter_id, data)
+            self.write_chapter_text(chapter_id, '\n\n'.join(p['text'] for p in data["paragraphs"]))
+
+    def delete_chapter(self, chapter_id: Any):
+        key = str(chapter_id)
+        with self.transaction():
+            self.conn.execute("DELETE FROM chapters WHERE chapter_id = ?", (key,))
+            self.conn.execute("DELETE FROM paragraphs WHERE chapter_id = ?", (key,))
+            self.conn.execute("DELETE FROM paragraph_meta WHERE chapter_id = ?", (key,))
+            self.conn.execute("DELETE FROM revisions WHERE name = ?", (f"chap:{key}",))
+
+    def list_chapter_ids(self) -> List[str]:
+        with self._lock:
+            return [r[0] for r in self.conn.execute(
+                "SELECT chapter_id FROM chapters UNION SELECT chapter_id FROM paragraph_meta").fetchall()]
+
+    # --- 事务 ---
+    @property
+    def lock(self):
+        """存储读写锁；外部直接读取项目文件（如备份）时持有，避免读到写了一半的文件"""
+        return self._lock
+
+    @property
+    def in_transaction(self) -> bool:
+        return self._depth > 0
+
+    @contextmanager
+    def transaction(self):
+        """可嵌套事务，最外层提交；出错时整体回滚"""
+        with self._lock:
+            outer = self._depth == 0
+            if outer:
+                self.conn.execute("BEGIN IMMEDIATE")
+            self._depth += 1
+            try:
+                yield self
+            except BaseException:
+                self._depth -= 1
+                if outer:
+                    self._dirty.clear()
+                    self.conn.execute("ROLLBACK")
+                raise
+            self._depth -= 1
+            if outer:
+                self._dirty.clear()
+                self.conn.execute("COMMIT")
+
+    def close(self):
+        with self._lock:
+            self.conn.close()
+
+
+# ================= 工厂与迁移 =================
+
+def open_project_store(root_dir: str, backend: str = "json"):
+    """
+    打开项目存储
+    已存在 project.db 的项目总是使用 SQLite；
+    配置为 sqlite 且仍是旧 JSON 布局的项目会先自动迁移
+    """
+    if os.path.exists(os.path.join(root_dir, SQLITE_DB_NAME)):
+        return SqliteProjectStore(root_dir)
+    if backend == "sqlite":
+        if JsonProjectStore(root_dir).has_doc("structure"):
+            ok, msg = migrate_json_to_sqlite(root_dir)
+            print(f"[Storage] {msg}")
+            if not ok:
+                return JsonProjectStore(root_dir)
+        return SqliteProjectStore(root_dir)
+    return JsonProjectStore(root_dir)
+
+
+def migrate_json_to_sqlite(root_dir: str) -> Tuple[bool, str]:
+    """
+    将 JSON/TXT 布局的项目迁移到 SQLite
+    原文件保留不动，迁移在单个事务中完成，失败时删除半成品数据库
+
+    Returns:
+        (是否成功, 提示信息)
+    """
+    db_path = os.path.join(root_dir, SQLITE_DB_NAME)
+    if os.path.exists(db_path):
+        return False, f"{root_dir} 已是 SQLite 存储"
+
+    src = JsonProjectStore(root_dir)
+    dst = SqliteProjectStore(root_dir)
+    chapter_count = 0
+    try:
+        with dst.transaction():
+            for name in DOC_FILES:
+                if src.has_doc(name):
+                    try:
+                        dst.write_doc(name, src.read_doc(name))
+                    except (json.JSONDecodeError, PermissionError) as e:
+                        print(f"[Storage] 跳过损坏文件 {DOC_FILES[name]}: {e}")
+            for chapter_id in src.list_chapter_ids():
+                dst.write_chapter_text(chapter_id, src.read_chapter_text(chapter_id) or "")
+                para_doc = src.read_paragraph_doc(chapter_id)
+                if para_doc is not None:
+                    dst.write_paragraph_doc(chapter_id, para_doc)
+                chapter_count += 1
+        dst.close()
+    except Exception as e:
+        dst.close()
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(db_path + suffix):
+                os.remove(db_path + suffix)
+        return False, f"迁移失败: {e}"
+
+    return True, f"{root_dir} 已迁移到 SQLite（{chapter_count} 个章节）"
+
+
+if __name__ == "__main__":
+    import sys
+
+    if len(sys.argv) < 2:
+        print("用法: python -m novel_modules.storage projects/<书名> [...]")
+        sys.exit(1)
+    for project_dir in sys.argv[1:]:
+        ok, msg = migrate_json_to_sqlite(project_dir)
+        print(f"[Storage] {msg}")
@@ -0,0 +1,96 @@
+"""
+分层剧情摘要
+章节摘要 -> 分卷摘要 -> 全书总纲 三级汇总，存放在项目目录的 summary_tree.json：
+- 每个分卷摘要记录其来源（本卷各章摘要）的哈希，只有本卷有章节摘要变化时才重新汇总
+- 全书总纲由分卷摘要汇总，同样按来源哈希判断是否需要重算
+- 检索时按"全书 -> 其他分卷 -> 本卷各章"由粗到细提供前情，几百字即可覆盖长距离背景
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Optional, Dict, List, Any, Tuple
+
+SUMMARY_TREE_FILE = "summary_tree.json"
+
+
+def source_hash(items: List[Tuple[Any, str]]) -> str:
+    """来源摘要列表 [(ID, 摘要), ...] 的哈希（顺序、归属或内容变化都会改变）"""
+    raw = json.dumps([[str(k), v] for k, v in items], ensure_ascii=False)
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+
+class SummaryTree:
+    """分卷摘要与全书总纲的持久化存储"""
+
+    VERSION = 1
+
+    def __init__(self, project_root: str):
+        """
+        Args:
+            project_root: 项目目录
+        """
+        self.path = os.path.join(project_root, SUMMARY_TREE_FILE)
+        self._lock = threading.RLock()
+        self.data = {"version": self.VERSION, "volumes": {}, "book": {}}
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if data.get("version") == self.VERSION:
+                self.data = data
+        except FileNotFoundError:
+            pass
+        except (json.JSONDecodeError, IOError) as e:
+            print(f"[Summary] 分层摘要读取失败，将重建: {e}")
+
+    def _save(self):
+        tmp_file = self.path + ".tmp"
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump(self.data, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_file, self.path)
+
+    # ==================== 分卷 ====================
+
+    def volume(self, volume_id: Any) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entry = self.data["volumes"].get(str(volume_id))
+            return dict(entry) if entry else None
+
+    def volume_is_current(self, volume_id: Any, source: str) -> bool:
+        """分卷摘要是否已基于这份来源生成"""
+        entry = self.volume(volume_id)
+        return entry is not None and entry.get("source") == source
+
+    def set_volume(self, volume_id: Any, summary: str, source: str, chapter_ids: List[Any]):
+        with self._lock:
+            self.data["volumes"][str(volume_id)] = {
+                "summary": summary,
+                "source": source,
+                "chapters": list(chapter_ids),
+                "updated": time.strftime("%Y-%m-%d %H:%M:%S")
+            }
+            self._save()
+
+    def prune(self, volume_ids: List[Any]):
+        """删除不在 volume_ids 中的分卷（分卷已删除或已无章节摘要）"""
+        keep = {str(v) for v in volume_ids}
+        with self._lock:
+            stale = [v for v in self.data["volumes"] if v not in keep]
+            for volume_id in stale:
+                del self.data["volumes"][volume_id]
+            if stale:
+                self._save()
+
+    # ==================== 全书 ====================
+
+    def book(self) -> Dict[str, Any]:
+        with self._lock:
+            return dict(self.data.get("book") or {})
+
+    def set_book(self, summary: str, source: str):
+        with self._lock:
+            self.data["book"] = {"summary": summary, "source": source,
+                                 "updated": time.strftime("%Y-%m-%d %H:%M:%S")}
+            self._save()
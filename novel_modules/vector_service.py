@@ -0,0 +1,221 @@
+"""
+向量服务
+进程内共享一个 Chroma 客户端和一个嵌入模型：
+- 各书的 MemoryManager 只从这里取集合句柄，切换书籍、打开多本书都不会重复加载模型权重
+- 集合句柄按书名缓存
+- 嵌入计算统一在有界线程池中执行，写入与查询都显式传入向量（embeddings / query_embeddings）
+- 调用模型前先查磁盘向量缓存（embedding_cache），只计算未命中的文本
+- 提供占用统计（已打开集合、嵌入次数、进程内存），便于确认内存不随打开的书数增长
+"""
+
+import hashlib
+import os
+import sys
+import threading
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Dict, List, Any
+
+import chromadb
+from chromadb.utils import embedding_functions
+
+from .embedding_cache import EmbeddingCache, DEFAULT_MAX_BYTES
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# 默认向量库目录
+DEFAULT_DB_PATH = "chroma_db_storage"
+# 默认嵌入线程数
+DEFAULT_EMBED_WORKERS = 2
+# 单次送入模型的文本数
+EMBED_BATCH_SIZE = 32
+# 嵌入模型标识（更换模型时缓存自动清空）
+EMBEDDING_MODEL_KEY = "chroma-default-all-MiniLM-L6-v2"
+
+_service = None
+_service_lock = threading.Lock()
+
+
+def get_vector_service(db_path: str = DEFAULT_DB_PATH, workers: Optional[int] = None,
+                       cache_mb: Optional[float] = None) -> "VectorService":
+    """
+    获取进程内唯一的向量服务（首次调用时创建，之后的参数被忽略）
+
+    Args:
+        db_path: Chroma 持久化目录
+        workers: 嵌入线程池大小
+        cache_mb: 嵌入缓存容量（MB），0 表示不缓存
+    """
+    global _service
+    with _service_lock:
+        if _service is None:
+            cache_bytes = DEFAULT_MAX_BYTES if cache_mb is None else int(cache_mb * 1024 * 1024)
+            _service = VectorService(db_path, workers or DEFAULT_EMBED_WORKERS, cache_bytes)
+        return _service
+
+
+def collection_name(book_name: str) -> str:
+    """书名对应的集合名（MD5 保证任意书名都合法，前缀保证以字母开头）"""
+    return f"novel_{hashlib.md5(book_name.encode('utf-8')).hexdigest()}"
+
+
+def lexical_index_path(book_name: str, db_path: str = DEFAULT_DB_PATH) -> str:
+    """与集合配套的词法索引文件（MemoryManager 维护，删除集合时一并删除）"""
+    lexical_dir = os.path.join(db_path, "lexical")
+    os.makedirs(lexical_dir, exist_ok=True)
+    return os.path.join(lexical_dir, f"{collection_name(book_name)}.db")
+
+
+class VectorService:
+    """共享的 Chroma 客户端、嵌入模型与嵌入线程池"""
+
+    def __init__(self, db_path: str, workers: int = DEFAULT_EMBED_WORKERS, cache_bytes: int = DEFAULT_MAX_BYTES):
+        """
+        Args:
+            db_path: Chroma 持久化目录
+            workers: 嵌入线程池大小（嵌入模型本身多线程，线程数过多只会互相争抢）
+            cache_bytes: 嵌入缓存容量上限（字节），0 表示不缓存
+        """
+        self.db_path = db_path
+        self.workers = max(1, int(workers))
+        self._lock = threading.RLock()
+        self._client = None
+        self._embedding_fn = None
+        self._collections: Dict[str, Any] = {}
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="embedding")
+        self._embedded_texts = 0
+        self._embed_calls = 0
+        self.cache = None
+        if cache_bytes > 0:
+            try:
+                self.cache = EmbeddingCache(os.path.join(db_path, "embedding_cache"), cache_bytes, EMBEDDING_MODEL_KEY)
+            except (OSError, ValueError) as e:
+                print(f"[RAG] 嵌入缓存不可用，直接计算: {e}")
+
+    # ==================== 共享资源 ====================
+
+    @property
+    def client(self):
+        with self._lock:
+            if self._client is None:
+                os.makedirs(self.db_path, exist_ok=True)
+                self._client = chromadb.PersistentClient(path=self.db_path)
+            return self._client
+
+    @property
+    def embedding_fn(self):
+        with self._lock:
+            if self._embedding_fn is None:
+                self._embedding_fn = embedding_functions.DefaultEmbeddingFunction()
+            return self._embedding_fn
+
+    def collection(self, book_name: str):
+        """书籍对应的集合句柄（同一本书多次打开复用同一个句柄）"""
+        name = collection_name(book_name)
+        with self._lock:
+            handle = self._collections.get(name)
+            if handle is None:
+                print(f"[RAG] 书籍 '{book_name}' 对应向量库: {name}")
+                handle = self.client.get_or_create_collection(name=name, embedding_function=self.embedding_fn)
+                self._collections[name] = handle
+            return handle
+
+    def drop_collection(self, book_name: str) -> bool:
+        """删除书籍的集合（删除书籍时调用），集合不存在时返回 False"""
+        name = collection_name(book_name)
+        with self._lock:
+            self._collections.pop(name, None)
+            index_path = lexical_index_path(book_name, self.db_path)
+            for path in (index_path, index_path + "-wal", index_path + "-shm"):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            try:
+                self.client.delete_collection(name)
+                return True
+            except Exception as e:
+                print(f"[RAG] 删除向量库 {name} 失败: {e}")
+                return False
+
+    # ==================== 嵌入 ====================
+
+    def _embed_batch(self, texts: List[str]) -> List[List[float]]:
+        # 统一为 float32 精度的列表，与缓存读出的结果一致
+        return [array('f', vector).tolist() for vector in self.embedding_fn(texts)]
+
+    def _compute(self, texts: List[str]) -> List[List[float]]:
+        batches = [texts[i:i + EMBED_BATCH_SIZE] for i in range(0, len(texts), EMBED_BATCH_SIZE)]
+        futures = [self._executor.submit(self._embed_batch, batch) for batch in batches]
+        vectors = []
+        for future in futures:
+            vectors.extend(future.result())
+        with self._lock:
+            self._embed_calls += 1
+            self._embedded_texts += len(texts)
+        return vectors
+
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        """
+        计算文本向量：先查缓存，未命中的文本去重后在共享线程池中按批计算并写回缓存
+
+        Args:
+            texts: 文本列表
+
+        Returns:
+            与 texts 等长的向量列表
+        """
+        if not texts:
+            return []
+        vectors = [None] * len(texts)
+        if self.cache is not None:
+            try:
+                vectors = self.cache.get_many(texts)
+            except Exception as e:
+                print(f"[RAG] 嵌入缓存读取失败: {e}")
+        missing = list(dict.fromkeys(t for t, v in zip(texts, vectors) if v is None))
+        if missing:
+            computed = dict(zip(missing, self._compute(missing)))
+            if self.cache is not None:
+                try:
+                    self.cache.put_many(missing, [computed[t] for t in missing])
+                except Exception as e:
+                    print(f"[RAG] 嵌入缓存写入失败: {e}")
+            vectors = [v if v is not None else computed[t] for t, v in zip(texts, vectors)]
+        return vectors
+
+    # ==================== 统计 ====================
+
+    @staticmethod
+    def _rss_bytes() -> Optional[int]:
+        """当前进程常驻内存（Linux 读 /proc，其他平台退化为峰值，均不可用时为 None）"""
+        try:
+            with open("/proc/self/statm") as f:
+                return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+        except (OSError, ValueError, AttributeError):
+            pass
+        if resource is not None:
+            peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            return peak if sys.platform == "darwin" else peak * 1024
+        return None
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Returns:
+            {"collections", "model_loaded", "workers", "embed_calls", "embedded_texts", "rss_mb", "cache"}
+            其中 cache 为嵌入缓存的条目数与命中/未命中计数（未启用时为 None）
+        """
+        rss = self._rss_bytes()
+        with self._lock:
+            return {
+                "collections": len(self._collections),
+                "model_loaded": self._embedding_fn is not None,
+                "workers": self.workers,
+                "embed_calls": self._embed_calls,
+                "embedded_texts": self._embedded_texts,
+                "rss_mb": round(rss / (1024 * 1024), 1) if rss is not None else None,
+                "cache": self.cache.stats() if self.cache is not None else None
+            }
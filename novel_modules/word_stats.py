@@ -0,0 +1,95 @@
+"""
+章节字数统计缓存
+按章节持久化字数统计结果，用正文文件签名 (mtime + size) 校验是否过期，
+侧边栏、全书与分卷统计只需读取缓存，无需逐章读取正文重新计数
+"""
+
+import json
+import os
+import threading
+from typing import Optional, Dict, List, Any
+
+
+class ChapterStatsCache:
+    """章节字数统计缓存核心类"""
+
+    CACHE_VERSION = 1
+
+    def __init__(self, cache_file: str):
+        self.cache_file = cache_file
+        self._lock = threading.Lock()
+        self._dirty = False
+        self._load_data()
+
+    def _load_data(self):
+        """加载缓存数据，文件损坏或版本不符时视为空缓存"""
+        self.data = {"version": self.CACHE_VERSION, "chapters": {}}
+        if not os.path.exists(self.cache_file):
+            return
+        try:
+            with open(self.cache_file, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if data.get("version") == self.CACHE_VERSION and isinstance(data.get("chapters"), dict):
+                self.data = data
+        except (json.JSONDecodeError, IOError):
+            pass
+
+    def _save_data(self):
+        """保存缓存数据（先写临时文件再替换，避免写一半损坏）"""
+        tmp_file = self.cache_file + ".tmp"
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump(self.data, f, ensure_ascii=False)
+        os.replace(tmp_file, self.cache_file)
+        self._dirty = False
+
+    def get(self, chapter_id: Any, signature: Optional[List]) -> Optional[Dict]:
+        """
+        读取章节统计
+
+        Args:
+            chapter_id: 章节ID
+            signature: 正文当前签名，与缓存记录不一致即视为过期
+
+        Returns:
+            统计字典副本；未命中或已过期时返回 None
+        """
+        if signature is None:
+            return None
+        with self._lock:
+            entry = self.data["chapters"].get(str(chapter_id))
+            if not entry or entry.get("signature") != list(signature):
+                return None
+            return dict(entry["stats"])
+
+    def put(self, chapter_id: Any, signature: Optional[List], stats: Dict, persist: bool = True):
+        """
+        写入章节统计
+
+        Args:
+            chapter_id: 章节ID
+            signature: 写入时正文的签名
+            stats: count_words 的返回结果
+            persist: 是否立即落盘，批量回填时可置 False，最后统一 flush()
+        """
+        if signature is None:
+            return
+        with self._lock:
+            self.data["chapters"][str(chapter_id)] = {
+                "signature": list(signature),
+                "stats": dict(stats)
+            }
+            self._dirty = True
+            if persist:
+                self._save_data()
+
+    def remove(self, chapter_id: Any):
+        """删除章节统计"""
+        with self._lock:
+            if self.data["chapters"].pop(str(chapter_id), None) is not None:
+                self._save_data()
+
+    def flush(self):
+        """将未落盘的修改写入文件"""
+        with self._lock:
+            if self._dirty:
+                self._save_data()
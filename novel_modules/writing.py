@@ -5,7 +5,7 @@ import asyncio
 import uuid
 import time
 from datetime import datetime
-from .state import app_state, ui_refs, manager, memory, CFG
+from .state import app_state, ui_refs, manager, CFG
 from . import timeline
 
 last_backup_time = 0
@@ -29,6 +29,15 @@ def update_char_count():
         char_count_ref.set_text(f"字数: {stats['total_words']:,} (汉字{stats['chinese']:,})")
 
 
+def refresh_index_lag():
+    """显示后台索引队列的积压章节数（跟上时清空）"""
+    lag_ref = ui_refs.get('index_lag')
+    if lag_ref is None:
+        return
+    pending = app_state.pending_memory_updates()
+    lag_ref.set_text(f"索引落后 {pending} 章" if pending else "")
+
+
 def refresh_foreshadow_warning_ui():
     """刷新伏笔提醒 UI - 在写作时显示需要回收的伏笔"""
     container = ui_refs.get('foreshadow_warning_panel')
@@ -142,9 +151,8 @@ async def perform_auto_save():
     chapter['title'] = title
     chapter['outline'] = outline
 
-    # 写入磁盘（同时更新段落结构）
-    paragraphs = manager.text_to_paragraphs(content)
-    await run.io_bound(manager.save_chapter_paragraphs, chapter['id'], paragraphs)
+    # 写入磁盘（同时更新段落结构，沿用已有段落ID）
+    await run.io_bound(manager.save_chapter_text, chapter['id'], content)
     await run.io_bound(manager.save_structure, app_state.structure)
 
     # 记录写作进度（自动保存时也记录字数）
@@ -163,6 +171,9 @@ async def perform_auto_save():
                 ref.set_text('')
         ui.timer(3.0, clear_save_status, once=True)
 
+    # 到达备份间隔时触发后台增量备份
+    await run_auto_backup_check()
+
 async def run_auto_backup_check():
     global last_backup_time
 
@@ -174,10 +185,20 @@ async def run_auto_backup_check():
     now = time.time()
     
     if now - last_backup_time > interval_sec:
-        ui.notify('正在后台执行全项目备份...', type='info', position='bottom-right')
-        res = await run.io_bound(manager.create_project_backup)
         last_backup_time = now
-        ui.notify(res, type='positive', position='bottom-right')
+        # 增量备份在低优先级后台线程中进行，不阻塞自动保存
+        if not manager.start_project_backup():
+            return
+        ui.notify('正在后台执行增量备份...', type='info', position='bottom-right')
+
+        def check_backup_done():
+            status = manager.backup_status
+            if status.get('running'):
+                return
+            backup_timer.cancel()
+            ok = not status['message'].startswith('备份失败')
+            ui.notify(status['message'], type='positive' if ok else 'negative', position='bottom-right')
+        backup_timer = ui.timer(2.0, check_backup_done)
 
 # 处理文本变更
 def handle_text_change(e):
@@ -438,12 +459,18 @@ async def delete_volume_dialog():
                     for chap in chapters_to_delete:
                         chap['volume_id'] = default_vol_id
                     await run.io_bound(manager.save_structure, app_state.structure)
+                    # 向量库中这些章节的分卷元数据随之修正（不重新嵌入；向量库加载失败时跳过）
+                    mem = await app_state.wait_memory()
+                    if mem is not None:
+                        await run.io_bound(mem.sync_chapter_volumes, {c['id']: default_vol_id for c in chapters_to_delete})
                     ui.notify(f'{len(chapters_to_delete)} 个章节已移至默认分卷', type='info')
                 else:
                     # 删除该分卷中的所有章节
+                    mem = await app_state.wait_memory()
                     for chap in chapters_to_delete:
                         await run.io_bound(manager.delete_chapter, chap['id'])
-                        await run.io_bound(memory.delete_chapter_memory, chap['id'])
+                        if mem is not None:
+                            await run.io_bound(mem.delete_chapter_memory, chap['id'])
 
                     # 从结构中移除这些章节
                     app_state.structure = [c for c in app_state.structure if c['volume_id'] != vol_id]
@@ -514,7 +541,9 @@ async def delete_current_chapter():
         ui.label('注意：这是最后一个章节时也会被删除').classes('text-red text-sm')
         async def confirm():
             await run.io_bound(manager.delete_chapter, chap_id)
-            await run.io_bound(memory.delete_chapter_memory, chap_id)
+            mem = await app_state.wait_memory()
+            if mem is not None:
+                await run.io_bound(mem.delete_chapter_memory, chap_id)
             del app_state.structure[idx]
             await run.io_bound(manager.save_structure, app_state.structure)
 
@@ -685,9 +714,8 @@ async def save_current_chapter():
     print(f"[完整保存] 大纲长度: {len(chapter['outline'])}")
     print(f"[完整保存] 正文长度: {len(new_content)}")
 
-    # 保存内容（同时更新段落结构）
-    paragraphs = manager.text_to_paragraphs(new_content)
-    await run.io_bound(manager.save_chapter_paragraphs, chapter['id'], paragraphs)
+    # 保存内容（同时更新段落结构，沿用已有段落ID）
+    await run.io_bound(manager.save_chapter_text, chapter['id'], new_content)
     print("[完整保存] 章节内容和段落结构已写入磁盘")
 
     # 【新增】创建历史快照
@@ -697,8 +725,9 @@ async def save_current_chapter():
     await run.io_bound(manager.save_structure, app_state.structure)
     print("[完整保存] 目录结构已保存")
 
-    await run.io_bound(memory.add_chapter_memory, chapter['id'], new_content)
-    print("[完整保存] RAG记忆库已更新")
+    # 正文已落盘；向量库由后台索引队列更新（连续保存同一章只索引一次）
+    app_state.queue_memory_updates([chapter['id']])
+    print("[完整保存] 已登记后台索引")
 
     # 【新增】记录写作进度
     from novel_modules.goals import record_writing_progress
@@ -706,7 +735,7 @@ async def save_current_chapter():
     record_writing_progress(words=word_count, chapters=1, book_name=app_state.current_book_name)
     print(f"[完整保存] 写作进度已记录: {word_count} 字")
 
-    ui.notify('✅ 保存成功！记忆库已更新。', type='positive')
+    ui.notify('✅ 保存成功！记忆库将在后台更新。', type='positive')
     save_status_ref = ui_refs.get('save_status')
     if save_status_ref: save_status_ref.set_text("✅ 已完整保存")
 
@@ -722,6 +751,7 @@ async def save_current_chapter():
             global_sum = await run.io_bound(manager.update_global_summary)
             if "Error" not in global_sum:
                 print(f"[后台任务] 全书剧情总纲生成成功，长度: {len(global_sum)}")
+                await app_state.wait_entities()
                 app_state.settings['book_summary'] = global_sum
                 with client:
                     ui.notify('📚 全书剧情总纲已刷新', type='positive')
@@ -752,19 +782,29 @@ async def generate_content():
     if right_tabs_ref and tab_ctx_ref: right_tabs_ref.set_value(tab_ctx_ref)
     ui.notify(f'正在构建多维记忆...', type='info')
 
+    # 设定与向量库在切换书籍后于后台加载，此处才等待就绪
+    await app_state.wait_entities()
+    mem = await app_state.wait_memory()
+    if mem is None:
+        ui.notify('向量库加载失败，本次仅使用前情摘要', type='warning')
+
     # ---------------------------------------------------------
     # 2. 🧠 Vector RAG (向量检索)：找历史剧情片段
     # ---------------------------------------------------------
     query = f"{title} {outline}"
     if len(query) < 5: query = f"{title} {app_state.settings['world_view'][:50]}"
 
-    # 从 ChromaDB 检索相关切片
-    filtered_context, debug_info = await run.io_bound(manager.smart_rag_pipeline, query, chapter['id'], memory)
-
     # 从 JSON 设定集中获取相关人物 Bio
     context_text_for_chars = f"{title} {outline}"
     char_prompt_str, active_names = manager.get_relevant_context(context_text_for_chars)
 
+    # 从 ChromaDB 检索相关切片（大纲与出场实体名一次批量检索）
+    entity_queries = [name for name in active_names if name in context_text_for_chars]
+    # rag_volume_scope 开启时只检索本卷（长篇换地图、换主线后，前几卷的片段多为干扰）
+    volume_scope = chapter.get('volume_id') if CFG.get('rag_volume_scope') else None
+    filtered_context, debug_info = await run.io_bound(manager.smart_rag_pipeline, query, chapter['id'], mem,
+                                                      entity_queries, volume_scope)
+
     # ---------------------------------------------------------
     # 3. 🕸️ Graph RAG (图谱检索)：找逻辑关系
     # ---------------------------------------------------------
@@ -871,45 +911,15 @@ async def generate_content():
     print(f"[写作生成] 图谱上下文长度: {len(graph_context)}")
     print(f"[写作生成] RAG上下文长度: {len(filtered_context)}")
 
-    # 使用后台线程运行流式生成器
-    import queue
-    import threading
-
-    text_queue = queue.Queue()
-    stream_done = object()  # 结束标记
-
-    def run_stream():
-        try:
-            for chunk in backend.stream_call_llm(prompt, backend.get_prompt('writer_system'), task_type="writer"):
-                text_queue.put(chunk)
-        except Exception as e:
-            print(f"[写作生成] 流式调用异常: {str(e)}")
-            text_queue.put(f"Error: {str(e)}")
-        finally:
-            text_queue.put(stream_done)
-
-    # 启动后台线程
-    thread = threading.Thread(target=run_stream, daemon=True)
-    thread.start()
-
-    # 在主协程中消费队列并更新UI
-    while thread.is_alive() or not text_queue.empty():
-        try:
-            chunk = text_queue.get(timeout=0.05)
-            if chunk is stream_done:
-                break
-            if chunk.startswith("Error:"):
-                ui.notify(chunk, type='negative')
-                has_error = True
-                break
-            full_text += chunk
-            if content_ref:
-                content_ref.value = full_text
-            # 让出控制权，允许UI更新
-            await asyncio.sleep(0.01)
-        except queue.Empty:
-            await asyncio.sleep(0.01)
-            continue
+    # 原生异步流式生成：网络读取直接在事件循环中 await，不占用线程
+    async for chunk in backend.async_stream_call_llm(prompt, backend.get_prompt('writer_system'), task_type="writer"):
+        if chunk.startswith("Error:"):
+            ui.notify(chunk, type='negative')
+            has_error = True
+            break
+        full_text += chunk
+        if content_ref:
+            content_ref.value = full_text
 
     if not has_error:
         update_char_count()
@@ -934,11 +944,12 @@ async def open_history_dialog():
                     with ui.row().classes('w-full justify-between items-center'):
                         ui.label(f"📅 {snap['time']}").classes('font-mono font-bold text-blue-800')
                         
-                        async def restore(f=snap['filename']):
-                            # 读取文件内容
-                            def read_file():
-                                with open(f, 'r', encoding='utf-8') as file: return file.read()
-                            content = await run.io_bound(read_file)
+                        async def restore(snapshot_id=snap['id']):
+                            # 从快照库还原全文
+                            content = await run.io_bound(manager.read_chapter_snapshot, snapshot_id)
+                            if content is None:
+                                ui.notify('快照读取失败', type='negative')
+                                return
                             content_ref = ui_refs.get('editor_content')
                             if content_ref is not None:
                                 content_ref.value = content
@@ -954,10 +965,48 @@ async def open_history_dialog():
     dialog.open()
 
 async def export_novel():
-    ui.notify('正在打包全书...', spinner=True)
-    full_text = await run.io_bound(backend.export_full_novel, manager)
-    ui.download(full_text.encode('utf-8'), 'my_novel.txt')
-    ui.notify('下载已开始', type='positive')
+    from novel_modules.exporter import EXPORT_FORMATS, export_novel as run_export
+
+    selected = {fmt: fmt == 'txt' for fmt in EXPORT_FORMATS}
+    progress = {"done": 0, "total": 1, "message": ""}
+
+    with ui.dialog() as dialog, ui.card().classes('w-96'):
+        ui.label('📤 导出全书').classes('text-h6')
+        ui.label('逐章读取并同时写出所选格式，文件保存在项目的 exports 目录').classes('text-xs text-grey')
+        for fmt, (label, _) in EXPORT_FORMATS.items():
+            ui.checkbox(label, value=selected[fmt], on_change=lambda e, f=fmt: selected.__setitem__(f, e.value))
+        progress_bar = ui.linear_progress(value=0, show_value=False).classes('w-full')
+        progress_label = ui.label('').classes('text-sm text-grey-7')
+
+        def on_progress(done, total, message):
+            progress.update(done=done, total=max(total, 1), message=message)
+
+        def refresh_progress():
+            progress_bar.set_value(progress['done'] / progress['total'])
+            progress_label.set_text(f"{progress['message']} ({progress['done']}/{progress['total']})")
+
+        async def do_export():
+            formats = [f for f, v in selected.items() if v]
+            if not formats:
+                ui.notify('请至少选择一种格式', type='warning')
+                return
+            progress_timer = ui.timer(0.2, refresh_progress)
+            try:
+                result = await run.io_bound(run_export, manager, formats, None, on_progress)
+            finally:
+                progress_timer.cancel()
+            for path in result['files'].values():
+                ui.download(path)
+            if result['errors']:
+                ui.notify(f"部分格式导出失败: {', '.join(result['errors'])}", type='negative')
+            else:
+                ui.notify(f"导出完成：{result['chapters']} 章，{result['total_words']} 字", type='positive')
+            dialog.close()
+
+        with ui.row().classes('w-full justify-end'):
+            ui.button('取消', on_click=dialog.close).props('flat')
+            ui.button('开始导出', icon='download', on_click=do_export).props('color=primary')
+    dialog.open()
 
 async def open_rewrite_dialog():
     js_code = "var t = document.querySelector('.main-editor textarea'); return t ? [t.selectionStart, t.selectionEnd] : [0,0];"
@@ -981,40 +1030,14 @@ async def open_rewrite_dialog():
             new_text = ""
             has_error = False
 
-            import queue
-            import threading
-
-            text_queue = queue.Queue()
-            stream_done = object()
-
-            def run_stream():
-                try:
-                    for chunk in backend.stream_rewrite_llm(selected_text, pre, post, instruction.value):
-                        text_queue.put(chunk)
-                except Exception as e:
-                    text_queue.put(f"Error: {str(e)}")
-                finally:
-                    text_queue.put(stream_done)
-
-            thread = threading.Thread(target=run_stream, daemon=True)
-            thread.start()
-
-            while thread.is_alive() or not text_queue.empty():
-                try:
-                    chunk = text_queue.get(timeout=0.05)
-                    if chunk is stream_done:
-                        break
-                    if chunk.startswith("Error:"):
-                        ui.notify('失败: ' + chunk, type='negative')
-                        has_error = True
-                        break
-                    new_text += chunk
-                    if content_ref:
-                        content_ref.value = pre + new_text + post
-                    await asyncio.sleep(0.01)
-                except queue.Empty:
-                    await asyncio.sleep(0.01)
-                    continue
+            async for chunk in backend.async_stream_rewrite_llm(selected_text, pre, post, instruction.value):
+                if chunk.startswith("Error:"):
+                    ui.notify('失败: ' + chunk, type='negative')
+                    has_error = True
+                    break
+                new_text += chunk
+                if content_ref:
+                    content_ref.value = pre + new_text + post
 
             if not has_error:
                 update_char_count()
@@ -1036,6 +1059,7 @@ async def open_review_dialog():
     chapter_outline = chapter.get('outline', '') if chapter else ''
 
     # 准备上下文信息
+    await app_state.wait_entities()
     characters_info = ""
     for c in app_state.characters:
         characters_info += f"- {c['name']}({c['role']}/{c['status']}): {c['bio']}\n"
@@ -1092,10 +1116,8 @@ async def open_review_dialog():
             # 1. 转换为段落结构
             paragraphs = await run.io_bound(manager.load_chapter_paragraphs, chapter_id)
 
-            if not paragraphs:
-                paragraphs = manager.text_to_paragraphs(content)
-                if paragraphs:
-                    await run.io_bound(manager.save_chapter_paragraphs, chapter_id, paragraphs)
+            if not paragraphs and content:
+                paragraphs = await run.io_bound(manager.save_chapter_text, chapter_id, content)
 
             if not paragraphs:
                 status_label.set_text('无法解析内容')
@@ -1103,28 +1125,77 @@ async def open_review_dialog():
 
             status_label.set_text(f'共 {len(paragraphs)} 个段落，开始多维度审稿...')
 
-            # 2. 执行多维度审稿
+            # 2. 执行多维度审稿（分维度模式下各维度并发，完成一个显示一个）
             # 获取项目路径和当前章节号（用于伏笔保存）
             project_path = manager.project_root if hasattr(manager, 'project_root') else None
             current_chapter_num = chapter_id
 
-            result = await run.io_bound(
-                backend.sync_review_chapter_multi_dimension,
-                paragraphs,
-                context_info,
-                project_path,
-                current_chapter_num
-            )
-
-            # 3. 显示维度评分
+            dimension_slots = {}
             dimension_row.clear()
             with dimension_row:
-                dimension_scores = result.get('dimension_scores', {})
-                for dim, score in dimension_scores.items():
-                    color = 'green' if score >= 8 else ('orange' if score >= 6 else 'red')
-                    with ui.card().classes(f'flex-1 bg-{color}-50 p-2 text-center'):
+                for dim in backend.REVIEW_DIMENSIONS:
+                    dimension_slots[dim] = ui.card().classes('flex-1 bg-grey-1 p-2 text-center')
+                    with dimension_slots[dim]:
                         ui.label(dim).classes('font-bold')
+                        ui.spinner(size='md')
+
+            # 回调在工作线程中执行，只记录结果；由定时器在界面中刷新
+            finished = {}
+            shown = set()
+
+            def on_dimension(dim, dim_result):
+                finished[dim] = dim_result
+
+            def render_dimension(dim, dim_result):
+                score = dim_result.get('score', 0)
+                if isinstance(score, bool) or not isinstance(score, (int, float)):
+                    score = 0
+                color = 'green' if score >= 8 else ('orange' if score >= 6 else 'red')
+                slot = dimension_slots[dim]
+                slot.clear()
+                slot.classes(remove='bg-grey-1', add=f'bg-{color}-50')
+                with slot:
+                    ui.label(dim).classes('font-bold')
+                    if dim_result.get('failed'):
+                        ui.label('失败').classes('text-lg text-red-600').tooltip(dim_result.get('error', ''))
+                    elif dim_result.get('skipped'):
+                        ui.label('跳过').classes('text-lg text-grey-6')
+                    else:
                         ui.label(f'{score}/10').classes(f'text-2xl text-{color}-600')
+                        ui.label(f"{len(dim_result.get('issues', []))} 个问题").classes('text-xs text-grey-6')
+
+            def refresh_dimensions():
+                for dim in list(finished):
+                    if dim not in shown:
+                        shown.add(dim)
+                        try:
+                            render_dimension(dim, finished[dim])
+                        except Exception as e:
+                            # 单个维度的结果异常时只标记该卡片，不中断定时器
+                            print(f"[审稿] 维度 {dim} 渲染失败: {e}")
+                            slot = dimension_slots[dim]
+                            slot.clear()
+                            with slot:
+                                ui.label(dim).classes('font-bold')
+                                ui.label('结果异常').classes('text-lg text-red-600')
+                status_label.set_text(f'共 {len(paragraphs)} 个段落，审稿中... '
+                                      f'已完成 {len(shown)}/{len(backend.REVIEW_DIMENSIONS)} 个维度')
+
+            progress_timer = ui.timer(0.5, refresh_dimensions)
+            try:
+                result = await run.io_bound(
+                    backend.sync_review_chapter_by_mode,
+                    paragraphs,
+                    context_info,
+                    project_path,
+                    current_chapter_num,
+                    on_dimension
+                )
+            finally:
+                progress_timer.cancel()
+
+            # 3. 显示维度评分
+            refresh_dimensions()
 
             # 4. 显示结果
             result_container.clear()
@@ -1208,8 +1279,7 @@ async def open_review_dialog():
                             ui.label(f"用词水平: {style_analysis.get('vocabulary_level', '未知')}").classes('text-sm')
 
                 # 显示各维度问题
-                dimension_order = ['人设', '逻辑', '节奏', '情感', '叙事', '伏笔', '风格']
-                for dim in dimension_order:
+                for dim in backend.REVIEW_DIMENSIONS:
                     dim_issues = issues_by_dimension.get(dim, [])
                     if not dim_issues:
                         continue
@@ -1251,6 +1321,8 @@ async def open_review_dialog():
             await run.io_bound(manager.save_structure, app_state.structure)
 
             status_label.set_text(f'审稿完成！总分: {overall}/10 | 共 {len(result.get("issues", []))} 个问题')
+            if result.get('failed_dimensions'):
+                ui.notify(f"以下维度审稿失败，可稍后重试: {'、'.join(result['failed_dimensions'])}", type='warning')
 
             # 更新右侧面板
             review_panel_ref = ui_refs.get('review_panel')
@@ -1294,6 +1366,56 @@ async def open_review_dialog():
 
     await do_review()
 
+async def open_section_report_dialog():
+    """分段审稿报告 - 各部分并发审稿，报告随部分完成逐步刷新"""
+    content_ref = ui_refs.get('editor_content')
+    content = content_ref.value if content_ref is not None else ""
+    if not content or len(content) < 100:
+        ui.notify('正文太短，至少需要100字', type='warning')
+        return
+
+    await app_state.wait_entities()
+    ctx = f"【世界观】{app_state.settings.get('world_view', '')}\n"
+    for c in app_state.characters:
+        ctx += f"- {c['name']}: {c['status']}, {c['role']}\n"
+
+    progress = {"done": 0, "total": 1, "report": ""}
+
+    with ui.dialog() as dialog, ui.card().classes('w-[900px] max-h-[90vh]'):
+        ui.label('📋 分段审稿报告').classes('text-h6 mb-2')
+        progress_bar = ui.linear_progress(value=0, show_value=False).classes('w-full mb-2')
+        status_label = ui.label('正在分段审稿...').classes('text-sm text-grey-6 mb-2')
+        with ui.scroll_area().classes('w-full h-[60vh] border p-2'):
+            report_view = ui.markdown('').classes('prose max-w-none')
+        ui.button('关闭', on_click=dialog.close).props('flat')
+
+    dialog.open()
+
+    # 回调在工作线程中执行，只记录最新报告；由定时器在界面中刷新
+    def on_progress(done, total, report):
+        progress.update(done=done, total=max(total, 1), report=report)
+
+    def refresh_report():
+        progress_bar.set_value(progress['done'] / progress['total'])
+        if progress['report'] and report_view.content != progress['report']:
+            report_view.content = progress['report']
+            status_label.set_text(f"已完成 {progress['done']}/{progress['total']} 个部分")
+
+    progress_timer = ui.timer(0.5, refresh_report)
+    try:
+        result = await run.io_bound(backend.sync_review_full_chapter_with_sections, content, ctx, on_progress)
+    finally:
+        progress_timer.cancel()
+
+    if result.get('error'):
+        status_label.set_text(f"审稿失败: {result['error']}")
+        return
+    progress_bar.set_value(1)
+    report_view.content = result['markdown_report']
+    status_label.set_text(f"审稿完成 | 平均分 {result['avg_score']:.1f} | "
+                          f"问题 {result['total_issues']} 个（严重 {result['severe_issues']} 个）")
+
+
 async def open_section_rewrite_dialog():
     """
     基于段落结构的重绘 - 精确定位，安全修改
@@ -1318,8 +1440,7 @@ async def open_section_rewrite_dialog():
         content_ref = ui_refs.get('editor_content')
         content = content_ref.value if content_ref is not None else ""
         if content:
-            paragraphs = manager.text_to_paragraphs(content)
-            await run.io_bound(manager.save_chapter_paragraphs, chapter_id, paragraphs)
+            paragraphs = await run.io_bound(manager.save_chapter_text, chapter_id, content)
 
     if not paragraphs:
         ui.notify('无法解析内容', type='warning')
@@ -1330,6 +1451,7 @@ async def open_section_rewrite_dialog():
         return
 
     # 准备上下文
+    await app_state.wait_entities()
     ctx = f"【世界观】{app_state.settings.get('world_view', '')}\n"
     for c in app_state.characters:
         ctx += f"- {c['name']}: {c['status']}, {c['role']}\n"
@@ -1509,17 +1631,9 @@ async def open_section_rewrite_dialog():
                 progress_bar.set_value(completed / total)
                 await asyncio.sleep(0.05)
 
-            # 统一应用所有更新
+            # 统一应用所有更新（只追加被修改段落的操作日志）
             if updates:
-                for pid, new_text in updates.items():
-                    for i, p in enumerate(current_paragraphs):
-                        if p['id'] == pid:
-                            current_paragraphs[i]['text'] = new_text
-                            current_paragraphs[i]['word_count'] = backend.count_words(new_text)['total_words']
-                            break
-
-                # 一次性保存所有更新
-                await run.io_bound(manager.save_chapter_paragraphs, chapter_id, current_paragraphs)
+                current_paragraphs = await run.io_bound(manager.update_paragraphs, chapter_id, updates)
 
             # 更新编辑器内容（设置标志防止触发自动保存）
             global is_loading
@@ -1555,6 +1669,7 @@ async def open_state_audit_dialog():
     content = content_ref.value if content_ref is not None else ""
     if not content or len(content) < 50: ui.notify('正文太短', type='warning'); return
     ui.notify('正在审计世界状态...', spinner=True)
+    await app_state.wait_entities()
     summary = {
         "existing_chars": [c['name'] for c in app_state.characters],
         "existing_items": [i['name'] for i in app_state.items],
@@ -1627,10 +1742,13 @@ def create_writing_tab():
                     ui.button('重绘', on_click=open_rewrite_dialog).props('color=purple outline').tooltip('选中文字后重写')
                     ui.button('分段重绘', on_click=open_section_rewrite_dialog).props('color=deep-purple outline').tooltip('按审稿意见分段重写')
                     ui.button('审稿', on_click=open_review_dialog).props('color=orange outline')
+                    ui.button('分段报告', on_click=open_section_report_dialog).props('color=orange outline').tooltip('逐段审稿，报告随各部分完成逐步显示')
                     
                     with ui.column().classes('ml-4 gap-0'):
                         ui_refs['char_count'] = ui.label('字数: 0').classes('text-grey-7 text-xs')
                         ui_refs['save_status'] = ui.label('').classes('text-xs font-bold')
+                        ui_refs['index_lag'] = ui.label('').classes('text-xs text-grey-6')
+                        ui.timer(2.0, refresh_index_lag)
                 
                 ui_refs['editor_content'] = ui.textarea(label='正文') \
                     .classes('w-full h-full font-mono main-editor') \